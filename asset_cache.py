@@ -0,0 +1,52 @@
+import hashlib
+import importlib
+import os
+import sys
+import time
+
+import pyxel
+
+# 派生画像 (ディザ背景・反転スプライト・カード面など) を1枚のアトラスPNGに焼き込んでおくキャッシュ
+# ファイル名に元リソースとベイク処理のバージョンのハッシュを含めるので、どちらかが変われば自動的に作り直される
+# baked/ のアトラスはリポジトリに含める (ブラウザ版は書き込めないので、.pyxres と一緒に配信したものを読む)
+# 元リソースかベイク処理を変えたら python asset_cache.py で作り直してコミットする
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baked")
+
+def content_hash(source, version):
+    """元リソースの内容とベイク処理のバージョンからハッシュを計算する"""
+    with open(source, "rb") as f:
+        data = f.read()
+    return hashlib.sha1(data + version.encode()).hexdigest()[:12]
+
+def atlas_path(name, source, version):
+    return os.path.join(CACHE_DIR, f"{name}-{content_hash(source, version)}")
+
+def load_atlas(name, source, version, width, height, bake, rebuild=False):
+    """キャッシュ済みのアトラスを1回の読み込みで返す。無ければ元リソースを読み込んでベイクし、保存する"""
+    path = atlas_path(name, source, version)
+    atlas = pyxel.Image(width, height)
+    if not rebuild and os.path.exists(path + ".png"):
+        atlas.load(0, 0, path + ".png")
+        return atlas
+
+    pyxel.load(source)
+    bake(atlas)
+    # 読み込み専用の環境 (ブラウザ版など) やディスクがいっぱいのときは保存せず、ベイクしたアトラスをそのまま使う
+    # pyxel は保存に失敗すると OSError ではなく Exception を投げる
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        for old in os.listdir(CACHE_DIR):
+            if old.startswith(name + "-") and old.endswith(".png"):
+                os.remove(os.path.join(CACHE_DIR, old))
+        atlas.save(path, 1)
+    except Exception:
+        pass
+    return atlas
+
+if __name__ == "__main__":
+    # ビルドステップ: python asset_cache.py [game ...]
+    pyxel.init(256, 256, title="Bake assets")
+    for name in sys.argv[1:] or ["dogrun", "poker"]:
+        start = time.perf_counter()
+        importlib.import_module(name).load_atlas(rebuild=True)
+        print(f"baked {name} in {(time.perf_counter() - start) * 1000:.1f} ms")
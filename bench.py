@@ -0,0 +1,371 @@
+import argparse
+import atexit
+import contextlib
+import functools
+import importlib.util
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import pyxel
+
+import input_log
+import perf
+
+# 全ゲームのホットパスのベンチマーク
+# マイクロベンチマーク: 1回の呼び出しの時間 (乱数の種は固定)
+# マクロベンチマーク: ゲームを最初から最後まで描画なしで step で進める時間 (件数あたりの時間は1ティックあたり)
+# 結果は bench-<日時>.json に書き、ベースラインと比べて (最小値で) threshold を超えて遅くなったものを報告する
+#   python bench.py --save-baseline                # 現在の結果を bench-baseline.json に保存する
+#   python bench.py                                # ベースラインと比較し、遅くなったものがあれば終了コード 1
+#   python bench.py --filter reversi --threshold 0.2
+#   python bench.py --memory                       # 1回あたりのメモリの peak も測り、memory-budgets.json の予算を超えたら終了コード 1
+BASELINE_FILE = "bench-baseline.json"
+MIN_TIME = 0.05 # 1回の計測でこの秒数以上になるよう呼び出し回数を決める
+MACRO_SEEDS = range(3) # マクロベンチマークで遊ぶゲームの乱数の種
+
+def measure(func, setup=None, repeat=5, number=None):
+    """func を繰り返し呼び、1回あたりのマイクロ秒を計測ごとに返す。setup の戻り値を func に渡す
+    呼ぶたびに状態が変わるものは number を固定して、毎回同じ状態の列を計測する"""
+    if number is None:
+        state = setup() if setup else None
+        number = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(number):
+                func(state)
+            elapsed = time.perf_counter() - start
+            if elapsed >= MIN_TIME or number >= 1 << 20:
+                break
+            number *= max(2, min(10, int(MIN_TIME / max(elapsed, 1e-9)) + 1))
+    runs = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        for _ in range(number):
+            func(state)
+        runs.append((time.perf_counter() - start) / number * 1e6)
+    return runs
+
+def headless_game(module, class_name, game, seed=0):
+    """何も保存しない (入力の再生と同じ扱いの) ゲームのインスタンス"""
+    log = input_log.InputLog(game, seed)
+    log.replaying = True
+    return getattr(module, class_name)(standalone=False, replay=log)
+
+# --- Reversi ---
+
+def reversi_benchmarks():
+    import reversi
+    import reversi_engine
+    app = headless_game(reversi, "Reversi", "reversi")
+    app.step([("start", 0)])
+    # 序盤を固定の乱数で進めた中盤の局面
+    rng = random.Random(1)
+    game = reversi_engine.Game()
+    while len(game.moves) < 24 and not game.over:
+        r, c, _ = rng.choice(reversi_engine.valid_moves(game.board, game.current_player))
+        game.play(r, c)
+    board, player = [row[:] for row in game.board], game.current_player
+    def prepare(_=None):
+        app.board, app.current_player = [row[:] for row in board], player
+        app.flipping_stones, app.moves = [], bytearray()
+    prepare()
+    cells = [(r, c) for r in range(8) for c in range(8)]
+    def computer_move(_):
+        prepare() # 打った手を戻して毎回同じ局面で考えさせる
+        app._computer_move()
+    yield "reversi.is_valid_move", lambda _: [app.is_valid_move(r, c) for r, c in cells], None, 64, None
+    yield "reversi.has_valid_moves", lambda _: app.has_valid_moves(player), None, 1, None
+    yield "reversi._computer_move", computer_move, None, 1, None
+    # 人の手番で入力を待つ間の1フレーム (step と描き直しを省く)
+    waiting = headless_game(reversi, "Reversi", "reversi")
+    waiting.step([("start", 1)])
+    yield "reversi.idle_frame", lambda _: (waiting.update(), waiting.draw()), None, 1, None
+
+    # 大きな盤のビットボードエンジン (中盤の局面)
+    import reversi_bitboard
+    for size in (10, 12):
+        board, player = reversi_engine.new_board(size), reversi_engine.BLACK
+        for _ in range(size * 3):
+            r, c, _ = rng.choice(reversi_engine.valid_moves(board, player))
+            reversi_engine.apply_move(board, player, r, c)
+            player = -player
+        geo = reversi_bitboard.geometry(size)
+        own, opp = reversi_bitboard.to_bitboards(board, player)
+        yield f"reversi_bitboard.legal_moves[{size}]", lambda _, geo=geo, own=own, opp=opp: reversi_bitboard.legal_moves(geo, own, opp), None, 1, None
+        yield (f"reversi_bitboard.choose_move[{size}]",
+               lambda _, board=board, player=player: reversi_bitboard.choose_move(board, player, random.Random(0)), None, 1, None)
+
+    # MCTS (8x8 の中盤の局面から)。プレイアウト1回あたりの時間が分かるように回数で割る
+    import reversi_mcts
+    board, player = [row[:] for row in game.board], game.current_player
+    yield ("reversi_mcts.parallel_search[8]",
+           lambda _: reversi_mcts.parallel_search(board, player, random.Random(0), 200), None, 200, None)
+
+def reversi_game(seed):
+    """コンピュータ同士のデモを終局まで進める"""
+    import reversi
+    app = headless_game(reversi, "Reversi", "reversi", seed)
+    app.step([("start", 0)])
+    while app.game_state == reversi.GameState.PLAYING:
+        app.step([])
+    return app.ticks
+
+# --- Poker ---
+
+def poker_benchmarks():
+    import poker
+    rng = random.Random(2)
+    for variant, suffix in ((poker.Variant.STANDARD, ""), (poker.Variant.JOKER_POKER, "[joker]"),
+                            (poker.Variant.DEUCES_WILD, "[deuces]")):
+        hands = [poker.Hand(poker.Deck(rng, variant).deal(5), variant) for _ in range(1000)]
+        yield f"poker.Hand.evaluate_hand{suffix}", lambda _, hands=hands: [hand.evaluate_hand() for hand in hands], None, len(hands), None
+    yield "poker.Deck+deal", lambda _: poker.Deck(rng).deal(5), None, 1, None
+    waiting = headless_game(poker, "App", "poker")
+    waiting.step([("deal",)]) # 賭け金の入力待ち
+    yield "poker.idle_frame", lambda _: (waiting.update(), waiting.draw()), None, 1, None
+
+    # ハンド履歴の100万ハンドの集計 (集計には numpy が要る)
+    if importlib.util.find_spec("numpy") is None:
+        return
+    import poker_history
+    @functools.lru_cache(maxsize=None)
+    def million_hands():
+        # 書くのに数秒かかるので、計測するときに1回だけ作る
+        directory = tempfile.mkdtemp(prefix="bench-poker-history-")
+        atexit.register(shutil.rmtree, directory, True)
+        history = poker_history.HandHistory(directory)
+        hand_rng = random.Random(3)
+        hands = [([hand_rng.randrange(8, 64) for _ in range(5)], hand_rng.randrange(32), [0] * 5,
+                  hand_rng.randrange(11), 0, 10, hand_rng.choice((0, 10, 20))) for _ in range(100000)]
+        for _ in range(10):
+            history.extend(hands)
+        return history
+    def query(history):
+        columns = history.load(names=("held", "rank", "bet", "payout"))
+        poker_history.rtp_by_rank(columns)
+        poker_history.held_patterns(columns)
+    yield "poker_history.query[1M]", query, million_hands, 1, None
+
+def poker_game(seed, hands=200):
+    """配る -> 賭ける -> 交換しない -> 続ける、を hands 回繰り返す"""
+    import poker
+    app = headless_game(poker, "App", "poker", seed)
+    app.player.chips = 1 << 30
+    app.step([("deal",)])
+    for _ in range(hands):
+        app.step([("bet",)])
+        app.step([("toggle", 0), ("toggle", 2)])
+        app.step([("exchange",)])
+        app.step([]) # SHOWDOWN
+        app.step([("continue",)])
+    return app.ticks
+
+# --- 15 Puzzle ---
+
+def fifteen_benchmarks():
+    import fifteen_puzzle
+    app = headless_game(fifteen_puzzle, "App", "fifteen_puzzle")
+    tiles = [t for row in app.board for t in row]
+    yield "fifteen.get_inversion_count", lambda _: app.get_inversion_count(tiles), None, 1, None
+    yield "fifteen.check_clear", lambda _: app.check_clear(), None, 1, None
+    yield "fifteen.idle_frame", lambda _: (app.update(), app.draw()), None, 1, None
+
+def fifteen_game(seed):
+    """重み付き A* の手順どおりにタイルを動かしてクリアする"""
+    import fifteen_puzzle
+    import fifteen_solver
+    app = headless_game(fifteen_puzzle, "App", "fifteen_puzzle", seed)
+    moves, _ = fifteen_solver.solve_bounded(app.board_tuple())
+    for move in moves:
+        ty, tx = divmod(move, fifteen_puzzle.BOARD_SIZE)
+        app.step([("slide", tx, ty)])
+    assert app.is_cleared
+    return app.ticks
+
+# --- Dog Run ---
+
+def populated_world(dogs, seed=3, indexed=True):
+    """indexed を偽にすると犬を空間インデックスに入れない (Dog.update だけを呼ぶベンチマーク用。
+    インデックスは spawn したときの位置を持ったままになり、その float が残って1回目の計測に乗る)"""
+    import dogrun
+    world = dogrun.World(seed=seed, max_dogs=dogs, max_bones=max(3, dogs // 10))
+    for _ in range(dogs):
+        if indexed:
+            world.spawn_dog(False)
+        else:
+            world.dogs.append(world.dog_pool.acquire().spawn(False))
+    return world
+
+def dogrun_benchmarks():
+    import dogrun
+    def update_all(world):
+        for dog in world.dogs:
+            dog.update(dogrun.DT)
+    def collide(world):
+        # 衝突した組はクールダウン中は調べないので、毎回同じ組を調べるように戻す
+        for dog in world.dogs:
+            dog.collision_cooldown = 0
+        world.collide_dogs()
+    def scheduled(world):
+        world.update_dogs(world.scheduler.select(world.dogs, world.tick, world.dog_index))
+        world.tick += 1
+    def with_bones(dogs):
+        world = populated_world(dogs)
+        for dog in world.dogs:
+            dog.update(dogrun.DT) # 画面上の位置を決める
+        while len(world.bones) < world.max_bones:
+            world.click(world.rng.uniform(0, world.width), world.rng.uniform(world.HORIZON_Y, world.height))
+        return world
+    for n in (10, 100, 1000):
+        # 犬は走る -> 座る -> 寝る と状態が変わって処理の重さも変わるので、毎回新しいワールドで同じ 300 ティックを計る
+        yield f"dogrun.Dog.update[{n}]", update_all, lambda n=n: populated_world(n, indexed=False), n, 300
+        yield f"dogrun.scheduled_update[{n}]", scheduled, lambda n=n: populated_world(n), n, 300
+        yield f"dogrun.collide_dogs[{n}]", collide, lambda n=n: populated_world(n), 1, None
+        yield f"dogrun.steer_dogs[{n}]", lambda world: world.steer_dogs(), lambda n=n: with_bones(n), n, None
+        # 1ステップ全体 (犬の当たり判定・向き・更新・骨の当たり判定)。DOG_STEP_BUDGET で上限が決まる
+        yield f"dogrun.World.step[{n}]", lambda world: world.step(), lambda n=n: with_bones(n), 1, 60
+
+def dogrun_game(seed, ticks=20000):
+    import dogrun
+    world = dogrun.World(seed=seed)
+    world.fast_forward(ticks, bone_interval=45)
+    return ticks
+
+MICRO = [reversi_benchmarks, poker_benchmarks, fifteen_benchmarks, dogrun_benchmarks]
+MACRO = [("reversi.game", reversi_game), ("poker.game", poker_game),
+         ("fifteen.game", fifteen_game), ("dogrun.game", dogrun_game)]
+
+def run(name_filter="", repeat=5, memory=False):
+    """memory を真にすると、時間の計測の後に tracemalloc で1回あたりのメモリも測る (時間には影響しない)"""
+    if memory:
+        import memtrack
+    results = {}
+    perf.profiler.enabled = False # @perf.timed の計測自体の時間を含めない
+    for suite in MICRO:
+        for name, func, setup, calls, number in suite():
+            if name_filter not in name:
+                continue
+            runs = measure(func, setup, repeat, number)
+            results[name] = summarize(runs, calls)
+            report(name, results[name])
+            if memory:
+                results[name]["memory"] = memtrack.measure_call(func, setup() if setup else None)
+    for name, game in MACRO:
+        if name_filter not in name:
+            continue
+        runs = []
+        for _ in range(repeat):
+            # 毎回同じ種の組を通しで遊ぶ (種によって長さが違うので、回ごとに種を変えると比較できない)
+            with contextlib.redirect_stdout(io.StringIO()): # ポーカーのログ出力を捨てる
+                start = time.perf_counter()
+                ticks = sum(game(seed) for seed in MACRO_SEEDS)
+                runs.append((time.perf_counter() - start) * 1e6)
+        results[name] = summarize(runs, ticks)
+        results[name]["ticks"] = ticks
+        report(name, results[name])
+        if memory:
+            # 1ゲーム分だけ (tracemalloc を動かすと遅いので最初の種だけ)
+            with contextlib.redirect_stdout(io.StringIO()):
+                results[name]["memory"] = memtrack.measure_call(lambda _: game(MACRO_SEEDS[0]), repeat=1, warmup=False)
+    perf.profiler.enabled = True
+    return results
+
+def summarize(runs, calls):
+    """calls は1回の呼び出しで処理する件数 (件数あたりの時間も出す)"""
+    median = statistics.median(runs)
+    return {"median_us": median, "min_us": min(runs), "per_item_us": median / calls, "runs": len(runs)}
+
+def report(name, result):
+    print(f"{name:<32}{result['median_us']:12.2f}us  (min {result['min_us']:.2f}, per item {result['per_item_us']:.3f})",
+          flush=True)
+
+def compare(results, baseline, threshold):
+    """最小値が baseline より threshold (割合) を超えて遅くなったベンチマーク名のリストを返す
+    (他のプロセスの影響は遅くなる方にしか出ないので、中央値より最小値の方が安定する)"""
+    regressions = []
+    print(f"\n{'benchmark':<32}{'baseline':>12}{'now':>12}{'change':>9}")
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            print(f"{name:<32}{'-':>12}{result['min_us']:12.2f}{'new':>9}")
+            continue
+        change = (result["min_us"] - old["min_us"]) / old["min_us"]
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<32}{old['min_us']:12.2f}{result['min_us']:12.2f}{change * 100:+8.1f}%{flag}")
+    return regressions
+
+def check_memory(results, budgets):
+    """1回あたりの peak が予算 (KiB) を超えたベンチマーク名のリストを返す"""
+    over = []
+    print(f"\n{'benchmark':<32}{'peak KiB':>12}{'net KiB':>12}{'budget':>9}  subsystems (KiB retained)")
+    for name, result in results.items():
+        memory = result.get("memory")
+        if memory is None:
+            continue
+        budget = budgets.get(name)
+        flag = ""
+        if budget is not None and memory["peak_kib"] > budget:
+            over.append(name)
+            flag = "  OVER BUDGET"
+        subsystems = " ".join(f"{key}={value:+.1f}" for key, value in memory["subsystems_kib"].items())
+        print(f"{name:<32}{memory['peak_kib']:12.1f}{memory['net_kib']:12.1f}{'-' if budget is None else budget:>9}"
+              f"  {subsystems}{flag}")
+    return over
+
+def write(path, results):
+    report = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "pyxel": getattr(pyxel, "VERSION", ""),
+        "benchmarks": results,
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the games' hot paths")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to the baseline file")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown before flagging (0.10 = 10%%)")
+    parser.add_argument("--out", default=None, help="results JSON (default bench-<time>.json)")
+    parser.add_argument("--memory", action="store_true", help="also measure memory per call and check the budgets")
+    parser.add_argument("--memory-budgets", default=None, help="budgets JSON (default memory-budgets.json)")
+    args = parser.parse_args()
+    os.environ.setdefault("SDL_VIDEODRIVER", "offscreen")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    pyxel.init(256, 256, title="bench") # pyxel.init はこのファイルのディレクトリに移動する (リソースの読み込み用)
+    results = run(args.filter, args.repeat, args.memory)
+    out = args.out or f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    write(out, results)
+    print(f"wrote {out}")
+    failed = False
+    if args.memory:
+        import memtrack
+        over = check_memory(results, memtrack.load_budgets(args.memory_budgets or memtrack.BUDGETS_FILE))
+        if over:
+            print(f"{len(over)} benchmark(s) over their memory budget: {', '.join(over)}")
+            failed = True
+    if args.save_baseline:
+        write(args.baseline, results)
+        print(f"wrote {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)["benchmarks"], args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold * 100:.0f}%: {', '.join(regressions)}")
+            failed = True
+    if failed:
+        sys.exit(1)
@@ -1,13 +1,54 @@
+import functools
+import operator
 import pyxel
 import random
+import sys
+import time
+
+import asset_cache
+import input_log
+import perf
+
+SCREEN_WIDTH, SCREEN_HEIGHT = 159, 254
+HORIZON_Y = 95
+
+# --- Simulation timing ---
+# The world advances in fixed steps independent of the render frame rate.
+SIM_HZ = 30
+DT = 1.0 / SIM_HZ
+MAX_STEPS_PER_FRAME = 5 # Avoid the spiral of death after a long hitch
+
+DOG_Z_SPEED = 0.15 # depth units per second (was 0.005 per frame at 30fps)
+DOG_X_SPEED = 15.0 # pixels per second (was 0.5 per frame at 30fps)
+SIGHT_RADIUS = 40 # 走っている犬はこの距離 (ピクセル) 以内で一番近い骨に向かう
+BONE_CELL = SIGHT_RADIUS // 2 # 骨の空間インデックスのセルの大きさ (ピクセル)
+LINEAR_MAX_BONES = 16 # 骨がこれ以下なら、空間インデックスのセルを調べるより全部の骨を調べる方が速い
+LINEAR_MAX_DOGS = 32  # 犬がこれ以下なら、犬同士の当たり判定は空間インデックスを使わずに全部の犬を調べる
+# 犬同士の衝突判定の空間インデックスのセル (衝突する距離 x: 16px 未満, z: 0.05 未満 と同じ大きさ)
+DOG_CELL_X, DOG_CELL_Z = 16, 0.05
+# 犬の更新の間引き (UpdateScheduler)
+FAR_Z = 0.33          # これより奥 (8px で描く) の走っている犬は FAR_INTERVAL ティックおきに更新する
+FAR_INTERVAL = 4
+IDLE_INTERVAL = 8     # 座っている・寝ている犬は IDLE_INTERVAL ティックおきに更新する
+# 1ステップの犬の処理の予算 (犬同士の当たり判定1組を 1 とした作業量)。選ばれた犬だけが骨への向きの決定・
+# Dog.update・骨との当たり判定・次のステップの犬同士の当たり判定を行う。1匹の作業量は DOG_STEP_COST と
+# 当たり判定で調べる近くの犬の数の和。超えた分は次のステップに回す
+DOG_STEP_COST = 16
+DOG_STEP_BUDGET = 12000
 
 class Dog:
-    def __init__(self, app_instance, start_at_horizon=True):
-        self.app = app_instance
-        self.x = random.uniform(0, pyxel.width)
+    __slots__ = ('world', 'x', 'z', 'prev_x', 'prev_z', 'off_screen', 'screen_y', 'size', 'state', 'state_timer',
+                 'collision_cooldown', 'movement_mode', 'direction_x', 'direction_z', 'facing_direction', 'horizontal_speed',
+                 'seek', 'seek_key', 'updated_tick', 'lod_ticks')
+
+    def __init__(self, world):
+        self.world = world
+
+    def spawn(self, start_at_horizon=True):
+        """プールから取り出した犬を初期状態に戻す"""
+        rng = self.world.rng
+        self.x = rng.uniform(0, self.world.width)
         self.off_screen = False
-        self.screen_y = 0
-        self.size = 0
 
         self.state = 'running'
         self.state_timer = self.get_new_timer()
@@ -15,150 +56,507 @@ class Dog:
 
         if start_at_horizon:
             self.z = 0.0
-            self.movement_mode = random.randint(0, 1)
+            self.movement_mode = rng.randint(0, 1)
         else:
-            self.z = random.uniform(0.8, 1.0)
-            self.movement_mode = random.randint(2, 3)
+            self.z = rng.uniform(0.8, 1.0)
+            self.movement_mode = rng.randint(2, 3)
+        self.prev_x, self.prev_z = self.x, self.z
+        # 最初の更新は FAR_INTERVAL ティック後になることがあるので、それまでもクリックや当たり判定に使える大きさにしておく
+        self.size = size_for_z(self.z)
+        self.screen_y = self.world.screen_y_for(self.z, self.size)
 
         self.direction_x, self.direction_z = 0, 0
         self.facing_direction = 1
-        self.horizontal_speed = 0.5
+        self.horizontal_speed = DOG_X_SPEED
+        self.seek = None # 向かっている骨 (World.steer_dogs が毎ステップ決める)
+        self.seek_key = None # seek を空間インデックスで探したときの (骨の増減の回数, 犬のいた骨のセル)
+        self.updated_tick = self.world.tick # 最後に更新したステップ
+        self.lod_ticks = 1 # 最後の更新でまとめて進めたティック数
+        return self
 
-    def get_new_timer(self): return random.randint(180, 360)
+    def get_new_timer(self): return self.world.rng.randint(180, 360)
     def change_direction(self):
         self.movement_mode = (self.movement_mode + 1) % 4
         if self.state != 'running':
             self.start_running()
-    def start_running(self): self.state = 'running'; self.state_timer = self.get_new_timer()
+    def start_running(self):
+        if self.state != 'running':
+            # 止まっていた間に間引かれたティックは、走った時間として進めない
+            self.updated_tick = max(self.updated_tick, self.world.tick - 1)
+        self.state = 'running'; self.state_timer = self.get_new_timer()
 
-    def update(self):
-        if self.collision_cooldown > 0: self.collision_cooldown -= 1
-        if self.state != 'lying_down': self.state_timer -= 1
+    def update(self, dt, ticks=1):
+        """ticks ティック分をまとめて進める (遠くの犬や止まっている犬は UpdateScheduler が何ティックかおきに呼ぶ)
+        ticks=1 なら1ティックずつ進めたときと同じ結果になる"""
+        self.prev_x, self.prev_z = self.x, self.z
+        # 最初の更新は FAR_INTERVAL ティック後になることがあるので、それまでもクリックや当たり判定に使える大きさにしておく
+        self.size = size_for_z(self.z)
+        self.screen_y = self.world.screen_y_for(self.z, self.size)
+        self.lod_ticks = ticks
+        if self.collision_cooldown > 0:
+            self.collision_cooldown -= ticks
+            if self.collision_cooldown < 0: self.collision_cooldown = 0
+        if self.state == 'running':
+            moving = ticks if ticks < self.state_timer else self.state_timer - 1 # タイマーが切れるティックには座るので動かない
+            if moving > 0:
+                if self.seek is not None:
+                    # 骨の中心に向かう (近づいた軸はそれ以上動かない)
+                    dx = self.seek.x + BONE_W / 2 - self.x
+                    dy = self.seek.y + BONE_H / 2 - (self.screen_y + self.size / 2)
+                    self.direction_x = (dx > 1) - (dx < -1)
+                    self.direction_z = (dy > 1) - (dy < -1)
+                elif self.movement_mode == 0: self.direction_x, self.direction_z = -1, 1
+                elif self.movement_mode == 1: self.direction_x, self.direction_z = 1, 1
+                elif self.movement_mode == 2: self.direction_x, self.direction_z = 1, -1
+                elif self.movement_mode == 3: self.direction_x, self.direction_z = -1, -1
+                self.z += DOG_Z_SPEED * dt * moving * self.direction_z
+                self.x += self.horizontal_speed * dt * moving * self.direction_x
+                if self.direction_x: self.facing_direction = self.direction_x
+        if self.state != 'lying_down': self.state_timer -= ticks
         if self.state_timer <= 0:
-            if self.state == 'running': self.state = 'sitting'; self.facing_direction = random.choice([-1, 1]); self.state_timer = self.get_new_timer()
+            # 切れた後のティックの分は次の状態のタイマーから引く
+            if self.state == 'running': self.state = 'sitting'; self.facing_direction = self.world.rng.choice([-1, 1]); self.state_timer += self.get_new_timer()
             elif self.state == 'sitting': self.state = 'lying_down'
-        if self.state == 'running':
-            if self.movement_mode == 0: self.direction_x, self.direction_z = -1, 1
-            elif self.movement_mode == 1: self.direction_x, self.direction_z = 1, 1
-            elif self.movement_mode == 2: self.direction_x, self.direction_z = 1, -1
-            elif self.movement_mode == 3: self.direction_x, self.direction_z = -1, -1
-            self.z += 0.005 * self.direction_z
-            self.x += self.horizontal_speed * self.direction_x
-            self.facing_direction = 1 if self.direction_x >= 0 else -1
-        else: self.direction_x = 0
-        if self.z < 0.33: self.size = 8
-        elif self.z < 0.66: self.size = 12
-        else: self.size = 16
-        self.screen_y = self.app.HORIZON_Y + (self.z * (pyxel.height - self.app.HORIZON_Y - self.size))
-        if self.x < -self.size or self.x > pyxel.width + self.size or self.z < 0 or self.z > 1: self.off_screen = True
+        if self.state != 'running': self.direction_x = 0
+        self.size = size_for_z(self.z)
+        self.screen_y = self.world.screen_y_for(self.z, self.size)
+        if self.x < -self.size or self.x > self.world.width + self.size or self.z < 0 or self.z > 1: self.off_screen = True
 
-    def draw(self):
+    def render(self, queue, alpha, tick):
+        # Interpolate between the last two simulation steps for smooth motion
+        # 間引いて更新した犬は、まとめて進めた lod_ticks ティックをかけて前の位置から動かす (その分だけ遅れて見える)
+        # 直前のティックに1ティック分進めた犬なら t は alpha。更新が後回しにされた犬は次の更新まで今の位置に止まる
+        t = min(1.0, (tick - 1 - self.updated_tick + alpha) / self.lod_ticks)
+        x = self.prev_x + (self.x - self.prev_x) * t
+        z = self.prev_z + (self.z - self.prev_z) * t
+        size = size_for_z(z)
         if self.state == 'running':
-            if self.z < 0.33: y_base = 32
-            elif self.z < 0.66: y_base = 16
+            if z < 0.33: y_base = 32
+            elif z < 0.66: y_base = 16
             else: y_base = 0
-            run_anim_frame = (pyxel.frame_count // 8) % 2
+            run_anim_frame = (tick // 8) % 2
             sprite_x = (run_anim_frame * 16) if self.direction_z >= 0 else (32 + run_anim_frame * 16)
         else:
-            if self.z < 0.33: y_base = 80
-            elif self.z < 0.66: y_base = 64
+            if z < 0.33: y_base = 80
+            elif z < 0.66: y_base = 64
             else: y_base = 48
-            anim_frame = (pyxel.frame_count // 20) % 2
+            anim_frame = (tick // 20) % 2
             sprite_x = anim_frame * 16 if self.state == 'sitting' else 32 + (anim_frame * 16)
-        w = self.size * self.facing_direction
-        pyxel.blt(self.x - self.size / 2, self.screen_y, 0, sprite_x, y_base, w, self.size, 0)
+        if self.facing_direction < 0:
+            sprite_x = FLIPPED_DOGS_U + DOG_SHEET_W - sprite_x - size # pre-flipped copy in the atlas
+        queue.push(z, x - size / 2, self.world.screen_y_for(z, size), sprite_x, y_base, size, size)
+
+def size_for_z(z):
+    if z < 0.33: return 8
+    elif z < 0.66: return 12
+    return 16
+
+def z_for_ground_y(y, horizon_y, height):
+    """足元 (screen_y + size) が y になる犬の z (screen_y_for の逆)。大きさが切り替わる境目の隙間は境目の z にする"""
+    z_min = float("-inf")
+    for size, z_max in ((8, 0.33), (12, 0.66), (16, float("inf"))):
+        z = (y - horizon_y - size) / (height - horizon_y - size)
+        if z < z_max:
+            return max(z, z_min)
+        z_min = z_max
+
+# --- Baked atlas layout ---
+# Dog sprite sheet copied from image bank 0, its mirrored copy, the bone and the dithered background
+DOG_SHEET_W, DOG_SHEET_H = 64, 96
+FLIPPED_DOGS_U = 64
+BONE_U, BONE_V, BONE_W, BONE_H = 128, 0, 5, 3
+BACKGROUND_V = DOG_SHEET_H
+ATLAS_W, ATLAS_H = 256, BACKGROUND_V + SCREEN_HEIGHT
+ATLAS_VERSION = "dogrun-1"
+
+def bake_dithered_background(img, y0):
+    sky_base_color, sky_dither_color = 12, 7
+    ground_base_color, ground_dither_color = 3, 11
+    img.rect(0, y0, SCREEN_WIDTH, HORIZON_Y, sky_base_color)
+    img.rect(0, y0 + HORIZON_Y, SCREEN_WIDTH, SCREEN_HEIGHT - HORIZON_Y, ground_base_color)
+    num_grads, grad_height = 10, 3
+    for i in range(num_grads):
+        alpha = 1.0 - (i / num_grads)
+        img.dither(alpha)
+        img.rect(0, y0 + HORIZON_Y + i * grad_height, SCREEN_WIDTH, grad_height, ground_dither_color)
+        img.rect(0, y0 + HORIZON_Y - (i + 1) * grad_height, SCREEN_WIDTH, grad_height, sky_dither_color)
+    img.dither(1.0)
+
+def bake_bone(img):
+    img.rect(BONE_U, BONE_V, BONE_W, BONE_H, 0)
+    # 骨の形 (横5ピクセル、縦3ピクセル、白ドット)
+    # 四隅
+    img.pset(BONE_U, BONE_V, 7)
+    img.pset(BONE_U + 4, BONE_V, 7)
+    img.pset(BONE_U, BONE_V + 2, 7)
+    img.pset(BONE_U + 4, BONE_V + 2, 7)
+    # 真ん中3つ
+    img.pset(BONE_U + 1, BONE_V + 1, 7)
+    img.pset(BONE_U + 2, BONE_V + 1, 7)
+    img.pset(BONE_U + 3, BONE_V + 1, 7)
+
+def bake_atlas(img):
+    img.blt(0, 0, 0, 0, 0, DOG_SHEET_W, DOG_SHEET_H)
+    img.blt(FLIPPED_DOGS_U, 0, 0, 0, 0, -DOG_SHEET_W, DOG_SHEET_H)
+    bake_bone(img)
+    bake_dithered_background(img, BACKGROUND_V)
+
+def load_atlas(rebuild=False):
+    return asset_cache.load_atlas("dogrun", "dogrun.pyxres", ATLAS_VERSION, ATLAS_W, ATLAS_H, bake_atlas, rebuild)
 
 class Bone:
-    def __init__(self, x, y):
+    __slots__ = ('x', 'y', 'is_active')
+
+    def spawn(self, x, y):
         self.x = x
         self.y = y
         self.is_active = True
+        return self
 
-    def draw(self):
+    def render(self, queue):
         if not self.is_active:
             return
+        # 骨の下端 (地面に接する線) と犬の足元が同じ高さになる z を求めて、犬と同じ深度順で描画する
+        z = z_for_ground_y(self.y + BONE_H, queue.horizon_y, pyxel.height)
+        queue.push(z, self.x, self.y, BONE_U, BONE_V, BONE_W, BONE_H)
 
-        # 骨の形 (横5ピクセル、縦3ピクセル、白ドット)
-        # 四隅
-        pyxel.pset(self.x, self.y, 7)
-        pyxel.pset(self.x + 4, self.y, 7)
-        pyxel.pset(self.x, self.y + 2, 7)
-        pyxel.pset(self.x + 4, self.y + 2, 7)
-        # 真ん中3つ
-        pyxel.pset(self.x + 1, self.y + 1, 7)
-        pyxel.pset(self.x + 2, self.y + 1, 7)
-        pyxel.pset(self.x + 3, self.y + 1, 7)
+class RenderQueue:
+    """Buckets visible sprites by size tier, culls off-screen ones and draws them in one sorted blt pass."""
+    def __init__(self, image, horizon_y):
+        self.image = image
+        self.horizon_y = horizon_y
+        self.buckets = [[] for _ in range(3)] # 8px, 12px, 16px tiers (far -> near)
+        self.draw_calls = 0
+        self.culled = 0
 
-class App:
-    def __init__(self):
-        pyxel.init(159, 254, title="Dog Run 3D")
-        pyxel.load("dogrun.pyxres")
-        pyxel.mouse(False)
-        self.HORIZON_Y = 95
+    def push(self, z, x, y, u, v, w, h):
+        if x + abs(w) <= 0 or x >= pyxel.width or y + h <= 0 or y >= pyxel.height:
+            self.culled += 1
+            return
+        tier = 0 if z < 0.33 else (1 if z < 0.66 else 2)
+        self.buckets[tier].append((z, x, y, u, v, w, h))
+
+    def flush(self):
+        image = self.image
+        for bucket in self.buckets:
+            bucket.sort(key=lambda sprite: sprite[0])
+            for _, x, y, u, v, w, h in bucket:
+                pyxel.blt(x, y, image, u, v, w, h, 0)
+            self.draw_calls += len(bucket)
+            bucket.clear()
+
+    def reset_stats(self):
+        self.draw_calls = self.culled = 0
+
+class Pool:
+    """Free list of reusable entities. `allocations` counts objects the pool had to create."""
+    __slots__ = ('factory', 'free', 'allocations')
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.free = []
+        self.allocations = 0
+
+    def acquire(self):
+        if self.free:
+            return self.free.pop()
+        self.allocations += 1
+        return self.factory()
+
+    def release(self, obj):
+        self.free.append(obj)
+
+class SpatialGrid:
+    """Uniform grid over (x, y). Entities are inserted and removed one at a time, so the index
+    follows spawns and removals without being rebuilt."""
+    __slots__ = ('cell_w', 'cell_h', 'cells', 'where')
+
+    def __init__(self, cell_w, cell_h):
+        self.cell_w, self.cell_h = cell_w, cell_h
+        self.cells = {}  # (cx, cy) -> {entity: (x, y)} (dict keeps insertion order, so queries are deterministic)
+        self.where = {}  # entity -> (cx, cy)
+
+    def __len__(self):
+        return len(self.where)
+
+    def key(self, x, y):
+        return int(x // self.cell_w), int(y // self.cell_h)
+
+    def insert(self, item, x, y):
+        key = self.key(x, y)
+        self.cells.setdefault(key, {})[item] = (x, y)
+        self.where[item] = key
+
+    def move(self, item, x, y):
+        """item の位置を (x, y) に変える。セルが変わらなければ入れ直さない"""
+        key = self.key(x, y)
+        if self.where.get(item) == key:
+            self.cells[key][item] = (x, y)
+        else:
+            self.remove(item)
+            self.insert(item, x, y)
+
+    def remove(self, item):
+        key = self.where.pop(item, None)
+        if key is not None:
+            cell = self.cells[key]
+            del cell[item]
+            if not cell:
+                del self.cells[key]
+
+    def clear(self):
+        self.cells.clear()
+        self.where.clear()
+
+    def crowd(self, x, y):
+        """near(x, y) が返すエンティティの数"""
+        cx, cy = self.key(x, y)
+        cells = self.cells
+        return sum(len(cells.get((kx, ky), ())) for kx in (cx - 1, cx, cx + 1) for ky in (cy - 1, cy, cy + 1))
+
+    def near(self, x, y):
+        """(x, y) のセルと隣の8セルにいるエンティティ"""
+        cx, cy = self.key(x, y)
+        cells = self.cells
+        for kx in (cx - 1, cx, cx + 1):
+            for ky in (cy - 1, cy, cy + 1):
+                cell = cells.get((kx, ky))
+                if cell:
+                    yield from cell
+
+    def nearest(self, x, y, radius, k=1, accept=None):
+        """(x, y) から radius 以内の近い順に最大 k 個の (距離の2乗, エンティティ)
+        セルを内側の輪から順に調べ、次の輪のどこよりも近いものが k 個見つかったらやめる"""
+        cx, cy = self.key(x, y)
+        cells = self.cells
+        found = []
+        limit = radius * radius
+        step = min(self.cell_w, self.cell_h)
+        for ring in range(int(radius // step) + 2):
+            for dx, dy in ring_offsets(ring):
+                cell = cells.get((cx + dx, cy + dy))
+                if not cell:
+                    continue
+                for item, (ix, iy) in cell.items():
+                    d2 = (ix - x) * (ix - x) + (iy - y) * (iy - y)
+                    if d2 <= limit and (accept is None or accept(item)):
+                        found.append((d2, item))
+            if len(found) >= k:
+                found.sort(key=operator.itemgetter(0))
+                del found[k:]
+                if found[-1][0] <= (ring * step) ** 2: # 次の輪のセルまでは少なくとも ring * step 離れている
+                    break
+        if len(found) < k:
+            found.sort(key=operator.itemgetter(0))
+        return found
+
+@functools.lru_cache(maxsize=None)
+def ring_offsets(ring):
+    """中心のセルから ring 個離れた輪のセルの (dx, dy)"""
+    return [(dx, dy) for dx in range(-ring, ring + 1) for dy in range(-ring, ring + 1) if max(abs(dx), abs(dy)) == ring]
+
+def compact(items, pool, is_dead, index=None):
+    """Swap-remove dead entities in place and hand them back to the pool (order is not preserved).
+    Removed entities are also dropped from `index` (a SpatialGrid) if given."""
+    i, n = 0, len(items)
+    while i < n:
+        item = items[i]
+        if is_dead(item):
+            n -= 1
+            items[i] = items[n]
+            items.pop()
+            if index is not None:
+                index.remove(item)
+            pool.release(item)
+        else:
+            i += 1
+
+class UpdateScheduler:
+    """1ステップで処理する犬を見た目への影響に応じて間引き、1ステップの犬の数を budget 以内に抑える
+    - 手前の走っている犬・骨に向かっている犬: 毎ステップ
+    - 奥 (z < FAR_Z) の走っている犬: FAR_INTERVAL ティックおき
+    - 座っている・寝ている犬: IDLE_INTERVAL ティックおき
+    選ばれた犬だけが骨への向きを決め、前回からの経過ティックをまとめて進み (位置や状態の進み方は変わらない)、
+    骨との当たり判定と、次のステップの最初に犬同士の当たり判定をする。選ばれなかった犬はそのステップでは何もしない
+    選んだ犬の作業量 (DOG_STEP_COST + 当たり判定で調べる近くの犬の数) の合計が budget を超えるなら、
+    続きは次のステップに回し、前回止まった犬から順に (ラウンドロビンで) 選ぶ
+    予算は時間ではなく作業量で数える (時間で打ち切ると入力の再生で同じ結果にならない)"""
+    __slots__ = ('budget', 'cursor', 'updated', 'work', 'deferred', 'total')
+
+    def __init__(self, budget=DOG_STEP_BUDGET):
+        self.budget = budget
+        self.cursor = 0   # 次のステップで最初に調べる犬のリスト上の位置
+        self.updated = 0  # 直前のステップで選んだ犬の数
+        self.work = 0     # 直前のステップで選んだ犬の作業量
+        self.deferred = 0 # 直前のステップで予算が尽きて調べ残した犬の数
+        self.total = 0    # これまでに選んだ回数
+
+    def select(self, dogs, tick, index):
+        """このステップで処理する犬のリスト。index は犬の空間インデックス (近くの犬の数を数える)"""
+        n = len(dogs)
+        start = self.cursor if self.cursor < n else 0
+        budget = self.budget
+        due = []
+        work = 0
+        self.deferred = 0
+        for k in range(n):
+            i = start + k
+            if i >= n: i -= n
+            dog = dogs[i]
+            elapsed = tick - dog.updated_tick
+            if dog.state != 'running':
+                if elapsed < IDLE_INTERVAL: continue
+            elif elapsed < FAR_INTERVAL and dog.z < FAR_Z and dog.seek is None:
+                continue
+            cost = DOG_STEP_COST + index.crowd(dog.x, dog.z)
+            if due and work + cost > budget: # 1匹は必ず進める
+                self.cursor = i
+                self.deferred = n - k
+                break
+            work += cost
+            due.append(dog)
+        self.updated, self.work = len(due), work
+        self.total += len(due)
+        return due
+
+def is_dog_gone(dog): return dog.off_screen
+def is_bone_gone(bone): return not bone.is_active
+def is_bone_active(bone): return bone.is_active
+
+class World:
+    """Dog Run simulation state. Advanced in fixed DT steps and never touches pyxel, so it can run headless."""
+    HORIZON_Y = HORIZON_Y
+
+    def __init__(self, width=SCREEN_WIDTH, height=SCREEN_HEIGHT, seed=None, max_dogs=10, max_bones=3):
+        self.width, self.height = width, height
+        self.rng = random.Random(seed)
+        self.tick = 0
         self.dogs = []
-        self.max_dogs = 10
-        self.dog_spawn_timer = 0
+        self.max_dogs = max_dogs
         self.bones = []
-        self.max_bones = 3
-        self.create_dithered_background()
-        pyxel.run(self.update, self.draw)
-
-    def create_dithered_background(self):
-        bg_img = pyxel.images[2]
-        sky_base_color, sky_dither_color = 12, 7
-        ground_base_color, ground_dither_color = 3, 11
-        bg_img.rect(0, 0, pyxel.width, self.HORIZON_Y, sky_base_color)
-        bg_img.rect(0, self.HORIZON_Y, pyxel.width, pyxel.height - self.HORIZON_Y, ground_base_color)
-        num_grads, grad_height = 10, 3
-        for i in range(num_grads):
-            alpha = 1.0 - (i / num_grads)
-            pyxel.dither(alpha)
-            bg_img.rect(0, self.HORIZON_Y + i * grad_height, pyxel.width, grad_height, ground_dither_color)
-            bg_img.rect(0, self.HORIZON_Y - (i + 1) * grad_height, pyxel.width, grad_height, sky_dither_color)
-        pyxel.dither(1.0)
+        self.max_bones = max_bones
+        self.dog_pool = Pool(lambda: Dog(self))
+        self.bone_pool = Pool(Bone)
+        # 空間インデックス: 骨は画面の (x, y) で、置いたときと片付けたときに更新する
+        # 犬は (x, z) で、出したとき・Dog.update で動いたとき・片付けたときに更新する
+        self.bone_index = SpatialGrid(BONE_CELL, BONE_CELL)
+        self.bone_version = 0 # 骨を置いたり片付けたりするたびに増やす (steer_dogs の結果の使い回しを止める)
+        self.dog_index = SpatialGrid(DOG_CELL_X, DOG_CELL_Z)
+        self.scheduler = UpdateScheduler()
+        self.moved = [] # 直前のステップで更新した犬 (次のステップの最初に他の犬との当たり判定をする)
 
-    def update(self):
-        # --- Collision: Dog vs Dog ---
-        for i in range(len(self.dogs)):
-            for j in range(i + 1, len(self.dogs)):
-                dog1, dog2 = self.dogs[i], self.dogs[j]
-                if dog1.collision_cooldown > 0 or dog2.collision_cooldown > 0: continue
+    @property
+    def allocations(self):
+        """これまでにプールが新規作成したエンティティの総数"""
+        return self.dog_pool.allocations + self.bone_pool.allocations
+
+    def screen_y_for(self, z, size):
+        return self.HORIZON_Y + (z * (self.height - self.HORIZON_Y - size))
+
+    def dog_at(self, mx, my):
+        """クリック位置にいる一番手前の犬を返す"""
+        for dog in sorted(self.dogs, key=lambda d: d.z, reverse=True):
+            if (dog.x - dog.size / 2 <= mx < dog.x + dog.size / 2 and dog.screen_y <= my < dog.screen_y + dog.size):
+                return dog
+        return None
+
+    def click(self, mx, my):
+        bone_clicked = False
+        # Check if an existing bone was clicked
+        for bone in self.bones:
+            # Simple bounding box check for bone click (5x3 pixels)
+            if bone.is_active and \
+               mx >= bone.x and mx < bone.x + 5 and \
+               my >= bone.y and my < bone.y + 3:
+                bone.is_active = False
+                bone_clicked = True
+                break # Only remove one bone per click
+
+        # Dog click logic (still applies)
+        dog = self.dog_at(mx, my)
+        if dog:
+            dog.change_direction()
+
+        # Place a new bone if max_bones not reached, no bone was clicked, and click is on grass
+        if not bone_clicked and dog is None and len(self.bones) < self.max_bones and my >= self.HORIZON_Y:
+            bone = self.bone_pool.acquire().spawn(mx - 2, my - 1) # Adjust for bone center
+            self.bones.append(bone)
+            self.bone_index.insert(bone, bone.x, bone.y)
+            self.bone_version += 1
+
+    def spawn_dog(self, start_at_horizon=True):
+        dog = self.dog_pool.acquire().spawn(start_at_horizon)
+        self.dogs.append(dog)
+        self.dog_index.insert(dog, dog.x, dog.z)
+        return dog
+
+    def collide_dogs(self, dogs=None):
+        """dogs (省略すると全部の犬) のそれぞれと、空間インデックスで近くにいる犬との当たり判定
+        ぶつかった犬はどちらもクールダウンに入るので、両方が dogs にいても同じ組で2回ぶつかることはない"""
+        index = self.dog_index
+        everyone = self.dogs if len(self.dogs) <= LINEAR_MAX_DOGS else None
+        for dog1 in self.dogs if dogs is None else dogs:
+            if dog1.collision_cooldown > 0: continue
+            for dog2 in everyone or index.near(dog1.x, dog1.z):
+                if dog2 is dog1 or dog2.collision_cooldown > 0: continue
                 if abs(dog1.z - dog2.z) < 0.05 and abs(dog1.x - dog2.x) < (dog1.size + dog2.size) / 2:
                     dog1.collision_cooldown = dog2.collision_cooldown = 30
                     if dog1.state == 'running' and dog2.state != 'running': dog2.start_running()
                     dog1.change_direction(); dog2.change_direction()
+                    break
 
-        # --- Mouse Click Logic ---
-        if pyxel.btnp(pyxel.MOUSE_BUTTON_LEFT):
-            mx, my = pyxel.mouse_x, pyxel.mouse_y
-            bone_clicked = False
-            # Check if an existing bone was clicked
-            for bone in self.bones:
-                # Simple bounding box check for bone click (5x3 pixels)
-                if bone.is_active and \
-                   mx >= bone.x and mx < bone.x + 5 and \
-                   my >= bone.y and my < bone.y + 3:
-                    bone.is_active = False
-                    bone_clicked = True
-                    break # Only remove one bone per click
-
-            # Dog click logic (still applies)
-            for dog in sorted(self.dogs, key=lambda d: d.z, reverse=True):
-                if (dog.x - dog.size / 2 <= mx < dog.x + dog.size / 2 and dog.screen_y <= my < dog.screen_y + dog.size):
-                    dog.change_direction(); break
-            
-            # Place a new bone if max_bones not reached, no bone was clicked, and click is on grass
-            if not bone_clicked and len(self.bones) < self.max_bones and my >= self.HORIZON_Y and not any(dog.x - dog.size / 2 <= mx < dog.x + dog.size / 2 and dog.screen_y <= my < dog.screen_y + dog.size for dog in self.dogs):
-                self.bones.append(Bone(mx - 2, my - 1)) # Adjust for bone center
-
-        # --- Update states and remove off-screen dogs ---
-        for dog in self.dogs: dog.update()
-        self.dogs = [dog for dog in self.dogs if not dog.off_screen]
+    def steer_dogs(self, dogs=None):
+        """dogs (省略すると全部の犬) の走っている犬ごとに、SIGHT_RADIUS 以内で一番近い骨に向かわせる
+        骨が LINEAR_MAX_BONES 個以下なら全部の骨を調べる。多ければ空間インデックスで探し、
+        骨が増減するか犬が骨のセルをまたぐまでは前回の結果を使う (同じセルの中では一番近い骨はほとんど変わらない)"""
+        dogs = self.dogs if dogs is None else dogs
+        bones = self.bones
+        if len(bones) <= LINEAR_MAX_BONES:
+            limit = SIGHT_RADIUS * SIGHT_RADIUS
+            for dog in dogs:
+                dog.seek = dog.seek_key = None
+                if dog.state != 'running':
+                    continue
+                x, y = dog.x - BONE_W / 2, dog.screen_y + dog.size / 2 - BONE_H / 2
+                nearest = limit
+                for bone in bones:
+                    if bone.is_active:
+                        d2 = (bone.x - x) * (bone.x - x) + (bone.y - y) * (bone.y - y)
+                        if d2 < nearest or (d2 == nearest and dog.seek is None):
+                            nearest, dog.seek = d2, bone
+            return
+        index = self.bone_index
+        version = self.bone_version
+        for dog in dogs:
+            if dog.state != 'running':
+                dog.seek = dog.seek_key = None
+                continue
+            x, y = dog.x - BONE_W / 2, dog.screen_y + dog.size / 2 - BONE_H / 2
+            key = (version, index.key(x, y))
+            if key == dog.seek_key and (dog.seek is None or dog.seek.is_active):
+                continue
+            found = index.nearest(x, y, SIGHT_RADIUS, 1, is_bone_active)
+            dog.seek = found[0][1] if found else None
+            dog.seek_key = key
 
-        # --- Dog-Bone Interaction ---
-        for dog in self.dogs:
+    def update_dogs(self, dogs):
+        """dogs を前回の更新からの経過ティック分だけ進め、犬の空間インデックスを合わせる"""
+        tick, index = self.tick, self.dog_index
+        for dog in dogs:
+            dog.update(DT, tick - dog.updated_tick)
+            dog.updated_tick = tick
+            index.move(dog, dog.x, dog.z)
+
+    def collide_bones(self, dogs=None):
+        """dogs (省略すると全部の犬) の走っている犬と骨の当たり判定"""
+        index = self.bone_index
+        if not index.where:
+            return
+        few = len(self.bones) <= LINEAR_MAX_BONES
+        for dog in self.dogs if dogs is None else dogs:
             if dog.state == 'running': # Only running dogs interact with bones
-                for bone in self.bones:
+                # 犬と重なり得る骨は、犬の中心から骨のセル1つ分以内にある (骨が少なければ全部調べる方が速い)
+                for bone in self.bones if few else index.near(dog.x, dog.screen_y + dog.size / 2):
                     if bone.is_active:
                         # Check for collision between dog and bone
                         if (dog.x - dog.size / 2 < bone.x + 5 and
@@ -171,27 +569,147 @@ class App:
                             bone.is_active = False # Bone disappears
                             break # Dog found a bone, no need to check other bones for this dog
 
-        self.bones = [bone for bone in self.bones if bone.is_active] # Filter inactive bones again after dog interaction
+    def step(self):
+        # --- Collision: dogs that moved last step vs dogs nearby ---
+        with perf.section("collide_dogs"):
+            self.collide_dogs(self.moved)
+
+        # --- Pick this step's dogs, steer them toward the nearest bone in sight, update them and remove off-screen dogs ---
+        with perf.section("dog_update"):
+            due = self.scheduler.select(self.dogs, self.tick, self.dog_index)
+            self.steer_dogs(due)
+            self.update_dogs(due)
+            compact(self.dogs, self.dog_pool, is_dog_gone, self.dog_index)
+            self.moved = [dog for dog in due if not dog.off_screen]
+
+        # --- Dog-Bone Interaction ---
+        with perf.section("collide_bones"):
+            self.collide_bones(self.moved)
+        bones = len(self.bones)
+        compact(self.bones, self.bone_pool, is_bone_gone, self.bone_index) # Recycle inactive bones after dog interaction
+        if len(self.bones) != bones:
+            self.bone_version += 1
 
         # --- Spawn new dogs ---
-        if len(self.dogs) < self.max_dogs and pyxel.frame_count % 60 == 0:
-            self.dogs.append(Dog(self, random.choice([True, False])))
+        if len(self.dogs) < self.max_dogs and self.tick % 60 == 0:
+            self.spawn_dog(self.rng.choice([True, False]))
+        self.tick += 1
+
+    def fast_forward(self, ticks, bone_interval=0):
+        """描画せずに指定ティック数だけシミュレーションを進める (ソークテスト・ベンチマーク用)"""
+        for _ in range(ticks):
+            # Drop bones at random spots on the grass to exercise the dog-bone path
+            if bone_interval and self.tick % bone_interval == 0:
+                self.click(self.rng.uniform(0, self.width), self.rng.uniform(self.HORIZON_Y, self.height))
+            self.step()
+
+class App:
+    def __init__(self, standalone=True, seed=None, replay=None):
+        if standalone:
+            pyxel.init(SCREEN_WIDTH, SCREEN_HEIGHT, title="Dog Run 3D")
+        pyxel.mouse(False)
+        self.atlas = load_atlas()
+        # Clicks are logged by simulation tick so a recording replays identically regardless of frame timing
+        seed, _, self.input_log = input_log.session("dogrun", seed, replay, stats=False)
+        self.world = World(pyxel.width, pyxel.height, seed)
+        self.HORIZON_Y = self.world.HORIZON_Y
+        self.accumulator = 0.0
+        self.last_time = time.perf_counter()
+        self.pending_events = [] # Input waiting for the next simulation step
+        self.render_queue = RenderQueue(self.atlas, self.HORIZON_Y)
+        self.draw_calls = 0 # Draw calls issued during the last frame
+        self.allocations = 0 # Entities allocated by the pools during the last frame
+        if standalone:
+            pyxel.run(*perf.instrument("dogrun", self.update, self.draw))
+
+    def resume(self):
+        # Don't try to catch up on the time spent in another game
+        self.last_time = time.perf_counter()
+        self.accumulator = 0.0
+
+    def read_input(self):
+        if pyxel.btnp(pyxel.MOUSE_BUTTON_LEFT):
+            return [("click", pyxel.mouse_x, pyxel.mouse_y)]
+        return []
+
+    def apply(self, events):
+        for name, *args in events:
+            if name == "click":
+                self.world.click(*args)
+
+    def step(self, events):
+        """Apply the events logged for this tick and advance the world by one fixed step (used by replays)."""
+        self.apply(events)
+        self.world.step()
+
+    def replay_state(self):
+        world = self.world
+        return (world.tick, [(dog.x, dog.z, dog.state, dog.movement_mode) for dog in world.dogs],
+                [(bone.x, bone.y) for bone in world.bones])
+
+    def update(self):
+        # --- Mouse Click Logic ---
+        # Clicks take effect at the start of the next simulation step, the same point a replay applies them
+        events = self.read_input()
+        self.input_log.capture(self.world.tick, events, self.replay_state)
+        self.pending_events.extend(events)
+
+        # --- Fixed-timestep simulation ---
+        now = time.perf_counter()
+        self.accumulator += now - self.last_time
+        self.last_time = now
+        steps = 0
+        allocations_before = self.world.allocations
+        while self.accumulator >= DT and steps < MAX_STEPS_PER_FRAME:
+            self.step(self.pending_events)
+            self.pending_events.clear()
+            self.accumulator -= DT
+            steps += 1
+        if steps == MAX_STEPS_PER_FRAME:
+            self.accumulator = min(self.accumulator, DT)
+        self.allocations = self.world.allocations - allocations_before
 
     def draw(self):
-        pyxel.blt(0, 0, 2, 0, 0, pyxel.width, pyxel.height)
-        self.dogs.sort(key=lambda dog: dog.z)
-        for dog in self.dogs:
-            dog.draw()
-        for bone in self.bones:
-            bone.draw()
+        world = self.world
+        alpha = self.accumulator / DT
+        pyxel.blt(0, 0, self.atlas, 0, BACKGROUND_V, pyxel.width, pyxel.height)
+        queue = self.render_queue
+        queue.reset_stats()
+        for dog in world.dogs:
+            dog.render(queue, alpha, world.tick)
+        for bone in world.bones:
+            bone.render(queue)
+        queue.flush()
+        self.draw_calls = 1 + queue.draw_calls
 
         # Check if all dogs are sitting or lying down
-        all_dogs_stopped = all(dog.state != 'running' for dog in self.dogs)
-        if all_dogs_stopped and len(self.dogs) == self.max_dogs: # Only show if all max_dogs are stopped
+        all_dogs_stopped = all(dog.state != 'running' for dog in world.dogs)
+        if all_dogs_stopped and len(world.dogs) == world.max_dogs: # Only show if all max_dogs are stopped
             message = "A quiet moment, a happy dog run"
             text_width = len(message) * pyxel.FONT_WIDTH # Approximate width
             text_x = (pyxel.width - text_width) // 2
             text_y = self.HORIZON_Y // 2 - pyxel.FONT_HEIGHT // 2 # Center in sky
             pyxel.text(text_x, text_y, message, 7) # Color 7 is white
+            self.draw_calls += 1
+
+def run_headless(args):
+    """--headless [TICKS] [SEED] [MAX_DOGS]: 描画なしでワールドを早送りし、ティック/秒を表示する"""
+    ticks = int(args[0]) if len(args) > 0 else 100000
+    seed = int(args[1]) if len(args) > 1 else 0
+    max_dogs = int(args[2]) if len(args) > 2 else 10
+    world = World(seed=seed, max_dogs=max_dogs, max_bones=max(3, max_dogs // 10))
+    start = time.perf_counter()
+    world.fast_forward(ticks // 2, bone_interval=45)
+    warm_allocations = world.allocations
+    world.fast_forward(ticks - ticks // 2, bone_interval=45)
+    elapsed = time.perf_counter() - start
+    print(f"ticks={ticks} seed={seed} dogs={len(world.dogs)} bones={len(world.bones)} "
+          f"elapsed={elapsed:.3f}s ticks/sec={ticks / elapsed:.0f} "
+          f"allocations={world.allocations} (second half: {world.allocations - warm_allocations}) "
+          f"dog updates/tick={world.scheduler.total / ticks:.1f}")
 
-App()
+if __name__ == "__main__":
+    if "--headless" in sys.argv:
+        run_headless(sys.argv[sys.argv.index("--headless") + 1:])
+    else:
+        App()
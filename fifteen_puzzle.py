@@ -1,5 +1,11 @@
 import pyxel
 import random
+import time
+
+import fifteen_solver
+import input_log
+import perf
+import redraw
 
 # --- 定数 ---
 SCREEN_WIDTH = 200
@@ -11,15 +17,58 @@ TILE_SIZE = 48
 # 全体で192x192ピクセル (48*4 x 48*4) の画像が必要です。
 BOARD_OFFSET_X = (SCREEN_WIDTH - BOARD_SIZE * TILE_SIZE) // 2
 BOARD_OFFSET_Y = (SCREEN_HEIGHT - BOARD_SIZE * TILE_SIZE) // 2 + 10 # タイトル用に少し下げる
+HINT_WEIGHT = 2.0        # ヒントの手数は最適解の HINT_WEIGHT 倍以内 (探索が長引けば重みを上げる)
+HINT_MAX_NODES = 5000    # ヒントの探索で覚える局面数の上限 (達したら重みを 1.5 倍にしてやり直す)
+HINT_BUDGET_MS = 8       # 1フレームあたりにヒントの探索に使う時間 (数フレームで最初のヒントが出る)
+OPTIMAL_BUDGET_MS = 10   # 1フレームあたりに最適解の探索に使う時間
+
+def draw_tiles(board, image_bank, offset_x, offset_y):
+    """board (行のリスト、0 は空きマス) のタイルを image_bank の絵柄で (offset_x, offset_y) から描く
+    (ゲームの画面と thumbnails.py のサムネイルで使う)"""
+    for y in range(BOARD_SIZE):
+        for x in range(BOARD_SIZE):
+            tile_num = board[y][x]
+            draw_x = offset_x + x * TILE_SIZE
+            draw_y = offset_y + y * TILE_SIZE
+
+            if tile_num > 0:
+                # リソースファイル上のタイルの位置(u, v)を計算 (4x4グリッド配置を想定)
+                tile_index = tile_num - 1 # 0-15
+                u = (tile_index % BOARD_SIZE) * TILE_SIZE
+                v = (tile_index // BOARD_SIZE) * TILE_SIZE
+                pyxel.blt(draw_x, draw_y, image_bank, u, v, TILE_SIZE, TILE_SIZE, 0)
+
+                # 画像の上に白い文字で数字を右下に描画
+                num_str = str(tile_num)
+                text_w = len(num_str) * 4
+                text_x = draw_x + TILE_SIZE - text_w - 2 # 右端から2px内側
+                text_y = draw_y + TILE_SIZE - 6 - 2      # 下端から2px内側
+                # 黒い影をつけて見やすくする
+                pyxel.text(text_x + 1, text_y + 1, num_str, 0)
+                pyxel.text(text_x, text_y, num_str, 7) # 7は白
 
 class App:
-    def __init__(self):
-        pyxel.init(SCREEN_WIDTH, SCREEN_HEIGHT, title="15 Puzzle", fps=30)
+    def __init__(self, standalone=True, seed=None, replay=None):
+        """standalone=False の場合は pyxel の初期化と実行をランチャーに任せる
+        replay に input_log.InputLog を渡すと、その記録の乱数の種から始める"""
+        if standalone:
+            pyxel.init(SCREEN_WIDTH, SCREEN_HEIGHT, title="15 Puzzle", fps=30)
         pyxel.load("fifteen_puzzle.pyxres")
         pyxel.mouse(False)
         self.image_bank = 0 # 使用する画像バンク
+        self.show_hint = False # H: 次に動かすタイルのヒントを表示
+        # 盤面はゲームごとの乱数で作る (記録した入力で再生できるように)
+        seed, _, self.input_log = input_log.session("fifteen_puzzle", seed, replay, stats=False)
+        self.rng = random.Random(seed)
+        self.ticks = 0 # step を呼んだ回数
+        self.redraw = redraw.RedrawGate()
         self.reset()
-        pyxel.run(self.update, self.draw)
+        if standalone:
+            pyxel.run(*perf.instrument("fifteen_puzzle", self.update, self.draw))
+
+    def resume(self):
+        """ランチャーで他のゲームから戻ってきたら画面を描き直す"""
+        self.redraw.invalidate()
 
     def get_inversion_count(self, arr):
         """リストの転置数を計算する"""
@@ -34,7 +83,7 @@ class App:
 
     def reset(self):
         """ゲームの状態を初期化する"""
-        self.image_bank = random.randint(0, 2) # IMAGE 0, 1, 2 からランダムに選択
+        self.image_bank = self.rng.randint(0, 2) # IMAGE 0, 1, 2 からランダムに選択
         self.is_cleared = False
         self.restart_sequence_count = 0
         
@@ -43,7 +92,7 @@ class App:
         
         # 解ける配置になるまでシャッフルを繰り返す
         while True:
-            random.shuffle(tiles)
+            self.rng.shuffle(tiles)
             inversions = self.get_inversion_count(tiles)
             # 4x4パズルの場合、転置数が偶数なら可解 (空きマスが右下にあると仮定するため)
             if inversions % 2 == 0:
@@ -58,81 +107,149 @@ class App:
         
         # 空きマスの位置を記録
         self.empty_pos = [BOARD_SIZE - 1, BOARD_SIZE - 1]
+        self.clear_hint()
+
+    def clear_hint(self):
+        self.hint_path = None      # ゴールまでの手順 (空きマスの移動先のマス番号)
+        self.hint_weight = 0.0     # ヒントの手数の保証 (最適解の何倍以内か)。最適解なら 1.0
+        self.hint_search = None    # 最初のヒントを求める重み付き A* (数フレームに分けて進める)
+        self.optimal_search = None # バックグラウンドで進める最適解の探索
+        self.hint_progress = []    # 最適解の探索を始めてからヒントどおりに動かした手
+
+    def board_tuple(self):
+        return tuple(t for row in self.board for t in row)
+
+    @perf.timed("hint_search")
+    def update_hint(self):
+        """ヒントの手順が無ければ重み付き A* で求め、その後は最適解の探索を進める
+        どちらも1フレームで使う時間を区切るので、探索の途中でも画面は止まらない"""
+        if self.hint_path is None:
+            if self.hint_search is None:
+                self.hint_search = fifteen_solver.BoundedSearch(self.board_tuple(), HINT_WEIGHT, HINT_MAX_NODES)
+            search = self.hint_search
+            if not search.run(time.perf_counter() + HINT_BUDGET_MS / 1000):
+                return
+            self.hint_path, self.hint_weight = search.solution, search.weight
+            self.hint_search = None
+            self.optimal_search, self.hint_progress = fifteen_solver.OptimalSearch(self.board_tuple()), []
+            return
+        search = self.optimal_search
+        if search and search.run(time.perf_counter() + OPTIMAL_BUDGET_MS / 1000):
+            done = len(self.hint_progress)
+            if search.solution[:done] == self.hint_progress:
+                # 最適解の途中までヒントどおりに動かしていれば、残りもそのまま最適解
+                self.hint_path, self.hint_weight = search.solution[done:], 1.0
+                self.optimal_search = None
+            else:
+                self.optimal_search, self.hint_progress = fifteen_solver.OptimalSearch(self.board_tuple()), []
+
+    def follow_hint(self, move):
+        """タイルを動かした後にヒントの手順を合わせる。手順どおりなら1手進め、外れたら求め直す"""
+        if self.hint_path and self.hint_path[0] == move:
+            self.hint_path = self.hint_path[1:]
+            self.hint_progress.append(move)
+        else:
+            self.clear_hint()
 
     def update(self):
         """ゲームのロジックを更新する"""
+        events = self.read_input()
+        self.input_log.capture(self.ticks, events, self.replay_state)
+        if events or not self.is_idle(): # 入力待ちで進めるものが無いフレームは step を省く (ティックも進めない)
+            self.step(events)
+
+    def is_idle(self):
+        """イベントが無ければ step が何もしない (ヒントを表示していないか、最適解まで求め終えている)"""
+        return not self.show_hint or self.is_cleared or (self.hint_path is not None and self.optimal_search is None)
+
+    def read_input(self):
+        """マウスとキーの入力をイベントにする (ゲームの状態は変えない)"""
+        events = []
         if pyxel.btnp(pyxel.KEY_R):
-            self.reset()
+            events.append(("reset",))
+        if pyxel.btnp(pyxel.KEY_H):
+            events.append(("hint",))
+        if pyxel.btnp(pyxel.MOUSE_BUTTON_LEFT):
+            # クリックされたタイル座標を計算
+            tx = (pyxel.mouse_x - BOARD_OFFSET_X) // TILE_SIZE
+            ty = (pyxel.mouse_y - BOARD_OFFSET_Y) // TILE_SIZE
+            if 0 <= tx < BOARD_SIZE and 0 <= ty < BOARD_SIZE:
+                events.append(("slide", tx, ty))
+        return events
+
+    def step(self, events):
+        """イベントを適用して1フレーム進める"""
+        self.ticks += 1
+        for name, *args in events:
+            if name == "reset":
+                self.reset()
+            elif name == "hint":
+                self.show_hint = not self.show_hint
+            elif name == "slide":
+                self.slide(*args)
+
+        if self.show_hint and not self.is_cleared:
+            self.update_hint()
 
+    def slide(self, tx, ty):
+        """タイル (tx, ty) がクリックされた"""
         if self.is_cleared:
             # クリア後、1から15まで順番にクリックされたらリスタートする
-            if pyxel.btnp(pyxel.MOUSE_BUTTON_LEFT):
-                mouse_x, mouse_y = pyxel.mouse_x, pyxel.mouse_y
-                tx = (mouse_x - BOARD_OFFSET_X) // TILE_SIZE
-                ty = (mouse_y - BOARD_OFFSET_Y) // TILE_SIZE
-
-                if 0 <= tx < BOARD_SIZE and 0 <= ty < BOARD_SIZE:
-                    clicked_num = self.board[ty][tx]
-                    if clicked_num == self.restart_sequence_count + 1:
-                        self.restart_sequence_count += 1
-                        if self.restart_sequence_count == 15:
-                            self.reset()
-                    # 違うタイルをクリックしたらリセット
-                    elif clicked_num != 0:
-                        self.restart_sequence_count = 0
+            clicked_num = self.board[ty][tx]
+            if clicked_num == self.restart_sequence_count + 1:
+                self.restart_sequence_count += 1
+                if self.restart_sequence_count == 15:
+                    self.reset()
+            # 違うタイルをクリックしたらリセット
+            elif clicked_num != 0:
+                self.restart_sequence_count = 0
             return
 
-        if pyxel.btnp(pyxel.MOUSE_BUTTON_LEFT):
-            mouse_x, mouse_y = pyxel.mouse_x, pyxel.mouse_y
+        ex, ey = self.empty_pos
+        # 空きマスと隣接しているかチェック
+        if (abs(tx - ex) == 1 and ty == ey) or (tx == ex and abs(ty - ey) == 1):
+            # タイルを入れ替え
+            self.board[ey][ex] = self.board[ty][tx]
+            self.board[ty][tx] = 0
+            self.empty_pos = [tx, ty]
+            self.follow_hint(ty * BOARD_SIZE + tx)
             
-            # クリックされたタイル座標を計算
-            tx = (mouse_x - BOARD_OFFSET_X) // TILE_SIZE
-            ty = (mouse_y - BOARD_OFFSET_Y) // TILE_SIZE
+            # クリアチェック
+            self.check_clear()
 
-            if 0 <= tx < BOARD_SIZE and 0 <= ty < BOARD_SIZE:
-                ex, ey = self.empty_pos
-                # 空きマスと隣接しているかチェック
-                if (abs(tx - ex) == 1 and ty == ey) or (tx == ex and abs(ty - ey) == 1):
-                    # タイルを入れ替え
-                    self.board[ey][ex] = self.board[ty][tx]
-                    self.board[ty][tx] = 0
-                    self.empty_pos = [tx, ty]
-                    
-                    # クリアチェック
-                    self.check_clear()
+    def replay_state(self):
+        """入力の再生で照合する状態"""
+        return (self.image_bank, self.board, self.is_cleared, self.restart_sequence_count)
+
+    def view_key(self):
+        """draw の見た目を決める値"""
+        hint = self.hint_path and (self.hint_path[0], len(self.hint_path), self.hint_weight)
+        return (self.image_bank, self.board_tuple(), self.is_cleared, self.show_hint, hint)
 
     def draw(self):
-        """画面を描画する"""
+        """画面を描画する (前回描いたときから見た目が変わっていなければ何もしない)"""
+        if not self.redraw.needs_redraw(self.view_key()):
+            return
         pyxel.cls(1) # 背景色: 濃い青
         pyxel.text(SCREEN_WIDTH // 2 - 24, 5, "15 PUZZLE", 7)
 
-        # 1行あたりのタイル数を4に設定
-        TILES_PER_ROW = 4
+        # 盤面を描画 (ランダムに選択された画像バンクを使用)
+        draw_tiles(self.board, self.image_bank, BOARD_OFFSET_X, BOARD_OFFSET_Y)
+
+        # ヒント: 次に動かすタイルを枠で囲み、残りの手数を表示する
+        if self.show_hint and not self.is_cleared and self.hint_path:
+            hint_x = BOARD_OFFSET_X + self.hint_path[0] % BOARD_SIZE * TILE_SIZE
+            hint_y = BOARD_OFFSET_Y + self.hint_path[0] // BOARD_SIZE * TILE_SIZE
+            pyxel.rectb(hint_x, hint_y, TILE_SIZE, TILE_SIZE, 10)
+            pyxel.rectb(hint_x + 1, hint_y + 1, TILE_SIZE - 2, TILE_SIZE - 2, 10)
+            quality = "OPTIMAL" if self.hint_weight == 1.0 else f"<= {self.hint_weight:.1f}x OPTIMAL"
+            hint_msg = f"HINT: {len(self.hint_path)} MOVES ({quality})"
+            pyxel.text(SCREEN_WIDTH // 2 - len(hint_msg) * 2, BOARD_OFFSET_Y - 10, hint_msg, 10)
+        elif self.show_hint and not self.is_cleared:
+            hint_msg = "HINT: SEARCHING..."
+            pyxel.text(SCREEN_WIDTH // 2 - len(hint_msg) * 2, BOARD_OFFSET_Y - 10, hint_msg, 10)
+        pyxel.text(2, 5, "H:HINT", 13)
 
-        # 盤面を描画
-        for y in range(BOARD_SIZE):
-            for x in range(BOARD_SIZE):
-                tile_num = self.board[y][x]
-                draw_x = BOARD_OFFSET_X + x * TILE_SIZE
-                draw_y = BOARD_OFFSET_Y + y * TILE_SIZE
-
-                if tile_num > 0:
-                    # リソースファイル上のタイルの位置(u, v)を計算 (4x4グリッド配置を想定)
-                    tile_index = tile_num - 1 # 0-15
-                    u = (tile_index % TILES_PER_ROW) * TILE_SIZE
-                    v = (tile_index // TILES_PER_ROW) * TILE_SIZE
-                    # 画像を描画 (ランダムに選択された画像バンクを使用)
-                    pyxel.blt(draw_x, draw_y, self.image_bank, u, v, TILE_SIZE, TILE_SIZE, 0)
-                    
-                    # 画像の上に白い文字で数字を右下に描画
-                    num_str = str(tile_num)
-                    text_w = len(num_str) * 4
-                    text_x = draw_x + TILE_SIZE - text_w - 2 # 右端から2px内側
-                    text_y = draw_y + TILE_SIZE - 6 - 2      # 下端から2px内側
-                    # 黒い影をつけて見やすくする
-                    pyxel.text(text_x + 1, text_y + 1, num_str, 0)
-                    pyxel.text(text_x, text_y, num_str, 7) # 7は白
-        
         # クリアメッセージ
         if self.is_cleared:
             # 最後のマスに16番目の絵柄を表示
@@ -141,8 +258,8 @@ class App:
             draw_y = BOARD_OFFSET_Y + ey * TILE_SIZE
             
             tile_index = BOARD_SIZE * BOARD_SIZE - 1 # 15
-            u = (tile_index % TILES_PER_ROW) * TILE_SIZE
-            v = (tile_index // TILES_PER_ROW) * TILE_SIZE
+            u = (tile_index % BOARD_SIZE) * TILE_SIZE
+            v = (tile_index // BOARD_SIZE) * TILE_SIZE
             pyxel.blt(draw_x, draw_y, self.image_bank, u, v, TILE_SIZE, TILE_SIZE, 0)
 
             # リスタート指示文を盤面の上部中央に配置
@@ -151,6 +268,7 @@ class App:
             restart_y = BOARD_OFFSET_Y - 10 # 盤面の上から10px上
             pyxel.text(restart_x, restart_y, restart_msg, 7)
 
+    @perf.timed("check_clear")
     def check_clear(self):
         """クリアしたかどうかをチェックする"""
         expected_num = 1
@@ -172,4 +290,5 @@ class App:
         # すべてのタイルが正しければクリア
         self.is_cleared = True
 
-App()
\ No newline at end of file
+if __name__ == "__main__":
+    App()
@@ -0,0 +1,245 @@
+import argparse
+import heapq
+import random
+import time
+
+# 15パズルのソルバー
+# ヒューリスティックはマンハッタン距離 + linear conflict (同じ行・列に入るべきタイルの前後が逆なら +2 ずつ)
+# 各行・列の4枚の並びごとの linear conflict はキャッシュして使い回す
+# - BoundedSearch / solve_bounded: 重み付き A* (f = g + w * h)。手数は最適解の w 倍以内。
+#   覚える局面数が増えすぎたら w を上げる。少しずつ進められる。ヒント用
+# - OptimalSearch: IDA*。少しずつ進められるので、ゲームの各フレームの空き時間で最適解を探せる
+# 盤面は長さ16のタプル (行優先、0 が空きマス)、手は空きマスの移動先のマス番号で表す
+
+SIZE = 4
+GOAL = tuple(list(range(1, SIZE * SIZE)) + [0])
+NEIGHBOURS = [[p + d for d, ok in ((-SIZE, p >= SIZE), (SIZE, p < SIZE * (SIZE - 1)),
+                                   (-1, p % SIZE > 0), (1, p % SIZE < SIZE - 1)) if ok]
+              for p in range(SIZE * SIZE)]
+# MANHATTAN[tile][pos]: tile が pos にあるときのゴールまでの距離
+MANHATTAN = [[0] * (SIZE * SIZE)] + [
+    [abs(p // SIZE - (t - 1) // SIZE) + abs(p % SIZE - (t - 1) % SIZE) for p in range(SIZE * SIZE)]
+    for t in range(1, SIZE * SIZE)]
+ROWS = [tuple(range(r * SIZE, (r + 1) * SIZE)) for r in range(SIZE)]
+COLS = [tuple(range(c, SIZE * SIZE, SIZE)) for c in range(SIZE)]
+
+_conflict_cache = {}
+
+def line_conflict(tiles, line, is_row):
+    """1行 (または1列) の linear conflict による追加の手数。結果は並びごとにキャッシュする"""
+    key = (tiles, line, is_row)
+    cached = _conflict_cache.get(key)
+    if cached is not None:
+        return cached
+    # この行 (列) がゴールのタイルの、ゴールでの列 (行) の並び
+    goals = [((t - 1) % SIZE if is_row else (t - 1) // SIZE) for t in tiles
+             if t and ((t - 1) // SIZE if is_row else (t - 1) % SIZE) == line]
+    # 最長増加部分列に入らないタイルはよけるために2手余分にかかる
+    longest = [1] * len(goals)
+    for i in range(len(goals)):
+        for j in range(i):
+            if goals[j] < goals[i]:
+                longest[i] = max(longest[i], longest[j] + 1)
+    result = 2 * (len(goals) - max(longest, default=0))
+    _conflict_cache[key] = result
+    return result
+
+def heuristic(board):
+    h = sum(MANHATTAN[t][p] for p, t in enumerate(board))
+    for r, cells in enumerate(ROWS):
+        h += line_conflict(tuple(board[p] for p in cells), r, True)
+    for c, cells in enumerate(COLS):
+        h += line_conflict(tuple(board[p] for p in cells), c, False)
+    return h
+
+def is_solvable(board):
+    tiles = [t for t in board if t]
+    inversions = sum(1 for i in range(len(tiles)) for j in range(i + 1, len(tiles)) if tiles[i] > tiles[j])
+    blank_row_from_bottom = SIZE - board.index(0) // SIZE
+    return (inversions + blank_row_from_bottom) % 2 == 1
+
+def apply_moves(board, moves):
+    board = list(board)
+    blank = board.index(0)
+    for move in moves:
+        board[blank], board[move] = board[move], 0
+        blank = move
+    return tuple(board)
+
+def solve_bounded(board, weight=2.0, max_nodes=200000):
+    """重み付き A* で解く。(手順, 使った重み) を返す
+    覚える局面数が max_nodes に達したら重みを上げてやり直すので、どの盤面でもすぐ答えが出る
+    手数は 最適解 x 使った重み 以下になる"""
+    search = BoundedSearch(board, weight, max_nodes)
+    search.run(float("inf"))
+    return search.solution, search.weight
+
+class BoundedSearch:
+    """重み付き A* を run(deadline) で時間の許す分だけ進める (OptimalSearch と同じ使い方)
+    覚えた局面数が max_nodes に達したら、表を捨てて重みを 1.5 倍にして最初からやり直す
+    (覚える局面は max_nodes までなので、メモリの上限になる)"""
+    def __init__(self, board, weight=2.0, max_nodes=200000):
+        self.start = tuple(board)
+        self.max_nodes = max_nodes
+        self.solution = None
+        self._restart(weight)
+
+    def _restart(self, weight):
+        start = self.start
+        self.weight = weight
+        self.parents = {start: None} # 局面 -> (直前の局面, 手)
+        self.best_g = {start: 0}
+        h = heuristic(start)
+        self.heap = [(weight * h, 0, start, start.index(0))]
+
+    @property
+    def done(self):
+        return self.solution is not None
+
+    def run(self, deadline):
+        """perf_counter が deadline を過ぎるか解が見つかるまで探索を進める。解が見つかれば True"""
+        parents, best_g, heap = self.parents, self.best_g, self.heap
+        weight = self.weight
+        nodes = 0
+        while self.solution is None and heap:
+            if nodes & 15 == 0 and time.perf_counter() > deadline:
+                break
+            nodes += 1
+            _, g, board, blank = heapq.heappop(heap)
+            if board == GOAL:
+                moves = []
+                while parents[board]:
+                    board, move = parents[board]
+                    moves.append(move)
+                self.solution = moves[::-1]
+                break
+            if g > best_g[board]:
+                continue # より短い手順で展開済み
+            if len(best_g) >= self.max_nodes:
+                self._restart(weight * 1.5)
+                parents, best_g, heap = self.parents, self.best_g, self.heap
+                weight = self.weight
+                continue
+            for move in NEIGHBOURS[blank]:
+                child = list(board)
+                child[blank], child[move] = child[move], 0
+                child = tuple(child)
+                if g + 1 < best_g.get(child, 1 << 30):
+                    best_g[child] = g + 1
+                    parents[child] = (board, move)
+                    heapq.heappush(heap, (g + 1 + weight * heuristic(child), g + 1, child, move))
+        return self.solution is not None
+
+class OptimalSearch:
+    """IDA* を明示的なスタックで実装し、run(deadline) で時間の許す分だけ進める"""
+    def __init__(self, board):
+        self.board = list(board)
+        self.blank = self.board.index(0)
+        self.h = heuristic(self.board)
+        self.lower_bound = self.h # 最適解の手数の下限 (反復ごとに上がる)
+        self.solution = [] if self.h == 0 else None
+        self.nodes = 0
+        self._start_iteration()
+
+    def _start_iteration(self):
+        self.next_bound = 1 << 30
+        self.path = []    # 空きマスの移動先
+        self.undo = []    # (移動前の空きマス, 移動前の h)
+        self.stack = [iter(NEIGHBOURS[self.blank])]
+
+    @property
+    def done(self):
+        return self.solution is not None
+
+    def run(self, deadline):
+        """perf_counter が deadline を過ぎるか解が見つかるまで探索を進める。解が見つかれば True"""
+        board, path, undo, stack = self.board, self.path, self.undo, self.stack
+        bound = self.lower_bound
+        nodes = 0
+        while self.solution is None:
+            if nodes & 63 == 0 and time.perf_counter() > deadline:
+                break
+            if not stack:
+                # 今の上限では解が無かったので上限を上げて最初からやり直す
+                self.lower_bound = bound = self.next_bound
+                self._start_iteration()
+                path, undo, stack = self.path, self.undo, self.stack
+                continue
+            move = next(stack[-1], None)
+            if move is None:
+                # この局面の子を調べ終えたので1手戻す
+                stack.pop()
+                if undo:
+                    blank, self.h = undo.pop()
+                    board[self.blank], board[blank] = board[blank], 0
+                    self.blank = blank
+                    path.pop()
+                continue
+            if undo and move == undo[-1][0]:
+                continue # 直前の手を戻すだけの手
+            nodes += 1
+            tile = board[move]
+            h = self._child_heuristic(tile, move)
+            g = len(path) + 1
+            if g + h > bound:
+                self.next_bound = min(self.next_bound, g + h)
+                continue
+            undo.append((self.blank, self.h))
+            board[self.blank], board[move] = tile, 0
+            self.blank, self.h = move, h
+            path.append(move)
+            if h == 0:
+                self.solution = list(path)
+                break
+            stack.append(iter(NEIGHBOURS[move]))
+        self.nodes += nodes
+        return self.solution is not None
+
+    def _child_heuristic(self, tile, move):
+        """タイル tile が move から空きマスへ動いた後の h (動いたタイルの行と列だけ計算し直す)"""
+        board, blank = self.board, self.blank
+        h = self.h - MANHATTAN[tile][move] + MANHATTAN[tile][blank]
+        board[blank], board[move] = tile, 0
+        if move // SIZE == blank // SIZE: # 横に動いた: 2つの列の conflict が変わる
+            lines = [(COLS[move % SIZE], move % SIZE, False), (COLS[blank % SIZE], blank % SIZE, False)]
+        else:
+            lines = [(ROWS[move // SIZE], move // SIZE, True), (ROWS[blank // SIZE], blank // SIZE, True)]
+        for cells, line, is_row in lines:
+            h += line_conflict(tuple(board[p] for p in cells), line, is_row)
+        board[blank], board[move] = 0, tile
+        for cells, line, is_row in lines:
+            h -= line_conflict(tuple(board[p] for p in cells), line, is_row)
+        return h
+
+def random_board(rng):
+    while True:
+        tiles = list(range(1, SIZE * SIZE))
+        rng.shuffle(tiles)
+        board = tuple(tiles + [0])
+        if is_solvable(board):
+            return board
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="15-puzzle solver benchmark")
+    parser.add_argument("--boards", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--weight", type=float, default=2.0)
+    parser.add_argument("--max-nodes", type=int, default=200000)
+    parser.add_argument("--optimal-seconds", type=float, default=0.0, help="also run IDA* for up to this long per board")
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    for i in range(args.boards):
+        board = random_board(rng)
+        start = time.perf_counter()
+        moves, weight = solve_bounded(board, args.weight, args.max_nodes)
+        elapsed = (time.perf_counter() - start) * 1000
+        assert apply_moves(board, moves) == GOAL
+        line = f"board {i:3d}: h={heuristic(board):2d} bounded={len(moves):3d} moves (w={weight:.2f}) {elapsed:7.1f}ms"
+        if args.optimal_seconds:
+            search = OptimalSearch(board)
+            start = time.perf_counter()
+            if search.run(start + args.optimal_seconds):
+                line += f"  optimal={len(search.solution)} ({search.nodes} nodes, {time.perf_counter() - start:.1f}s)"
+            else:
+                line += f"  optimal>={search.lower_bound} ({search.nodes} nodes, gave up)"
+        print(line)
@@ -0,0 +1,139 @@
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import random
+import sys
+import time
+
+import pyxel
+
+import perf
+import stats_store
+
+# 入力の記録と再生
+# 各ゲームは update を read_input (pyxel の入力 -> イベントのリスト) と step (イベントを適用して1ティック進める) に分けてあり、
+# step は pyxel の入力を読まず、乱数もゲームごとの種から作るので、同じイベント列を与えれば同じ状態になる
+# イベントは ("place", r, c) のようなタプルで、ティック番号と一緒に記録する
+# F8: 起動してからの入力を recordings/<game>-<日時>.jsonl に保存する (その時点の状態のダイジェストも書く)
+#   python input_log.py recordings/reversi-20260101-120000.jsonl          # 描画なしで最高速で再生して状態を照合する
+#   python input_log.py recordings/poker-20260101-120000.jsonl --draw --repeat 5
+#   python input_log.py recordings/dogrun-20260101-120000.jsonl --memory # ティックごとのメモリも測る (memtrack.py)
+RECORDINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings")
+
+# ゲーム名 -> (モジュール名, クラス名)
+GAMES = {
+    "reversi": ("reversi", "Reversi"),
+    "dogrun": ("dogrun", "App"),
+    "poker": ("poker", "App"),
+    "fifteen_puzzle": ("fifteen_puzzle", "App"),
+}
+
+def digest(state):
+    """replay_state() の結果を短いハッシュにする"""
+    return hashlib.sha1(repr(state).encode()).hexdigest()[:16]
+
+class InputLog:
+    """1回のプレイの乱数の種・開始時の成績・ティックごとのイベント"""
+    def __init__(self, game, seed, stats=None, events=None, ticks=0, digest=None):
+        self.game = game
+        self.seed = seed
+        self.stats = stats or {}   # 開始時の stats_store の値 (再生時はこの値から始める)
+        self.events = events or [] # (ティック, イベント)
+        self.ticks = ticks         # 保存した時点のティック数 (再生するティック数)
+        self.digest = digest       # 保存した時点の状態のダイジェスト
+        self.replaying = False
+
+    def capture(self, tick, events, state):
+        """プレイ中に毎フレーム呼ぶ。イベントを記録し、F8 が押されたらそこまでを保存する"""
+        if pyxel.btnp(pyxel.KEY_F8):
+            print(f"saved {self.save(tick, digest(state()))}")
+        for event in events:
+            self.events.append((tick, event))
+
+    def save(self, tick, state_digest, path=None):
+        os.makedirs(RECORDINGS_DIR, exist_ok=True)
+        path = path or os.path.join(RECORDINGS_DIR, f"{self.game}-{time.strftime('%Y%m%d-%H%M%S')}.jsonl")
+        header = {"game": self.game, "seed": self.seed, "stats": self.stats, "ticks": tick, "digest": state_digest}
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(header) + "\n")
+            for event_tick, event in self.events:
+                if event_tick < tick:
+                    f.write(json.dumps([event_tick, *event]) + "\n")
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            events = [(line[0], tuple(line[1:])) for line in map(json.loads, f)]
+        log = cls(header["game"], header["seed"], header["stats"], events, header["ticks"], header["digest"])
+        log.replaying = True
+        return log
+
+    def by_tick(self):
+        ticks = {}
+        for tick, event in self.events:
+            ticks.setdefault(tick, []).append(event)
+        return ticks
+
+    def replay(self, game, draw=False):
+        """記録したイベントを game.step に順に与える。最後の状態のダイジェストを返す"""
+        by_tick = self.by_tick()
+        for tick in range(self.ticks):
+            with perf.section("step"):
+                game.step(by_tick.get(tick, []))
+            if draw:
+                with perf.section("draw"):
+                    game.draw()
+        return digest(game.replay_state())
+
+def session(game, seed=None, replay=None, stats=True):
+    """ゲームの開始時に呼び、(乱数の種, 成績の保存先, 入力ログ) を返す
+    再生時は記録の種と成績から始め、成績はメモリ上にだけ保存する"""
+    if replay:
+        return replay.seed, stats_store.in_memory(game, replay.stats) if stats else None, replay
+    seed = random.randrange(1 << 32) if seed is None else seed
+    store = stats_store.StatsStore(game) if stats else None
+    return seed, store, InputLog(game, seed, dict(store.values) if store else {})
+
+def run_replay(path, draw=False, repeat=1, memory=False):
+    """記録を再生し、所要時間と状態の照合結果を表示する。一致しなければ False
+    memory を真にすると再生の間のメモリを測り、区間の peak が予算を超えても False"""
+    log = InputLog.load(path)
+    module_name, class_name = GAMES[log.game]
+    module = importlib.import_module(module_name)
+    pyxel.init(module.SCREEN_WIDTH, module.SCREEN_HEIGHT, title="replay")
+    perf.profiler.game = log.game
+    if memory:
+        import memtrack
+        memtrack.toggle()
+    ok = True
+    for run in range(repeat):
+        game = getattr(module, class_name)(standalone=False, replay=log)
+        start = time.perf_counter()
+        result = log.replay(game, draw)
+        elapsed = time.perf_counter() - start
+        ok &= result == log.digest
+        print(f"{log.game} run {run + 1}: {log.ticks} ticks, {len(log.events)} events, {elapsed:.3f}s "
+              f"({log.ticks / max(elapsed, 1e-9):.0f} ticks/s) digest {result} "
+              f"{'OK' if result == log.digest else 'MISMATCH (expected ' + str(log.digest) + ')'}")
+    for name, s in perf.profiler.stats().items():
+        print(f"  {name:<16} p50={s['p50']:.3f}ms p95={s['p95']:.3f}ms p99={s['p99']:.3f}ms max={s['max']:.3f}ms")
+    if memory:
+        over = perf.profiler.memory.over_budget()
+        memtrack.toggle()
+        ok &= not over
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded input log headlessly")
+    parser.add_argument("path")
+    parser.add_argument("--draw", action="store_true", help="also render every tick (offscreen)")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--memory", action="store_true", help="also track memory per tick and check the budgets")
+    args = parser.parse_args()
+    os.environ.setdefault("SDL_VIDEODRIVER", "offscreen")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    sys.exit(0 if run_replay(os.path.abspath(args.path), args.draw, args.repeat, args.memory) else 1)
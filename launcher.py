@@ -0,0 +1,117 @@
+import importlib
+import time
+
+import pyxel
+
+import perf
+
+# 1つのプロセス・1回の pyxel.init で全ゲームを切り替えて遊べるランチャー
+# ゲームのモジュールは選ばれたときに初めて import し、一度起動したゲームはそのまま常駐させる
+# TAB: メニューに戻る
+
+# (表示名, モジュール名, クラス名)
+GAMES = [
+    ("REVERSI", "reversi", "Reversi"),
+    ("DOG RUN", "dogrun", "App"),
+    ("POKER", "poker", "App"),
+    ("15 PUZZLE", "fifteen_puzzle", "App"),
+]
+MENU_WIDTH, MENU_HEIGHT = 160, 120
+BUTTON_X, BUTTON_Y, BUTTON_W, BUTTON_H, BUTTON_GAP = 40, 30, 80, 15, 5
+
+def snapshot_banks():
+    """画像バンクの内容をメモリ上に退避する"""
+    snapshots = []
+    for bank in pyxel.images:
+        img = pyxel.Image(bank.width, bank.height)
+        img.blt(0, 0, bank, 0, 0, bank.width, bank.height)
+        snapshots.append(img)
+    return snapshots
+
+def restore_banks(snapshots):
+    for bank, img in zip(pyxel.images, snapshots):
+        bank.blt(0, 0, img, 0, 0, img.width, img.height)
+
+class Launcher:
+    def __init__(self):
+        pyxel.init(MENU_WIDTH, MENU_HEIGHT, title="Cats and Dogs Games", fps=30)
+        self.games = {}          # モジュール名 -> 起動済みのゲーム
+        self.bank_snapshots = {} # モジュール名 -> そのゲームの画像バンク
+        self.resident = None     # 現在画像バンクに載っているゲームのモジュール名
+        self.active = None       # プレイ中のゲーム (None ならメニュー)
+        self.switch_ms = 0.0     # 直前のゲーム切り替えにかかった時間
+        self.show_menu()
+        pyxel.run(*perf.instrument("launcher", self.update, self.draw))
+
+    def show_menu(self):
+        self.active = None
+        pyxel.resize(MENU_WIDTH, MENU_HEIGHT)
+        pyxel.title("Cats and Dogs Games")
+        pyxel.mouse(True)
+        perf.profiler.game = "launcher"
+
+    def switch_to(self, index):
+        start = time.perf_counter()
+        label, module_name, class_name = GAMES[index]
+        module = importlib.import_module(module_name)
+        pyxel.resize(module.SCREEN_WIDTH, module.SCREEN_HEIGHT)
+        pyxel.title(label)
+        game = self.games.get(module_name)
+        if game is None:
+            game = self.games[module_name] = getattr(module, class_name)(standalone=False)
+            self.bank_snapshots[module_name] = snapshot_banks()
+        else:
+            if self.resident != module_name:
+                restore_banks(self.bank_snapshots[module_name])
+            resume = getattr(game, "resume", None)
+            if resume:
+                resume()
+        self.resident = module_name
+        self.active = game
+        pyxel.mouse(False)
+        perf.profiler.game = module_name
+        self.switch_ms = (time.perf_counter() - start) * 1000
+
+    def button_y(self, index):
+        return BUTTON_Y + index * (BUTTON_H + BUTTON_GAP)
+
+    def update(self):
+        if self.active:
+            if pyxel.btnp(pyxel.KEY_TAB):
+                self.show_menu()
+            else:
+                self.active.update()
+            return
+
+        for i in range(len(GAMES)):
+            if pyxel.btnp(pyxel.KEY_1 + i):
+                self.switch_to(i)
+                return
+        if pyxel.btnp(pyxel.MOUSE_BUTTON_LEFT):
+            for i in range(len(GAMES)):
+                y = self.button_y(i)
+                if BUTTON_X <= pyxel.mouse_x < BUTTON_X + BUTTON_W and y <= pyxel.mouse_y < y + BUTTON_H:
+                    self.switch_to(i)
+                    return
+
+    def draw(self):
+        if self.active:
+            self.active.draw()
+            return
+
+        pyxel.cls(1)
+        pyxel.text(MENU_WIDTH // 2 - 38, 10, "CATS AND DOGS GAMES", 7)
+        for i, (label, module_name, _) in enumerate(GAMES):
+            y = self.button_y(i)
+            hovered = BUTTON_X <= pyxel.mouse_x < BUTTON_X + BUTTON_W and y <= pyxel.mouse_y < y + BUTTON_H
+            pyxel.rect(BUTTON_X, y, BUTTON_W, BUTTON_H, 5 if hovered else 0)
+            pyxel.rectb(BUTTON_X, y, BUTTON_W, BUTTON_H, 7)
+            pyxel.text(BUTTON_X + 4, y + 5, f"{i + 1} {label}", 7)
+            if module_name in self.games:
+                pyxel.text(BUTTON_X + BUTTON_W - 8, y + 5, "*", 10) # 常駐中
+        pyxel.text(4, MENU_HEIGHT - 16, "TAB: BACK TO MENU", 13)
+        if self.switch_ms:
+            pyxel.text(4, MENU_HEIGHT - 8, f"LAST SWITCH: {self.switch_ms:.1f}ms", 13)
+
+if __name__ == "__main__":
+    Launcher()
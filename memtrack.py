@@ -0,0 +1,197 @@
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import perf
+
+# メモリの計測 (既定では無効。有効な間は tracemalloc が全ての確保を追うので、ゲームは数倍遅くなる)
+# perf の区間 (update/draw のフレーム、computer_move などの @perf.timed) ごとに、区間の中で増えたまま残った量 (net) と
+# 区間の中での使用量の最大の増分 (peak) を KiB でローリングに保持する。フレームごとの量は update と draw、
+# コンピュータの1手ごとの量は computer_move (リバーシ) を見る
+# 終了時のスナップショットで、計測中に確保されてまだ残っている量を、確保したファイルのサブシステム
+# (reversi, poker, dogrun, fifteen, ...) ごとに出す (フレームをまたいで増え続けるものを探す)
+# 区間ごとの peak の予算は memory-budgets.json に書く。"<ゲーム>.<区間>" の予算があればそちらを使う
+# (bench.py --memory と input_log.py --memory は予算を超えたら終了コード 1)
+# F7: 計測の開始/終了 (終了時に表示して memory-<game>-<日時>.json に書き出す)
+BUDGETS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "memory-budgets.json")
+FRAMES = 1 # 確保した場所として覚えるスタックの深さ (深くするほど遅くなる)
+
+# ファイル名の先頭 -> サブシステム (このリポジトリの中で当てはまらないものは common、外は python)
+SUBSYSTEMS = ("reversi", "poker", "dogrun", "fifteen")
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def subsystem(filename):
+    if os.path.dirname(os.path.abspath(filename)) != REPO_DIR:
+        return "python"
+    name = os.path.basename(filename)
+    for prefix in SUBSYSTEMS:
+        if name.startswith(prefix):
+            return prefix
+    return "common"
+
+def by_subsystem(snapshot):
+    """スナップショットの確保中のバイト数をサブシステムごとに合計する"""
+    totals = {}
+    for stat in snapshot.statistics("filename"):
+        key = subsystem(stat.traceback[0].filename)
+        totals[key] = totals.get(key, 0) + stat.size
+    return totals
+
+def snapshot():
+    """計測自体 (tracemalloc と perf の履歴) の確保を除いたスナップショット"""
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, perf.__file__),
+        tracemalloc.Filter(False, __file__),
+    ))
+
+def load_budgets(path=BUDGETS_FILE):
+    """区間またはベンチマークの名前 -> peak の上限 (KiB)。ファイルが無ければ予算なし"""
+    try:
+        with open(path) as f:
+            return {name: value for name, value in json.load(f).items() if not name.startswith("_")}
+    except FileNotFoundError:
+        return {}
+
+class MemorySection:
+    """perf の区間を包み、区間の中の net と peak を記録する"""
+    __slots__ = ('tracker', 'name', 'inner', 'start', 'peak')
+
+    def __init__(self, tracker, name, inner):
+        self.tracker, self.name, self.inner = tracker, name, inner
+
+    def __enter__(self):
+        self.tracker.enter(self)
+        self.inner.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self.inner.__exit__(*exc)
+        self.tracker.exit(self)
+        return False
+
+class MemoryTracker:
+    """tracemalloc を動かしている間の区間ごとの確保量"""
+    def __init__(self, game="game", budgets=None):
+        self.game = game
+        self.budgets = load_budgets() if budgets is None else budgets
+        self.net = {}    # 区間名 -> perf.Histogram (KiB)
+        self.peak = {}
+        self.stack = []  # 入れ子になっている区間
+        self.started_here = not tracemalloc.is_tracing()
+        if self.started_here:
+            tracemalloc.start(FRAMES)
+        self.start_time = time.perf_counter()
+        # 計測の前から tracemalloc が動いていたときは、その時点で確保済みの分を差し引く
+        self.baseline = {} if self.started_here else by_subsystem(snapshot())
+
+    def close(self):
+        if self.started_here:
+            tracemalloc.stop()
+
+    def wrap(self, name, inner):
+        return MemorySection(self, name, inner)
+
+    def enter(self, section):
+        current, peak = tracemalloc.get_traced_memory()
+        for outer in self.stack: # reset_peak で外側の区間の peak が消える前に写しておく
+            outer.peak = max(outer.peak, peak)
+        tracemalloc.reset_peak()
+        section.start = section.peak = current
+        self.stack.append(section)
+
+    def exit(self, section):
+        current, peak = tracemalloc.get_traced_memory()
+        for open_section in self.stack:
+            open_section.peak = max(open_section.peak, peak)
+        self.stack.remove(section)
+        self.record(section.name, current - section.start, section.peak - section.start)
+
+    def record(self, name, net, peak):
+        if name not in self.net:
+            self.net[name], self.peak[name] = perf.Histogram(), perf.Histogram()
+        self.net[name].add(net / 1024)
+        self.peak[name].add(peak / 1024)
+
+    def budget(self, name):
+        return self.budgets.get(f"{self.game}.{name}", self.budgets.get(name))
+
+    def stats(self):
+        """区間名 -> {"peak": peak の要約, "net": net の要約, "budget": 予算 (KiB) か None}"""
+        return {name: {"peak": self.peak[name].summary(), "net": self.net[name].summary(),
+                       "budget": self.budget(name)}
+                for name in sorted(self.net)}
+
+    def over_budget(self):
+        """最大の peak が予算を超えた区間名のリスト"""
+        return [name for name, s in self.stats().items() if s["budget"] is not None and s["peak"]["max"] > s["budget"]]
+
+    def subsystems(self):
+        """サブシステム -> 計測を始めてから増えた KiB"""
+        now = by_subsystem(snapshot())
+        return {key: (now.get(key, 0) - self.baseline.get(key, 0)) / 1024 for key in sorted(set(now) | set(self.baseline))}
+
+    def report(self):
+        print(f"memory over {time.perf_counter() - self.start_time:.1f}s (KiB)")
+        print(f"  {'section':<16}{'count':>7}{'peak p50':>10}{'p95':>8}{'max':>8}{'net p50':>9}{'max':>8}{'budget':>8}")
+        over = self.over_budget()
+        for name, s in self.stats().items():
+            peak, net = s["peak"], s["net"]
+            budget = "-" if s["budget"] is None else f"{s['budget']:g}"
+            print(f"  {name:<16}{peak['count']:7d}{peak['p50']:10.1f}{peak['p95']:8.1f}{peak['max']:8.1f}"
+                  f"{net['p50']:9.1f}{net['max']:8.1f}{budget:>8}{'  OVER' if name in over else ''}")
+        print(f"  {'subsystem':<16}{'growth':>10}")
+        for key, growth in self.subsystems().items():
+            print(f"  {key:<16}{growth:+10.1f}")
+
+    def dump(self):
+        basename = f"memory-{self.game}-{time.strftime('%Y%m%d-%H%M%S')}"
+        report = {
+            "game": self.game,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "sections": self.stats(),
+            "subsystem_growth_kib": self.subsystems(),
+            "over_budget": self.over_budget(),
+        }
+        with open(basename + ".json", "w") as f:
+            json.dump(report, f, indent=2)
+        return basename
+
+def toggle(profiler=perf.profiler):
+    """計測を始める。計測中なら止めて、結果を表示して書き出す"""
+    tracker = profiler.memory
+    if tracker is None:
+        profiler.memory = MemoryTracker(profiler.game)
+        print("memory tracking on (F7 to stop)")
+        return
+    profiler.memory = None
+    tracker.report()
+    print(f"wrote {tracker.dump()}.json")
+    tracker.close()
+
+def measure_call(func, state=None, repeat=3, warmup=True):
+    """func(state) を1回呼んで温めてから repeat 回呼び、1回あたりの最大の peak と net (KiB)、
+    最後の1回でサブシステムごとに増えた量 (KiB) を返す (ベンチマークの --memory 用)"""
+    if warmup:
+        func(state) # 遅延 import や lru_cache の初回の確保を除く
+    tracker = MemoryTracker(budgets={})
+    try:
+        before = None
+        for i in range(repeat):
+            if i == repeat - 1:
+                before = snapshot()
+            with tracker.wrap("call", perf.NULL_SECTION):
+                func(state)
+        growth = {}
+        for stat in snapshot().compare_to(before, "filename"):
+            if stat.size_diff:
+                key = subsystem(stat.traceback[0].filename)
+                growth[key] = growth.get(key, 0) + stat.size_diff / 1024
+        stats = tracker.stats()["call"]
+        return {"peak_kib": stats["peak"]["max"], "net_kib": stats["net"]["max"],
+                "subsystems_kib": {key: round(value, 1) for key, value in sorted(growth.items()) if abs(value) >= 0.1}}
+    finally:
+        tracker.close()
@@ -0,0 +1,181 @@
+import csv
+import functools
+import json
+import sys
+import time
+from collections import deque
+
+import pyxel
+
+# 全ゲーム共通の計測レイヤー
+# update/draw と名前付きのホットセクションの所要時間を直近 WINDOW サンプル分保持し、p50/p95/p99 を出す
+# F9: オーバーレイ表示の切替 / F10: JSON と CSV に書き出し / F7: メモリの計測の開始/終了 (memtrack.py)
+WINDOW = 600 # 30fps で約20秒分
+
+class Histogram:
+    """直近の計測値 (ミリ秒) をローリングで保持する"""
+    __slots__ = ('samples', 'count', 'total_ms')
+
+    def __init__(self, window=WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total_ms = 0.0
+
+    def add(self, ms):
+        self.samples.append(ms)
+        self.count += 1
+        self.total_ms += ms
+
+    def summary(self):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {"count": self.count, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0, "mean": 0.0}
+        def percentile(p):
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+        return {
+            "count": self.count,
+            "p50": percentile(0.50),
+            "p95": percentile(0.95),
+            "p99": percentile(0.99),
+            "max": ordered[-1],
+            "mean": sum(ordered) / len(ordered),
+        }
+
+class Section:
+    """with perf.section("name"): で囲んだ区間の時間を計る"""
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.add((time.perf_counter() - self.start) * 1000)
+        return False
+
+class NullSection:
+    __slots__ = ()
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+NULL_SECTION = NullSection()
+
+class Profiler:
+    def __init__(self):
+        self.enabled = True
+        self.show_overlay = False
+        self.game = "game"
+        self.histograms = {}
+        self.memory = None # memtrack.MemoryTracker (メモリの計測中だけ)
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        return histogram
+
+    def section(self, name):
+        if not self.enabled:
+            return NULL_SECTION
+        section = Section(self.histogram(name))
+        return self.memory.wrap(name, section) if self.memory else section
+
+    def timed(self, name):
+        """関数・メソッド全体を計測するデコレーター"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                if self.memory:
+                    with self.section(name):
+                        return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.histogram(name).add((time.perf_counter() - start) * 1000)
+            return wrapper
+        return decorator
+
+    def instrument(self, game, update, draw):
+        """pyxel.run に渡す update/draw を計測付きのものに包む"""
+        self.game = game
+        def timed_update():
+            if pyxel.btnp(pyxel.KEY_F9):
+                self.show_overlay = not self.show_overlay
+            if pyxel.btnp(pyxel.KEY_F10):
+                self.dump()
+            if pyxel.btnp(pyxel.KEY_F7):
+                import memtrack # tracemalloc は計測するときだけ読み込む
+                memtrack.toggle(self)
+            with self.section("update"):
+                update()
+        def timed_draw():
+            with self.section("draw"):
+                draw()
+            if self.show_overlay:
+                self.draw_overlay()
+        return timed_update, timed_draw
+
+    def stats(self):
+        return {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}
+
+    def draw_overlay(self, x=1, y=1):
+        stats = self.stats()
+        pyxel.rect(x, y, 31 * 4 + 2, (len(stats) + 1) * 7 + 2, 0)
+        pyxel.text(x + 1, y + 1, f"{'SECTION':<10}{'P50':>6}{'P95':>6}{'P99':>6} ms", 10)
+        for i, (name, s) in enumerate(stats.items()):
+            line = f"{name[:10]:<10}{s['p50']:6.2f}{s['p95']:6.2f}{s['p99']:6.2f}"
+            pyxel.text(x + 1, y + 8 + i * 7, line, 7)
+
+    def dump(self, basename=None):
+        """統計を JSON と CSV に書き出す (ビルド間の比較用)"""
+        basename = basename or f"perf-{self.game}-{time.strftime('%Y%m%d-%H%M%S')}"
+        stats = self.stats()
+        report = {
+            "game": self.game,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "pyxel": getattr(pyxel, "VERSION", ""),
+            "sections": stats,
+        }
+        with open(basename + ".json", "w") as f:
+            json.dump(report, f, indent=2)
+        with open(basename + ".csv", "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["section", "count", "p50", "p95", "p99", "max", "mean"])
+            for name, s in stats.items():
+                writer.writerow([name, s["count"], f"{s['p50']:.4f}", f"{s['p95']:.4f}", f"{s['p99']:.4f}",
+                                 f"{s['max']:.4f}", f"{s['mean']:.4f}"])
+        return basename
+
+profiler = Profiler()
+section = profiler.section
+timed = profiler.timed
+instrument = profiler.instrument
+
+def compare(old_path, new_path):
+    """2つの JSON ダンプのセクションごとの p50/p95/p99 を比較して表示する"""
+    with open(old_path) as f:
+        old = json.load(f)["sections"]
+    with open(new_path) as f:
+        new = json.load(f)["sections"]
+    print(f"{'section':<24}{'p50':>18}{'p95':>18}{'p99':>18}")
+    for name in sorted(set(old) | set(new)):
+        cells = []
+        for key in ("p50", "p95", "p99"):
+            a, b = old.get(name, {}).get(key), new.get(name, {}).get(key)
+            if a is None or b is None:
+                cells.append(f"{'-':>18}")
+            else:
+                change = (b - a) / a * 100 if a else 0.0
+                cells.append(f"{b:9.3f} ({change:+5.0f}%)")
+        print(f"{name:<24}" + "".join(cells))
+
+if __name__ == "__main__":
+    # python perf.py OLD.json NEW.json
+    compare(sys.argv[1], sys.argv[2])
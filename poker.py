@@ -1,7 +1,15 @@
+import itertools
 import pyxel
 import random
+import time
 from enum import Enum
 
+import asset_cache
+import input_log
+import perf
+import poker_history
+import redraw
+
 # --- Core Card Game Classes ---
 
 class Suit(Enum):
@@ -26,6 +34,7 @@ class Rank(Enum):
     QUEEN = 12
     KING = 13
     ACE = 14
+    JOKER = 15 # ジョーカーポーカーだけで使う (スートは BLACK)
 
 class Card:
     """1枚のカードを表すクラス"""
@@ -44,15 +53,31 @@ class Card:
     def __hash__(self):
         return hash((self.rank, self.suit))
 
+class Variant(Enum):
+    """ゲームの種類。ジョーカーポーカーは53枚目のジョーカー、デュースワイルドは2のカードが何にでもなる"""
+    STANDARD = "Standard"
+    JOKER_POKER = "Joker Poker"
+    DEUCES_WILD = "Deuces Wild"
+
+# ワイルドカード (どのカードの代わりにもなる) のランク
+WILD_RANKS = {
+    Variant.STANDARD: (),
+    Variant.JOKER_POKER: (Rank.JOKER,),
+    Variant.DEUCES_WILD: (Rank.TWO,),
+}
+
 class Deck:
-    """52枚のカードのデッキを表すクラス"""
-    def __init__(self):
-        self.cards = [Card(rank, suit) for suit in Suit for rank in Rank]
+    """52枚 (ジョーカーポーカーではジョーカーを足した53枚) のカードのデッキを表すクラス"""
+    def __init__(self, rng=random, variant=Variant.STANDARD):
+        self.cards = [Card(rank, suit) for suit in Suit for rank in Rank if rank is not Rank.JOKER]
+        if variant == Variant.JOKER_POKER:
+            self.cards.append(Card(Rank.JOKER, Suit.BLACK))
+        self.rng = rng
         self.shuffle()
 
     def shuffle(self):
         """デッキをシャッフルする"""
-        random.shuffle(self.cards)
+        self.rng.shuffle(self.cards)
 
     def deal(self, num_cards: int):
         """指定された枚数のカードを配る"""
@@ -71,12 +96,92 @@ class HandRank(Enum):
     FULL_HOUSE = 6
     FOUR_OF_A_KIND = 7
     STRAIGHT_FLUSH = 8
-    ROYAL_FLUSH = 9
+    FIVE_OF_A_KIND = 9 # ワイルドカードがあるときだけできる
+    ROYAL_FLUSH = 10
+
+# --- Hand evaluation tables ---
+# 役の判定は表を1回引くだけにする。キーはワイルドカード以外のカードのランクに対応する素数の積で、
+# 並び順に関係なくランクの組 (重複あり) ごとに一意になる。ワイルドカードは素数 1 として掛けるので、
+# 0〜5枚のワイルドカードを含む手札も同じ表の同じ引き方で済む (ワイルドの最善の使い方は表を作るときに決める)
+# フラッシュになり得る手札 (ワイルド以外のスートがすべて同じ) は SUITED_HANDS の方を引く
+RANK_PRIMES = [0, 0, 2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 1] # ランクの値 -> 素数 (ジョーカーは常に 1)
+VARIANT_PRIMES = {variant: [1 if any(rank.value == i for rank in WILD_RANKS[variant]) else prime
+                            for i, prime in enumerate(RANK_PRIMES)]
+                  for variant in Variant}
+
+def rank_key(ranks):
+    key = 1
+    for rank in ranks:
+        key *= RANK_PRIMES[rank]
+    return key
+
+def evaluate_five(ranks, suited):
+    """5枚のランク (大きい順) の役とキッカー。suited ならすべて同じスート"""
+    counts = {}
+    for rank in ranks:
+        counts[rank] = counts.get(rank, 0) + 1
+    # (枚数, ランク) の大きい順: フォーカードなら [4枚のランク, キッカー] の順になる
+    groups = sorted(counts, key=lambda rank: (counts[rank], rank), reverse=True)
+    shape = sorted(counts.values(), reverse=True)
+    straight = None
+    if len(counts) == 5:
+        if ranks[0] - ranks[4] == 4: # 通常のストレート
+            straight = tuple(ranks)
+        elif tuple(ranks) == (14, 5, 4, 3, 2): # A,2,3,4,5 のストレートはAを1として扱う
+            straight = (5, 4, 3, 2, 1)
+
+    if shape[0] == 5:
+        return HandRank.FIVE_OF_A_KIND, (ranks[0],)
+    if straight and suited:
+        if straight[0] == 14: # ロイヤルフラッシュ (10, J, Q, K, A)
+            return HandRank.ROYAL_FLUSH, ()
+        return HandRank.STRAIGHT_FLUSH, straight
+    if shape[0] == 4:
+        return HandRank.FOUR_OF_A_KIND, tuple(groups)
+    if shape[:2] == [3, 2]:
+        return HandRank.FULL_HOUSE, tuple(groups)
+    if suited:
+        return HandRank.FLUSH, tuple(ranks)
+    if straight:
+        return HandRank.STRAIGHT, straight
+    if shape[0] == 3:
+        return HandRank.THREE_OF_A_KIND, tuple(groups)
+    if shape[:2] == [2, 2]:
+        return HandRank.TWO_PAIR, tuple(groups)
+    if shape[0] == 2:
+        return HandRank.ONE_PAIR, tuple(groups)
+    return HandRank.HIGH_CARD, tuple(ranks)
+
+def build_hand_tables():
+    """(HANDS, SUITED_HANDS) を作る。値は (役, キッカー)
+    5枚の組は直接判定し、4枚以下の組は残りのワイルドカードの1枚をどれかのランクにした (1枚多い) 組のうち最善のもの"""
+    hands, suited_hands = {}, {}
+    strength = lambda entry: (entry[0].value, entry[1])
+    all_ranks = range(14, 1, -1)
+    for size in range(5, -1, -1):
+        for ranks in itertools.combinations_with_replacement(all_ranks, size):
+            key = rank_key(ranks)
+            distinct = len(set(ranks)) == size
+            if size == 5:
+                hands[key] = evaluate_five(ranks, False)
+                suited_hands[key] = evaluate_five(ranks, True) if distinct else hands[key]
+                continue
+            hands[key] = max((hands[key * RANK_PRIMES[r]] for r in all_ranks), key=strength)
+            if distinct:
+                # すでにあるランクにしたワイルドはスートが揃わない (同じランクの同じスートは無い)
+                suited_hands[key] = max(((hands if r in ranks else suited_hands)[key * RANK_PRIMES[r]] for r in all_ranks),
+                                        key=strength)
+            else:
+                suited_hands[key] = hands[key]
+    return hands, suited_hands
+
+HANDS, SUITED_HANDS = build_hand_tables()
 
 class Hand:
     """プレイヤーの手札を表すクラス"""
-    def __init__(self, cards: list[Card] = None):
+    def __init__(self, cards: list[Card] = None, variant=Variant.STANDARD):
         self.cards = sorted(cards, key=lambda card: card.rank.value) if cards else []
+        self.variant = variant
 
     def add_cards(self, new_cards: list[Card]):
         """手札にカードを追加する"""
@@ -91,57 +196,21 @@ class Hand:
             else:
                 raise ValueError(f"Card {card} not in hand.")
 
-    def evaluate_hand(self) -> tuple[HandRank, list[int]]:
-        """手札の役を判定し、役の強さとキッカーを返す"""
-        ranks = [card.rank.value for card in self.cards]
-        suits = [card.suit for card in self.cards]
-
-        # 各ランクの出現回数をカウント
-        rank_counts = {rank: ranks.count(rank) for rank in set(ranks)}
-        counts = list(rank_counts.values())
-        unique_ranks = sorted(list(set(ranks)), reverse=True)
-
-        is_flush = len(set(suits)) == 1
-        is_straight = False
-        # ストレート判定 (A,2,3,4,5 の場合も考慮)
-        if len(unique_ranks) == 5:
-            if unique_ranks[0] - unique_ranks[4] == 4: # 通常のストレート
-                is_straight = True
-            elif set(unique_ranks) == {14, 2, 3, 4, 5}: # A,2,3,4,5 のストレート
-                is_straight = True
-                unique_ranks = [5, 4, 3, 2, 1] # 役の強さとしてAを5として扱う
-
-        # 役の判定
-        if is_straight and is_flush:
-            if unique_ranks[0] == 14 and unique_ranks[1] == 13: # ロイヤルフラッシュ (10, J, Q, K, A)
-                return HandRank.ROYAL_FLUSH, []
-            return HandRank.STRAIGHT_FLUSH, unique_ranks # ストレートフラッシュ
-        elif 4 in counts:
-            four_of_a_kind_rank = [rank for rank, count in rank_counts.items() if count == 4][0]
-            kicker = [rank for rank, count in rank_counts.items() if count == 1]
-            return HandRank.FOUR_OF_A_KIND, [four_of_a_kind_rank] + kicker # フォーカード
-        elif 3 in counts and 2 in counts:
-            three_of_a_kind_rank = [rank for rank, count in rank_counts.items() if count == 3][0]
-            pair_rank = [rank for rank, count in rank_counts.items() if count == 2][0]
-            return HandRank.FULL_HOUSE, [three_of_a_kind_rank, pair_rank] # フルハウス
-        elif is_flush:
-            return HandRank.FLUSH, unique_ranks # フラッシュ
-        elif is_straight:
-            return HandRank.STRAIGHT, unique_ranks # ストレート
-        elif 3 in counts:
-            three_of_a_kind_rank = [rank for rank, count in rank_counts.items() if count == 3][0]
-            kicker = [rank for rank, count in rank_counts.items() if count == 1]
-            return HandRank.THREE_OF_A_KIND, [three_of_a_kind_rank] + kicker # スリーカード
-        elif counts.count(2) == 2:
-            pair_ranks = sorted([rank for rank, count in rank_counts.items() if count == 2], reverse=True)
-            kicker = [rank for rank, count in rank_counts.items() if count == 1]
-            return HandRank.TWO_PAIR, pair_ranks + kicker # ツーペア
-        elif 2 in counts:
-            pair_rank = [rank for rank, count in rank_counts.items() if count == 2][0]
-            kicker = [rank for rank, count in rank_counts.items() if count == 1]
-            return HandRank.ONE_PAIR, [pair_rank] + kicker # ワンペア
-        else:
-            return HandRank.HIGH_CARD, unique_ranks # ハイカード
+    @perf.timed("evaluate_hand")
+    def evaluate_hand(self) -> tuple[HandRank, tuple[int, ...]]:
+        """手札の役を判定し、役の強さとキッカーを返す (ワイルドカードは最も強くなるように使う)"""
+        primes = VARIANT_PRIMES[self.variant]
+        key, suit, suited = 1, None, True
+        for card in self.cards:
+            prime = primes[card.rank.value]
+            if prime == 1: # ワイルドカード
+                continue
+            key *= prime
+            if suit is None:
+                suit = card.suit
+            elif card.suit != suit:
+                suited = False
+        return (SUITED_HANDS if suited else HANDS)[key]
 
 class Player:
     """ポーカーゲームのプレイヤーを表すクラス"""
@@ -162,29 +231,329 @@ class GameState(Enum):
     CONTINUE_OR_END_GAME = 5
     GAME_OVER_DISPLAY = 6
 
+# 役の配当倍率 (賭け金に対する倍率)。ワイルドカードのある種類は役ができやすい分、低い役の配当を下げる
+PAYOUT_MULTIPLIERS = {
+    Variant.STANDARD: {
+        HandRank.ROYAL_FLUSH: 250,
+        HandRank.STRAIGHT_FLUSH: 50,
+        HandRank.FOUR_OF_A_KIND: 25,
+        HandRank.FULL_HOUSE: 9,
+        HandRank.FLUSH: 6,
+        HandRank.STRAIGHT: 4,
+        HandRank.THREE_OF_A_KIND: 3,
+        HandRank.TWO_PAIR: 2,
+        HandRank.ONE_PAIR: 1, # ワンペアは賭け金が戻る (1倍)
+        HandRank.HIGH_CARD: 0  # ハイカードは配当なし
+    },
+    # ツーペア以上で配当
+    Variant.JOKER_POKER: {
+        HandRank.ROYAL_FLUSH: 250,
+        HandRank.FIVE_OF_A_KIND: 100,
+        HandRank.STRAIGHT_FLUSH: 50,
+        HandRank.FOUR_OF_A_KIND: 20,
+        HandRank.FULL_HOUSE: 8,
+        HandRank.FLUSH: 7,
+        HandRank.STRAIGHT: 5,
+        HandRank.THREE_OF_A_KIND: 2,
+        HandRank.TWO_PAIR: 1,
+    },
+    # スリーカード以上で配当
+    Variant.DEUCES_WILD: {
+        HandRank.ROYAL_FLUSH: 100,
+        HandRank.FIVE_OF_A_KIND: 15,
+        HandRank.STRAIGHT_FLUSH: 9,
+        HandRank.FOUR_OF_A_KIND: 5,
+        HandRank.FULL_HOUSE: 3,
+        HandRank.FLUSH: 2,
+        HandRank.STRAIGHT: 2,
+        HandRank.THREE_OF_A_KIND: 1,
+    },
+}
+
+# --- Card face atlas ---
+# 全カードの表面 (ランク x スート) と裏面を起動時に1枚の画像へ焼き込み、描画時はbltするだけにする
+CARD_W, CARD_H = 42, 56
+ATLAS_VERSION = "poker-2"
+
+def draw_card_face(dst, x, y, card=None, face_up=True, card_w=CARD_W, card_h=CARD_H):
+    """カードの絵柄を指定した画像 (画面またはアトラス) に描画する"""
+    # カードの枠
+    dst.rect(x, y, card_w, card_h, 7) # 白い枠
+    dst.rectb(x, y, card_w, card_h, 0) # 黒い縁
+
+    if face_up and card and card.rank == Rank.JOKER:
+        # ジョーカー: 3色の鈴と文字だけ
+        dst.text(x + 2, y + 2, "JK", 8)
+        for i, color in enumerate((8, 3, 1)):
+            dst.circ(x + 13 + i * 8, y + 20 - (i % 2) * 4, 2, color)
+        dst.text(x + (card_w - 20) // 2, y + card_h // 2 + 4, "JOKER", 0)
+    elif face_up and card:
+        # カードの数字とマーク
+        rank_str = str(card.rank.value) if card.rank.value <= 10 else card.rank.name[0]
+        
+        # スートの色を辞書でマッピング (色設定を変更)
+        # スペード:黒, ハート:赤, クローバー:緑, ダイヤ:青
+        suit_colors = {
+            Suit.BLACK: 0,  # Spade -> Black
+            Suit.RED: 8,    # Heart -> Red
+            Suit.BLUE: 3,   # Clover -> Green
+            Suit.GREEN: 1,  # Diamond -> Blue
+        }
+        suit_color = suit_colors[card.suit]
+
+        dst.text(x + 2, y + 2, rank_str, suit_color)
+        
+        # ドット絵を描画
+        # Large suit icon dimensions
+        w_large, h_large = 8, 8
+        # Small suit icon dimensions
+        w_small, h_small = 4, 4
+
+        # Get UV coordinates for large suit
+        u_large, v_large = 0, 0 # v_large is always 0
+        if card.suit == Suit.BLACK: # Spade
+            u_large = 8
+        elif card.suit == Suit.RED: # Heart
+            u_large = 16
+        elif card.suit == Suit.BLUE: # Clover
+            u_large = 24
+        elif card.suit == Suit.GREEN: # Diamond
+            u_large = 32
+
+        # Get UV coordinates for small suit
+        u_small, v_small = 0, 0 # v_small is always 8
+        if card.suit == Suit.BLACK: # Spade
+            u_small = 8
+            v_small = 8
+        elif card.suit == Suit.RED: # Heart
+            u_small = 16
+            v_small = 8
+        elif card.suit == Suit.BLUE: # Clover
+            u_small = 24
+            v_small = 8
+        elif card.suit == Suit.GREEN: # Diamond
+            u_small = 32
+            v_small = 8
+
+        # Define inner padding for pips
+        inner_padding_x = 8 # From left/right edge of card
+        inner_padding_y_top = 15 # Below rank text
+        inner_padding_y_bottom = 15 # From bottom edge of card
+
+        # Define common pip positions relative to card's (x, y)
+        x_left = x + inner_padding_x
+        x_right = x + card_w - inner_padding_x - w_small
+        x_center = x + (card_w - w_small) // 2
+
+        # Calculate available height for pips
+        available_pip_height = card_h - inner_padding_y_top - inner_padding_y_bottom - h_small
+
+        # Calculate y positions for 5 vertical sections, evenly distributed
+        y_pos_1 = y + inner_padding_y_top
+        y_pos_2 = y_pos_1 + available_pip_height // 4
+        y_pos_3 = y_pos_1 + available_pip_height // 2
+        y_pos_4 = y_pos_1 + (available_pip_height * 3) // 4
+        y_pos_5 = y + card_h - inner_padding_y_bottom - h_small
+
+        # Draw pips based on rank
+        if 2 <= card.rank.value <= 10:
+            pip_positions = []
+            if card.rank.value == 2:
+                pip_positions = [(x_center, y_pos_1), (x_center, y_pos_5)]
+            elif card.rank.value == 3:
+                pip_positions = [(x_center, y_pos_1), (x_center, y_pos_3), (x_center, y_pos_5)]
+            elif card.rank.value == 4:
+                pip_positions = [(x_left, y_pos_1), (x_right, y_pos_1), (x_left, y_pos_5), (x_right, y_pos_5)]
+            elif card.rank.value == 5:
+                pip_positions = [(x_left, y_pos_1), (x_right, y_pos_1), (x_center, y_pos_3), (x_left, y_pos_5), (x_right, y_pos_5)]
+            elif card.rank.value == 6:
+                pip_positions = [(x_left, y_pos_1), (x_right, y_pos_1), (x_left, y_pos_3), (x_right, y_pos_3), (x_left, y_pos_5), (x_right, y_pos_5)]
+            elif card.rank.value == 7:
+                # Dice 5 on top, two pips horizontally on bottom
+                pip_positions = [
+                    (x_left, y_pos_1), (x_right, y_pos_1),
+                    (x_center, y_pos_2),
+                    (x_left, y_pos_3), (x_right, y_pos_3),
+                    (x_left, y_pos_5), (x_right, y_pos_5)
+                ]
+            elif card.rank.value == 8:
+                pip_positions = [
+                    (x_left, y_pos_1), (x_right, y_pos_1),
+                    (x_left, y_pos_2), (x_right, y_pos_2),
+                    (x_left, y_pos_4), (x_right, y_pos_4),
+                    (x_left, y_pos_5), (x_right, y_pos_5)
+                ]
+            elif card.rank.value == 9:
+                # Dice 5 on top, Dice 4 on bottom
+                pip_positions = [
+                    (x_left, y_pos_1), (x_right, y_pos_1),
+                    (x_center, y_pos_2),
+                    (x_left, y_pos_3), (x_right, y_pos_3),
+                    (x_left, y_pos_4), (x_right, y_pos_4),
+                    (x_left, y_pos_5), (x_right, y_pos_5)
+                ]
+            elif card.rank.value == 10:
+                # Two dice 5s, one above the other
+                # Top dice 5 section
+                top_section_y_start = y + inner_padding_y_top
+                top_section_y_end = y + card_h // 2 - h_small // 2 - 2 # Small gap in the middle
+                
+                y_top_dice5_p1 = top_section_y_start
+                y_top_dice5_p2 = top_section_y_start + (top_section_y_end - top_section_y_start) // 2
+                y_top_dice5_p3 = top_section_y_end
+
+                # Bottom dice 5 section
+                bottom_section_y_start = y + card_h // 2 + h_small // 2 + 2 # Small gap in the middle
+                bottom_section_y_end = y + card_h - inner_padding_y_bottom - h_small
+
+                y_bottom_dice5_p1 = bottom_section_y_start
+                y_bottom_dice5_p2 = bottom_section_y_start + (bottom_section_y_end - bottom_section_y_start) // 2
+                y_bottom_dice5_p3 = bottom_section_y_end
+
+                pip_positions = [
+                    # Top dice 5
+                    (x_left, y_top_dice5_p1), (x_right, y_top_dice5_p1),
+                    (x_center, y_top_dice5_p2),
+                    (x_left, y_top_dice5_p3), (x_right, y_top_dice5_p3),
+                    # Bottom dice 5
+                    (x_left, y_bottom_dice5_p1), (x_right, y_bottom_dice5_p1),
+                    (x_center, y_bottom_dice5_p2),
+                    (x_left, y_bottom_dice5_p3), (x_right, y_bottom_dice5_p3)
+                ]
+
+            for px, py in pip_positions:
+                dst.blt(px, py, 0, u_small, v_small, w_small, h_small, 7)
+        else: # A, J, Q, K
+            w_face, h_face = 0, 0
+            u_face, v_face = 0, 0 # Initialize face card UV
+
+            if card.rank == Rank.ACE:
+                # Draw large suit icon in the center for Ace
+                w_face, h_face = 8, 8
+                u_face = u_large
+                v_face = v_large
+            else: # J, Q, K
+                w_face, h_face = 16, 16 # Face card image dimensions
+                # Set v_face based on rank
+                if card.rank == Rank.KING:
+                    v_face = 40
+                elif card.rank == Rank.QUEEN:
+                    v_face = 56
+                elif card.rank == Rank.JACK:
+                    v_face = 72
+                
+                # Set u_face based on suit
+                if card.suit == Suit.BLACK: # Spade
+                    u_face = 0
+                elif card.suit == Suit.RED: # Heart
+                    u_face = 16
+                elif card.suit == Suit.BLUE: # Clover
+                    u_face = 32
+                elif card.suit == Suit.GREEN: # Diamond
+                    u_face = 48
+
+            dst.blt(x + (card_w - w_face) // 2, y + (card_h - h_face) // 2, 0, u_face, v_face, w_face, h_face, 7)
+    else:
+        # カードの裏面
+        dst.rect(x + 1, y + 1, card_w - 2, card_h - 2, 1) # 青い裏面
+        dst.line(x + 2, y + 2, x + card_w - 3, y + card_h - 3, 0)
+        dst.line(x + card_w - 3, y + 2, x + 2, y + card_h - 3, 0)
+
+SUIT_ROWS = {suit: i for i, suit in enumerate(Suit)}
+# アトラスに焼き込むカード (ジョーカーは BLACK の行の最後の列)
+ALL_CARDS = [Card(rank, suit) for suit in Suit for rank in Rank if rank is not Rank.JOKER] + [Card(Rank.JOKER, Suit.BLACK)]
+
+def card_code(card):
+    """ハンド履歴に書くカードの番号 (1バイト、0 は「カード無し」に使う)"""
+    return card.rank.value * 4 + SUIT_ROWS[card.suit]
+
+def card_atlas_uv(card, face_up=True):
+    """アトラス上のカード画像の位置 (列: ランク, 行: スート, 最終行: 裏面)"""
+    if not face_up or card is None:
+        return 0, len(Suit) * CARD_H
+    return (card.rank.value - 2) * CARD_W, SUIT_ROWS[card.suit] * CARD_H
+
+def bake_card_atlas(img):
+    for card in ALL_CARDS:
+        u, v = card_atlas_uv(card)
+        draw_card_face(img, u, v, card)
+    u, v = card_atlas_uv(None, False)
+    draw_card_face(img, u, v, None, False)
+
+class DrawCounter:
+    """描画先の画像をラップして、描画命令の呼び出し回数を数える"""
+    def __init__(self, img):
+        self.img = img
+        self.calls = 0
+
+    def __getattr__(self, name):
+        method = getattr(self.img, name)
+        def counted(*args, **kwargs):
+            self.calls += 1
+            return method(*args, **kwargs)
+        setattr(self, name, counted) # 次回からは__getattr__を通らない
+        return counted
+
+def load_atlas(rebuild=False):
+    return asset_cache.load_atlas("poker", "poker.pyxres", ATLAS_VERSION,
+                                  len(Rank) * CARD_W, (len(Suit) + 1) * CARD_H, bake_card_atlas, rebuild)
+
 # --- Main Poker Game Class ---
 
+SCREEN_WIDTH, SCREEN_HEIGHT = 255, 127
+
 class App:
-    def __init__(self):
-        self.screen_w = 255
-        self.screen_h = 127
-        pyxel.init(self.screen_w, self.screen_h, title="Poker")
+    def __init__(self, standalone=True, seed=None, replay=None):
+        """standalone=False の場合は pyxel の初期化と実行をランチャーに任せる
+        replay に input_log.InputLog を渡すと、その記録の乱数の種と成績から始める"""
+        self.screen_w = SCREEN_WIDTH
+        self.screen_h = SCREEN_HEIGHT
+        if standalone:
+            pyxel.init(self.screen_w, self.screen_h, title="Poker")
 
         # Card dimensions
-        self.card_w = 42
-        self.card_h = 56
+        self.card_w = CARD_W
+        self.card_h = CARD_H
         self.card_spacing = 5 # Space between cards
-        pyxel.load("poker.pyxres")
-
-        # ゲームの初期化
-        self.deck = Deck()
+        self.card_atlas = load_atlas()
+
+        # (rank, suit, face_up, is_selected) -> アトラス上の位置と縦オフセット
+        self.card_faces = {}
+        for card in ALL_CARDS:
+            for is_selected in (False, True):
+                self.card_faces[(card.rank, card.suit, True, is_selected)] = card_atlas_uv(card) + (-5 if is_selected else 0,)
+        for is_selected in (False, True):
+            self.card_faces[(None, None, False, is_selected)] = card_atlas_uv(None, False) + (-5 if is_selected else 0,)
+
+        # 手札5枚の描画位置 (画面中央に横に並べる)
+        hand_total_width = self.card_w * 5 + self.card_spacing * 4 # 5枚のカードと4つのスペースの合計幅
+        hand_start_x = (self.screen_w - hand_total_width) // 2
+        self.hand_slot_x = [hand_start_x + i * (self.card_w + self.card_spacing) for i in range(5)]
+        self.hand_y = (self.screen_h - self.card_h) // 2
+
+        # 描画統計 (Fキーで表示切替、Cキーでカードキャッシュの有効/無効を切替)
+        self.gfx = DrawCounter(pyxel.screen)
+        self.use_card_cache = True
+        self.show_draw_stats = False
+        self.draw_calls = 0       # 直前のフレームの描画命令数
+        self.frame_time_ms = 0.0  # drawにかかった時間 (指数移動平均)
+        self.redraw = redraw.RedrawGate()
+
+        # ゲームの初期化 (カードはゲームごとの乱数で配る。記録した入力で再生できるように)
+        seed, self.stats, self.input_log = input_log.session("poker", seed, replay)
+        self.rng = random.Random(seed)
+        self.ticks = 0 # step を呼んだ回数
+        self.variant = Variant.STANDARD
+        self.deck = Deck(self.rng)
         
-        # プレイヤーの作成
-        self.player = Player("You", 100)
+        # プレイヤーの作成 (チップと前回の配当は前回の続きから)
+        self.player = Player("You", self.stats.get("chips", 100))
         self.players = [self.player]
 
         # 選択されたカードのインデックス
         self.selected_cards_indices = []
+        self.initial_cards = [] # 配られたときの手札 (ハンド履歴用)
+        self.history = None     # ハンド履歴の記録先 (最初のショーダウンで開く)
 
         # ゲームの状態
         self.game_state = GameState.START_SCREEN
@@ -194,7 +563,7 @@ class App:
         self.min_bet = 10     # 最小賭け金
         self.max_bet = 100    # 最大賭け金
         self.bet_step = 10    # 賭け金増減ステップ
-        self.last_payout = 0  # 前のハンドでの配当を保存
+        self.last_payout = self.stats.get("last_payout", 0) # 前のハンドでの配当を保存
 
         # 賭け金変更の連続入力用タイマー
         self.bet_change_timer = 0
@@ -209,27 +578,27 @@ class App:
         self.game_over_display_duration = 60 * 3 # 3秒間表示
 
         # 役の配当倍率 (例: 賭け金に対する倍率)
-        self.payout_multipliers = {
-            HandRank.ROYAL_FLUSH: 250,
-            HandRank.STRAIGHT_FLUSH: 50,
-            HandRank.FOUR_OF_A_KIND: 25,
-            HandRank.FULL_HOUSE: 9,
-            HandRank.FLUSH: 6,
-            HandRank.STRAIGHT: 4,
-            HandRank.THREE_OF_A_KIND: 3,
-            HandRank.TWO_PAIR: 2,
-            HandRank.ONE_PAIR: 1, # ワンペアは賭け金が戻る (1倍)
-            HandRank.HIGH_CARD: 0  # ハイカードは配当なし
-        }
+        self.payout_multipliers = PAYOUT_MULTIPLIERS[self.variant]
 
         self.reset_full_game()
-        pyxel.run(self.update, self.draw)
+        if standalone:
+            pyxel.run(*perf.instrument("poker", self.update, self.draw))
+
+    def resume(self):
+        """ランチャーで画面サイズが変わった後に描画先を取り直す"""
+        self.gfx = DrawCounter(pyxel.screen)
+        self.redraw.invalidate()
+
+    def set_variant(self, variant):
+        """ゲームの種類を変える (デッキと配当は次のハンドから)"""
+        self.variant = variant
+        self.payout_multipliers = PAYOUT_MULTIPLIERS[variant]
 
     def reset_hand(self):
         """各ハンドの開始時にゲームの状態をリセットする"""
-        self.deck = Deck()
+        self.deck = Deck(self.rng, self.variant)
         for p in self.players:
-            p.hand = Hand() # 手札をリセット
+            p.hand = Hand(variant=self.variant) # 手札をリセット
         self.selected_cards_indices = []
         # 前のハンドで配当があった場合、それを次の賭け金の初期値とする
         if self.last_payout > 0:
@@ -240,9 +609,9 @@ class App:
 
     def reset_full_game(self):
         # ゲームの状態を初期化する処理をここに書きます
-        self.deck = Deck()
+        self.deck = Deck(self.rng, self.variant)
         for p in self.players:
-            p.hand = Hand() # 手札をリセット
+            p.hand = Hand(variant=self.variant) # 手札をリセット
         self.selected_cards_indices = []
         self.current_bet = self.min_bet # 初期化
 
@@ -252,230 +621,89 @@ class App:
         else:
             self.game_state = GameState.START_SCREEN # リセット後、START_SCREENへ
 
+    def save_stats(self):
+        """チップと配当を保存する (書き込みは stats_store がフレームの外でまとめて行う)"""
+        self.stats.record(chips=self.player.chips, last_payout=self.last_payout)
+
+    @perf.timed("save_hand")
+    def save_hand(self, rank, payout):
+        """ショーダウンしたハンドを履歴に追記する。書き込めない環境と入力の再生中は記録しない"""
+        if self.input_log.replaying:
+            return
+        cards = self.player.hand.cards
+        held = sum(1 << i for i, (card, first) in enumerate(zip(cards, self.initial_cards)) if card is first)
+        drawn = [0 if held >> i & 1 else card_code(card) for i, card in enumerate(cards)]
+        try:
+            if self.history is None:
+                self.history = poker_history.HandHistory()
+            self.history.append([card_code(card) for card in self.initial_cards], held, drawn, rank.value,
+                                list(Variant).index(self.variant), self.current_bet, payout)
+        except OSError:
+            pass
+
     def _deal_initial_cards(self):
         """ゲーム開始時に各プレイヤーにカードを配る"""
         for p in self.players:
             p.hand.add_cards(self.deck.deal(5))
 
     def _draw_card(self, x, y, card=None, face_up=True, is_selected=False):
-        """カードを描画するヘルパー関数 (シンプル版)"""
-        # 選択されている場合は少し縦にずらす
-        if is_selected:
-            y -= 5
-
-        # カードの枠
-        pyxel.rect(x, y, self.card_w, self.card_h, 7) # 白い枠
-        pyxel.rectb(x, y, self.card_w, self.card_h, 0) # 黒い縁
-
+        """カードを描画するヘルパー関数 (ベイク済みアトラスから1回のbltで描く)"""
+        if not self.use_card_cache:
+            # 比較用: 毎フレームpipを計算して描く従来の描画
+            draw_card_face(self.gfx, x, y - 5 if is_selected else y, card, face_up, self.card_w, self.card_h)
+            return
         if face_up and card:
-            # カードの数字とマーク
-            rank_str = str(card.rank.value) if card.rank.value <= 10 else card.rank.name[0]
-            
-            # スートの色を辞書でマッピング (色設定を変更)
-            # スペード:黒, ハート:赤, クローバー:緑, ダイヤ:青
-            suit_colors = {
-                Suit.BLACK: 0,  # Spade -> Black
-                Suit.RED: 8,    # Heart -> Red
-                Suit.BLUE: 3,   # Clover -> Green
-                Suit.GREEN: 1,  # Diamond -> Blue
-            }
-            suit_color = suit_colors[card.suit]
-
-            pyxel.text(x + 2, y + 2, rank_str, suit_color)
-            
-            # ドット絵を描画
-            # Large suit icon dimensions
-            w_large, h_large = 8, 8
-            # Small suit icon dimensions
-            w_small, h_small = 4, 4
-
-            # Get UV coordinates for large suit
-            u_large, v_large = 0, 0 # v_large is always 0
-            if card.suit == Suit.BLACK: # Spade
-                u_large = 8
-            elif card.suit == Suit.RED: # Heart
-                u_large = 16
-            elif card.suit == Suit.BLUE: # Clover
-                u_large = 24
-            elif card.suit == Suit.GREEN: # Diamond
-                u_large = 32
-
-            # Get UV coordinates for small suit
-            u_small, v_small = 0, 0 # v_small is always 8
-            if card.suit == Suit.BLACK: # Spade
-                u_small = 8
-                v_small = 8
-            elif card.suit == Suit.RED: # Heart
-                u_small = 16
-                v_small = 8
-            elif card.suit == Suit.BLUE: # Clover
-                u_small = 24
-                v_small = 8
-            elif card.suit == Suit.GREEN: # Diamond
-                u_small = 32
-                v_small = 8
-
-            # Define inner padding for pips
-            inner_padding_x = 8 # From left/right edge of card
-            inner_padding_y_top = 15 # Below rank text
-            inner_padding_y_bottom = 15 # From bottom edge of card
-
-            # Define common pip positions relative to card's (x, y)
-            x_left = x + inner_padding_x
-            x_right = x + self.card_w - inner_padding_x - w_small
-            x_center = x + (self.card_w - w_small) // 2
-
-            # Calculate available height for pips
-            available_pip_height = self.card_h - inner_padding_y_top - inner_padding_y_bottom - h_small
-
-            # Calculate y positions for 5 vertical sections, evenly distributed
-            y_pos_1 = y + inner_padding_y_top
-            y_pos_2 = y_pos_1 + available_pip_height // 4
-            y_pos_3 = y_pos_1 + available_pip_height // 2
-            y_pos_4 = y_pos_1 + (available_pip_height * 3) // 4
-            y_pos_5 = y + self.card_h - inner_padding_y_bottom - h_small
-
-            # Draw pips based on rank
-            if 2 <= card.rank.value <= 10:
-                pip_positions = []
-                if card.rank.value == 2:
-                    pip_positions = [(x_center, y_pos_1), (x_center, y_pos_5)]
-                elif card.rank.value == 3:
-                    pip_positions = [(x_center, y_pos_1), (x_center, y_pos_3), (x_center, y_pos_5)]
-                elif card.rank.value == 4:
-                    pip_positions = [(x_left, y_pos_1), (x_right, y_pos_1), (x_left, y_pos_5), (x_right, y_pos_5)]
-                elif card.rank.value == 5:
-                    pip_positions = [(x_left, y_pos_1), (x_right, y_pos_1), (x_center, y_pos_3), (x_left, y_pos_5), (x_right, y_pos_5)]
-                elif card.rank.value == 6:
-                    pip_positions = [(x_left, y_pos_1), (x_right, y_pos_1), (x_left, y_pos_3), (x_right, y_pos_3), (x_left, y_pos_5), (x_right, y_pos_5)]
-                elif card.rank.value == 7:
-                    # Dice 5 on top, two pips horizontally on bottom
-                    pip_positions = [
-                        (x_left, y_pos_1), (x_right, y_pos_1),
-                        (x_center, y_pos_2),
-                        (x_left, y_pos_3), (x_right, y_pos_3),
-                        (x_left, y_pos_5), (x_right, y_pos_5)
-                    ]
-                elif card.rank.value == 8:
-                    pip_positions = [
-                        (x_left, y_pos_1), (x_right, y_pos_1),
-                        (x_left, y_pos_2), (x_right, y_pos_2),
-                        (x_left, y_pos_4), (x_right, y_pos_4),
-                        (x_left, y_pos_5), (x_right, y_pos_5)
-                    ]
-                elif card.rank.value == 9:
-                    # Dice 5 on top, Dice 4 on bottom
-                    pip_positions = [
-                        (x_left, y_pos_1), (x_right, y_pos_1),
-                        (x_center, y_pos_2),
-                        (x_left, y_pos_3), (x_right, y_pos_3),
-                        (x_left, y_pos_4), (x_right, y_pos_4),
-                        (x_left, y_pos_5), (x_right, y_pos_5)
-                    ]
-                elif card.rank.value == 10:
-                    # Two dice 5s, one above the other
-                    # Top dice 5 section
-                    top_section_y_start = y + inner_padding_y_top
-                    top_section_y_end = y + self.card_h // 2 - h_small // 2 - 2 # Small gap in the middle
-                    
-                    y_top_dice5_p1 = top_section_y_start
-                    y_top_dice5_p2 = top_section_y_start + (top_section_y_end - top_section_y_start) // 2
-                    y_top_dice5_p3 = top_section_y_end
-
-                    # Bottom dice 5 section
-                    bottom_section_y_start = y + self.card_h // 2 + h_small // 2 + 2 # Small gap in the middle
-                    bottom_section_y_end = y + self.card_h - inner_padding_y_bottom - h_small
-
-                    y_bottom_dice5_p1 = bottom_section_y_start
-                    y_bottom_dice5_p2 = bottom_section_y_start + (bottom_section_y_end - bottom_section_y_start) // 2
-                    y_bottom_dice5_p3 = bottom_section_y_end
-
-                    pip_positions = [
-                        # Top dice 5
-                        (x_left, y_top_dice5_p1), (x_right, y_top_dice5_p1),
-                        (x_center, y_top_dice5_p2),
-                        (x_left, y_top_dice5_p3), (x_right, y_top_dice5_p3),
-                        # Bottom dice 5
-                        (x_left, y_bottom_dice5_p1), (x_right, y_bottom_dice5_p1),
-                        (x_center, y_bottom_dice5_p2),
-                        (x_left, y_bottom_dice5_p3), (x_right, y_bottom_dice5_p3)
-                    ]
-
-                for px, py in pip_positions:
-                    pyxel.blt(px, py, 0, u_small, v_small, w_small, h_small, 7)
-            else: # A, J, Q, K
-                w_face, h_face = 0, 0
-                u_face, v_face = 0, 0 # Initialize face card UV
-
-                if card.rank == Rank.ACE:
-                    # Draw large suit icon in the center for Ace
-                    w_face, h_face = 8, 8
-                    u_face = u_large
-                    v_face = v_large
-                else: # J, Q, K
-                    w_face, h_face = 16, 16 # Face card image dimensions
-                    # Set v_face based on rank
-                    if card.rank == Rank.KING:
-                        v_face = 40
-                    elif card.rank == Rank.QUEEN:
-                        v_face = 56
-                    elif card.rank == Rank.JACK:
-                        v_face = 72
-                    
-                    # Set u_face based on suit
-                    if card.suit == Suit.BLACK: # Spade
-                        u_face = 0
-                    elif card.suit == Suit.RED: # Heart
-                        u_face = 16
-                    elif card.suit == Suit.BLUE: # Clover
-                        u_face = 32
-                    elif card.suit == Suit.GREEN: # Diamond
-                        u_face = 48
-
-                pyxel.blt(x + (self.card_w - w_face) // 2, y + (self.card_h - h_face) // 2, 0, u_face, v_face, w_face, h_face, 7)
+            u, v, dy = self.card_faces[(card.rank, card.suit, True, is_selected)]
         else:
-            # カードの裏面
-            pyxel.rect(x + 1, y + 1, self.card_w - 2, self.card_h - 2, 1) # 青い裏面
-            pyxel.line(x + 2, y + 2, x + self.card_w - 3, y + self.card_h - 3, 0)
-            pyxel.line(x + self.card_w - 3, y + 2, x + 2, y + self.card_h - 3, 0)
+            u, v, dy = self.card_faces[(None, None, False, is_selected)]
+        self.gfx.blt(x, y + dy, self.card_atlas, u, v, self.card_w, self.card_h)
 
     def update(self):
         """ゲームロジックの更新"""
+        events = self.read_input()
+        self.input_log.capture(self.ticks, events, self.replay_state)
+        if events or not self.is_idle(): # 入力待ちで進めるものが無いフレームは step を省く (ティックも進めない)
+            self.step(events)
+
+    def is_idle(self):
+        """イベントが無ければ step が何もしない (タイマーの無い、プレイヤーの操作を待つ状態)"""
+        return self.game_state in (GameState.BETTING, GameState.PLAYER_EXCHANGE, GameState.CONTINUE_OR_END_GAME)
+
+    def read_input(self):
+        """マウスとキーの入力をイベントにする。表示の切り替え (F, C) と終了 (Q) はここで済ませる"""
         if pyxel.btnp(pyxel.KEY_Q):
             pyxel.quit()
-        
+        if pyxel.btnp(pyxel.KEY_F):
+            self.show_draw_stats = not self.show_draw_stats
+        if pyxel.btnp(pyxel.KEY_C):
+            self.use_card_cache = not self.use_card_cache
+            if not self.use_card_cache:
+                pyxel.load("poker.pyxres") # アトラスをキャッシュから読んだ場合、従来の描画にはスートのアイコンが必要
+
+        events = []
         if self.game_state == GameState.START_SCREEN:
-            self.point_add_timer += 2 # 2倍速でカウントアップ
-            if self.point_add_timer >= self.point_add_interval:
-                self.player.chips += 10 # 10ポイント加算
-                self.point_add_timer = 0 # タイマーリセット
-            
             if self.is_button_pressed(self.screen_w // 2 - 30, self.screen_h - 20, 60, 15): # START GAMEボタン
-                self.reset_hand() # 手札をリセットし、BETTINGフェーズへ
+                events.append(("deal",))
+            if self.is_button_pressed(self.screen_w - 75, self.screen_h - 20, 70, 15): # ゲームの種類の切り替えボタン
+                events.append(("variant",))
 
         elif self.game_state == GameState.BETTING:
-            # 賭け金調整ボタンの処理
+            # 賭け金調整ボタンは押している間 bet_change_delay フレームごとに1回ずつ増減する
             # UPボタン
             if pyxel.btn(pyxel.MOUSE_BUTTON_LEFT) and self.is_button_hovered(self.screen_w // 2 + 20, self.screen_h // 2 - 30, 20, 15):
                 self.bet_change_timer += 1
                 if self.bet_change_timer % self.bet_change_delay == 0:
-                    self.current_bet = min(self.player.chips, self.current_bet + self.bet_step)
+                    events.append(("raise",))
             # DOWNボタン
             elif pyxel.btn(pyxel.MOUSE_BUTTON_LEFT) and self.is_button_hovered(self.screen_w // 2 + 20, self.screen_h // 2 + 15, 20, 15):
                 self.bet_change_timer += 1
                 if self.bet_change_timer % self.bet_change_delay == 0:
-                    self.current_bet = max(self.min_bet, self.current_bet - self.bet_step)
+                    events.append(("lower",))
             else:
                 self.bet_change_timer = 0 # ボタンが離されたらタイマーをリセット
-            
             # BETボタン
             if self.is_button_pressed(self.screen_w // 2 - 30, self.screen_h - 20, 60, 15):
-                if self.player.chips >= self.current_bet:
-                    self.player.chips -= self.current_bet # チップを減らす
-                    self._deal_initial_cards() # カードを配る
-                    self.game_state = GameState.PLAYER_EXCHANGE # プレイヤーの交換フェーズへ
-                else:
-                    self.game_state = GameState.START_SCREEN # チップが足りない場合はスタート画面へ
+                events.append(("bet",))
 
         elif self.game_state == GameState.PLAYER_EXCHANGE:
             # カードのクリック判定
@@ -483,7 +711,6 @@ class App:
                 player_hand_start_x = (self.screen_w - (self.card_w * 5 + self.card_spacing * 4)) // 2
                 player_hand_y = (self.screen_h - self.card_h) // 2
 
-                clicked_on_card = False
                 for i in range(len(self.player.hand.cards)):
                     card_x = player_hand_start_x + i * (self.card_w + self.card_spacing)
                     card_y_for_click = player_hand_y
@@ -493,17 +720,68 @@ class App:
 
                     if card_x <= pyxel.mouse_x <= card_x + self.card_w and \
                        card_y_for_click <= pyxel.mouse_y <= card_y_for_click + self.card_h:
-                        if i in self.selected_cards_indices:
-                            self.selected_cards_indices.remove(i) # 選択解除
-                        else:
-                            # 最大5枚まで選択可能
-                            if len(self.selected_cards_indices) < 5:
-                                self.selected_cards_indices.append(i) # 選択
-                        clicked_on_card = True
+                        events.append(("toggle", i))
                         break # 1回のクリックで1枚だけ選択/解除
+            # EXCHANGEボタン
+            if self.is_button_pressed(self.screen_w // 2 - 30, self.screen_h - 20, 60, 15): # 画面下中央に配置
+                events.append(("exchange",))
+
+        elif self.game_state == GameState.CONTINUE_OR_END_GAME:
+            if self.is_button_pressed(self.screen_w // 2 - 60, self.screen_h - 20, 60, 15): # CONTINUEボタン (左側)
+                events.append(("continue",))
+            if self.is_button_pressed(self.screen_w // 2 + 10, self.screen_h - 20, 60, 15): # END GAMEボタン (右側)
+                events.append(("end",))
+
+        elif self.game_state == GameState.GAME_OVER_DISPLAY:
+            if self.is_button_pressed(self.screen_w // 2 - 30, self.screen_h - 20, 60, 15): # RETURN TO STARTボタン
+                events.append(("return",))
+        return events
+
+    def step(self, events):
+        """イベントを適用して1フレーム進める"""
+        self.ticks += 1
+        if self.game_state == GameState.START_SCREEN:
+            self.point_add_timer += 2 # 2倍速でカウントアップ
+            if self.point_add_timer >= self.point_add_interval:
+                self.player.chips += 10 # 10ポイント加算
+                self.save_stats()
+                self.point_add_timer = 0 # タイマーリセット
+            
+            if ("variant",) in events:
+                variants = list(Variant)
+                self.set_variant(variants[(variants.index(self.variant) + 1) % len(variants)])
+            if ("deal",) in events:
+                self.reset_hand() # 手札をリセットし、BETTINGフェーズへ
+
+        elif self.game_state == GameState.BETTING:
+            for event in events:
+                if event == ("raise",):
+                    self.current_bet = min(self.player.chips, self.current_bet + self.bet_step)
+                elif event == ("lower",):
+                    self.current_bet = max(self.min_bet, self.current_bet - self.bet_step)
+            
+            # BETボタン
+            if ("bet",) in events:
+                if self.player.chips >= self.current_bet:
+                    self.player.chips -= self.current_bet # チップを減らす
+                    self.save_stats()
+                    self._deal_initial_cards() # カードを配る
+                    self.initial_cards = list(self.player.hand.cards)
+                    self.game_state = GameState.PLAYER_EXCHANGE # プレイヤーの交換フェーズへ
+                else:
+                    self.game_state = GameState.START_SCREEN # チップが足りない場合はスタート画面へ
+
+        elif self.game_state == GameState.PLAYER_EXCHANGE:
+            for name, *args in events:
+                if name == "toggle":
+                    i = args[0]
+                    if i in self.selected_cards_indices:
+                        self.selected_cards_indices.remove(i) # 選択解除
+                    elif len(self.selected_cards_indices) < 5: # 最大5枚まで選択可能
+                        self.selected_cards_indices.append(i) # 選択
                 
             # EXCHANGEボタンの更新処理
-            if self.is_button_pressed(self.screen_w // 2 - 30, self.screen_h - 20, 60, 15): # 画面下中央に配置
+            if ("exchange",) in events:
                 print("EXCHANGE button pressed!")
                 self._exchange_player_cards() # カード交換処理
                 self.game_state = GameState.SHOWDOWN # AIがいないので直接SHOWDOWNへ
@@ -517,6 +795,8 @@ class App:
             payout = self.payout_multipliers.get(player_hand_rank, 0) * self.current_bet
             self.player.chips += payout
             self.last_payout = payout # 最後の配当を保存
+            self.save_stats()
+            self.save_hand(player_hand_rank, payout)
             print(f"Player Hand: {player_hand_rank.name}, Payout: {payout}")
 
             # プレイヤーのチップが0になったらゲームオーバー表示へ
@@ -527,19 +807,21 @@ class App:
                 self.game_state = GameState.CONTINUE_OR_END_GAME # 継続か精算か選択フェーズへ
 
         elif self.game_state == GameState.CONTINUE_OR_END_GAME:
-            # CONTINUEボタン
-            if self.is_button_pressed(self.screen_w // 2 - 60, self.screen_h - 20, 60, 15): # 左側に配置
+            if ("continue",) in events:
                 self.reset_hand() # 次のハンドへ
-            # END GAMEボタン
-            if self.is_button_pressed(self.screen_w // 2 + 10, self.screen_h - 20, 60, 15): # 右側に配置
+            if ("end",) in events:
                 self.game_state = GameState.START_SCREEN # 精算してスタート画面へ
 
         elif self.game_state == GameState.GAME_OVER_DISPLAY:
             self.game_over_timer += 1
-            if self.game_over_timer >= self.game_over_display_duration or \
-               self.is_button_pressed(self.screen_w // 2 - 30, self.screen_h - 20, 60, 15): # RETURN TO STARTボタン
+            if self.game_over_timer >= self.game_over_display_duration or ("return",) in events:
                 self.game_state = GameState.START_SCREEN # スタート画面へ
 
+    def replay_state(self):
+        """入力の再生で照合する状態"""
+        return (self.game_state.value, self.player.chips, self.last_payout, self.current_bet,
+                [(card.rank.value, card.suit.value) for card in self.player.hand.cards], sorted(self.selected_cards_indices))
+
     def _ai_exchange_cards(self, ai_player):
         """AIプレイヤーがカードを交換するロジック"""
         # ここでは非常にシンプルなAIロジックを実装
@@ -581,34 +863,55 @@ class App:
         
         self.selected_cards_indices = [] # 選択状態をリセット
 
+    def view_key(self):
+        """draw の見た目を決める値 (描画統計の表示中は毎フレーム描き直す)"""
+        countdown = None
+        if self.game_state == GameState.START_SCREEN:
+            countdown = (self.point_add_interval - self.point_add_timer) // 60
+        return (self.game_state, self.variant, self.player.chips, self.current_bet, countdown,
+                tuple(self.player.hand.cards), tuple(self.selected_cards_indices), self.use_card_cache,
+                self.show_draw_stats and pyxel.frame_count)
+
     def draw(self):
-        """画面の描画"""
-        pyxel.cls(2) # 深緑の背景
+        """画面の描画 (前回描いたときから見た目が変わっていなければ何もしない)"""
+        if not self.redraw.needs_redraw(self.view_key()):
+            return
+        start = time.perf_counter()
+        self.gfx.calls = 0
+        self._draw_scene()
+        self.draw_calls = self.gfx.calls
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.frame_time_ms += (elapsed_ms - self.frame_time_ms) * 0.1
+        if self.show_draw_stats:
+            cache = "ON" if self.use_card_cache else "OFF"
+            self.gfx.text(2, self.screen_h - 8, f"DRAW:{self.draw_calls} {self.frame_time_ms:.2f}ms CACHE:{cache}", 10)
+
+    def _draw_scene(self):
+        self.gfx.cls(2) # 深緑の背景
         
         # プレイヤーの名前とチップの表示
-        pyxel.text(self.screen_w // 2 - 20, 5, f"{self.player.name}: {self.player.chips}", 7)
+        self.gfx.text(self.screen_w // 2 - 20, 5, f"{self.player.name}: {self.player.chips}", 7)
+        if self.variant != Variant.STANDARD:
+            self.gfx.text(2, 5, self.variant.value.upper(), 10)
 
         if self.game_state == GameState.START_SCREEN:
-            pyxel.text(self.screen_w // 2 - 40, self.screen_h // 2 - 20, "POKER GAME", 7)
-            pyxel.text(self.screen_w // 2 - 40, self.screen_h // 2, f"Chips: {self.player.chips}", 7)
+            self.gfx.text(self.screen_w // 2 - 40, self.screen_h // 2 - 20, "POKER GAME", 7)
+            self.gfx.text(self.screen_w // 2 - 40, self.screen_h // 2, f"Chips: {self.player.chips}", 7)
             
             # ポイント加算までのカウントダウン表示
             remaining_frames = self.point_add_interval - self.point_add_timer
             remaining_seconds = remaining_frames // 60
-            pyxel.text(self.screen_w // 2 - 40, self.screen_h // 2 + 20, f"Next 10 points in: {remaining_seconds}s", 7)
-            pyxel.text(self.screen_w // 2 - 40, self.screen_h // 2 + 30, "(+10 points every 60s)", 7)
+            self.gfx.text(self.screen_w // 2 - 40, self.screen_h // 2 + 20, f"Next 10 points in: {remaining_seconds}s", 7)
+            self.gfx.text(self.screen_w // 2 - 40, self.screen_h // 2 + 30, "(+10 points every 60s)", 7)
 
             self.draw_button(self.screen_w // 2 - 30, self.screen_h - 20, 60, 15, "START GAME")
+            self.draw_button(self.screen_w - 75, self.screen_h - 20, 70, 15, self.variant.value.upper())
         else:
-            # プレイヤーの手札 (画面中央に横に並べる)
-            hand_total_width = self.card_w * 5 + self.card_spacing * 4 # 5枚のカードと4つのスペースの合計幅
-
-            player_hand_start_x = (self.screen_w - hand_total_width) // 2
-            player_hand_y = (self.screen_h - self.card_h) // 2
+            player_hand_y = self.hand_y
 
             # 賭け金表示とボタン
             if self.game_state == GameState.BETTING:
-                pyxel.text(self.screen_w // 2 - 20, self.screen_h // 2 - 10, f"BET: {self.current_bet}", 7)
+                self.gfx.text(self.screen_w // 2 - 20, self.screen_h // 2 - 10, f"BET: {self.current_bet}", 7)
                 self.draw_button(self.screen_w // 2 + 20, self.screen_h // 2 - 30, 20, 15, "UP")
                 self.draw_button(self.screen_w // 2 + 20, self.screen_h // 2 + 15, 20, 15, "DOWN")
                 self.draw_button(self.screen_w // 2 - 30, self.screen_h - 20, 60, 15, "BET")
@@ -616,12 +919,12 @@ class App:
                 for i, card in enumerate(self.player.hand.cards):
                     is_selected = i in self.selected_cards_indices
                     card_y_offset = -5 if is_selected else 0 # 選択されている場合は上にずらす
-                    self._draw_card(player_hand_start_x + i * (self.card_w + self.card_spacing), player_hand_y + card_y_offset, card, True, is_selected)
+                    self._draw_card(self.hand_slot_x[i], player_hand_y + card_y_offset, card, True, is_selected)
 
             # YOUの役をカードの下に表示
             if self.game_state == GameState.SHOWDOWN or self.game_state == GameState.CONTINUE_OR_END_GAME:
                 player_hand_rank, _ = self.player.hand.evaluate_hand()
-                pyxel.text(self.screen_w // 2 - 20, player_hand_y + self.card_h + 5, f"Your Hand: {player_hand_rank.name}", 7) # 表示位置を調整
+                self.gfx.text(self.screen_w // 2 - 20, player_hand_y + self.card_h + 5, f"Your Hand: {player_hand_rank.name}", 7) # 表示位置を調整
 
             # EXCHANGEボタンの描画
             if self.game_state == GameState.PLAYER_EXCHANGE:
@@ -629,7 +932,7 @@ class App:
 
             # ゲームオーバー時にRESTARTボタンを表示
             if self.game_state == GameState.CONTINUE_OR_END_GAME:
-                pyxel.text(self.screen_w // 2 - 60, self.screen_h // 2 - 40, "CONTINUE or END GAME?", 7)
+                self.gfx.text(self.screen_w // 2 - 60, self.screen_h // 2 - 40, "CONTINUE or END GAME?", 7)
                 self.draw_button(self.screen_w // 2 - 60, self.screen_h - 20, 60, 15, "CONTINUE")
                 self.draw_button(self.screen_w // 2 + 10, self.screen_h - 20, 60, 15, "END GAME")
             elif self.game_state == GameState.GAME_OVER_DISPLAY:
@@ -645,8 +948,9 @@ class App:
         return x <= pyxel.mouse_x <= x + w and y <= pyxel.mouse_y <= y + h
 
     def draw_button(self, x, y, w, h, text):
-        pyxel.rect(x, y, w, h, 1) # ボタンの背景
-        pyxel.rectb(x, y, w, h, 7) # ボタンの枠
-        pyxel.text(x + (w - len(text) * 4) / 2, y + (h - 5) / 2, text, 7) # ボタンのテキスト
+        self.gfx.rect(x, y, w, h, 1) # ボタンの背景
+        self.gfx.rectb(x, y, w, h, 7) # ボタンの枠
+        self.gfx.text(x + (w - len(text) * 4) / 2, y + (h - 5) / 2, text, 7) # ボタンのテキスト
 
-App()
\ No newline at end of file
+if __name__ == "__main__":
+    App()
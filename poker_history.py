@@ -0,0 +1,221 @@
+import argparse
+import os
+import random
+import sys
+from array import array
+
+# ポーカーのハンド履歴 (列指向)
+# 1ハンド1行で、列ごとに別のファイルに追記する: records/poker/chunk-NNNNN/<列名>.bin
+# 1チャンクは CHUNK_HANDS ハンドまでで、いっぱいになったら次のチャンクに切り替える (書き終えたチャンクは変更しない)
+# 列は固定長のリトルエンディアンの値を並べただけなので、numpy.memmap でそのまま配列として読める
+# 集計 (役ごとの還元率・残したカードの形の頻度) は numpy でまとめて計算する (記録するだけなら numpy は要らない)
+#   python poker_history.py simulate --hands 1000000   # 簡単な戦略で打ったハンドを記録する
+#   python poker_history.py report --last 1000000      # 直近のハンドの役ごとの還元率と残したカードの形
+HISTORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "records", "poker")
+CHUNK_HANDS = 1 << 16
+
+# 列名 -> (array の型コード, numpy の dtype, 1ハンドあたりの値の数)
+# カードは poker.card_code の番号 (ランクの値 * 4 + スート、0 は無し)
+COLUMNS = {
+    "initial": ("B", "u1", 5),  # 最初に配られた5枚
+    "held": ("B", "u1", 1),     # 残したカード (ビット i: i 枚目)
+    "drawn": ("B", "u1", 5),    # 交換で引いたカード (交換した位置だけ、それ以外は 0)
+    "rank": ("B", "u1", 1),     # 最終的な役 (poker.HandRank の値)
+    "variant": ("B", "u1", 1),  # ゲームの種類 (poker.Variant の並び順)
+    "bet": ("I", "<u4", 1),
+    "payout": ("I", "<u4", 1),
+}
+ALL_HELD = 0b11111
+
+class HandHistory:
+    """チャンクに分けた追記専用のハンド履歴"""
+    def __init__(self, directory=HISTORY_DIR, chunk_hands=CHUNK_HANDS):
+        self.directory = directory
+        self.chunk_hands = chunk_hands
+        os.makedirs(directory, exist_ok=True)
+        chunks = self.chunks()
+        self.chunk = chunks[-1] if chunks else 1
+        self.rows = self.repair(self.chunk)
+
+    def chunks(self):
+        return sorted(int(name[6:]) for name in os.listdir(self.directory) if name.startswith("chunk-"))
+
+    def path(self, chunk, column):
+        return os.path.join(self.directory, f"chunk-{chunk:05d}", f"{column}.bin")
+
+    def rows_in(self, chunk):
+        """チャンクの行数 (書き込み途中で落ちて列の長さがそろっていなければ一番短い列に合わせる)
+        ファイルの無い列 (後から増えた列など) は数えない。どの列のファイルも無ければ 0"""
+        rows = None
+        for column, (code, _, width) in COLUMNS.items():
+            try:
+                size = os.path.getsize(self.path(chunk, column))
+            except FileNotFoundError:
+                continue
+            count = size // (array(code).itemsize * width)
+            rows = count if rows is None else min(rows, count)
+        return rows or 0
+
+    def repair(self, chunk):
+        """最後のチャンクの各列を行数に合わせて切り詰め、行数を返す
+        ファイルの無い列は行数分の 0 (カード無し) で埋めて作る"""
+        os.makedirs(os.path.dirname(self.path(chunk, "held")), exist_ok=True)
+        rows = self.rows_in(chunk)
+        for column, (code, _, width) in COLUMNS.items():
+            path = self.path(chunk, column)
+            with open(path, "ab") as f:
+                f.truncate(rows * array(code).itemsize * width)
+        return rows
+
+    def append(self, initial, held, drawn, rank, variant, bet, payout):
+        """1ハンド分を追記する。initial と drawn は5枚分のカード番号"""
+        self.extend([(initial, held, drawn, rank, variant, bet, payout)])
+
+    def extend(self, hands):
+        """(initial, held, drawn, rank, variant, bet, payout) のリストをまとめて追記する"""
+        start = 0
+        while start < len(hands):
+            if self.rows >= self.chunk_hands:
+                self.chunk += 1
+                self.rows = self.repair(self.chunk)
+            batch = hands[start:start + self.chunk_hands - self.rows]
+            for i, (column, (code, _, width)) in enumerate(COLUMNS.items()):
+                values = array(code)
+                if width == 1:
+                    values.extend(hand[i] for hand in batch)
+                else:
+                    for hand in batch:
+                        values.extend(hand[i])
+                if sys.byteorder != "little":
+                    values.byteswap()
+                with open(self.path(self.chunk, column), "ab") as f:
+                    values.tofile(f)
+            self.rows += len(batch)
+            start += len(batch)
+
+    def load(self, last=None, names=None):
+        """列名 -> numpy の配列 (initial と drawn は (ハンド数, 5))。last を渡すと直近 last ハンドだけ、names で列を絞れる
+        1チャンクに収まるときは memmap をそのまま返し、またがるときだけつなげてコピーする"""
+        import numpy as np
+        names = COLUMNS if names is None else names
+        parts, total = [], 0
+        for chunk in reversed(self.chunks()):
+            rows = self.rows_in(chunk)
+            if last is not None and total + rows > last:
+                rows_wanted = last - total
+            else:
+                rows_wanted = rows
+            if rows_wanted > 0:
+                columns = {}
+                for column in names:
+                    _, dtype, width = COLUMNS[column]
+                    shape = (rows, width) if width > 1 else (rows,)
+                    path = self.path(chunk, column)
+                    if os.path.exists(path):
+                        columns[column] = np.memmap(path, dtype, "r", shape=shape)[rows - rows_wanted:]
+                    else: # 書き終えたチャンクに無い列は 0 として読む (ファイルは作らない)
+                        columns[column] = np.zeros(shape, dtype)[rows - rows_wanted:]
+                parts.append(columns)
+                total += rows_wanted
+            if last is not None and total >= last:
+                break
+        if len(parts) == 1:
+            return parts[0]
+        return {column: (np.concatenate([part[column] for part in reversed(parts)]) if parts
+                         else np.zeros((0, width) if width > 1 else 0, dtype))
+                for column, (_, dtype, width) in ((column, COLUMNS[column]) for column in names)}
+
+def rtp_by_rank(columns, ranks=11):
+    """役ごとの (ハンド数, 賭け金の合計, 配当の合計) の配列 (添字は役の値)"""
+    import numpy as np
+    rank = columns["rank"]
+    return (np.bincount(rank, minlength=ranks),
+            np.bincount(rank, weights=columns["bet"], minlength=ranks),
+            np.bincount(rank, weights=columns["payout"], minlength=ranks))
+
+def held_patterns(columns):
+    """残したカードの形 (ビットマスク 0..31) ごとのハンド数"""
+    import numpy as np
+    return np.bincount(columns["held"], minlength=ALL_HELD + 1)
+
+def pattern_name(held):
+    """残したカードの形を "HH..H" のように表す (H: 残した)"""
+    return "".join("H" if held >> i & 1 else "." for i in range(5))
+
+def simple_hold(hand):
+    """シミュレーション用の簡単な戦略: ストレート以上なら全部、それ以外はワイルドと同じランクが2枚以上のカードを残す"""
+    import poker
+    rank, _ = hand.evaluate_hand()
+    if rank.value >= poker.HandRank.STRAIGHT.value:
+        return ALL_HELD
+    wild = poker.WILD_RANKS[hand.variant]
+    counts = {}
+    for card in hand.cards:
+        counts[card.rank] = counts.get(card.rank, 0) + 1
+    return sum(1 << i for i, card in enumerate(hand.cards) if card.rank in wild or counts[card.rank] >= 2)
+
+def simulate(history, hands, seed, variant_name, bet=10):
+    """simple_hold で打ったハンドを記録する"""
+    import poker
+    rng = random.Random(seed)
+    variant = next(v for v in poker.Variant if v.name == variant_name)
+    variant_code = list(poker.Variant).index(variant)
+    multipliers = poker.PAYOUT_MULTIPLIERS[variant]
+    batch = []
+    for _ in range(hands):
+        deck = poker.Deck(rng, variant)
+        hand = poker.Hand(deck.deal(5), variant)
+        initial = [poker.card_code(card) for card in hand.cards]
+        held = simple_hold(hand)
+        drawn = [0] * 5
+        for i in range(5):
+            if not held >> i & 1:
+                hand.cards[i] = deck.deal(1)[0]
+                drawn[i] = poker.card_code(hand.cards[i])
+        rank, _ = hand.evaluate_hand()
+        batch.append((initial, held, drawn, rank.value, variant_code, bet, multipliers.get(rank, 0) * bet))
+        if len(batch) == 10000:
+            history.extend(batch)
+            batch = []
+    history.extend(batch)
+
+def report(history, last, variant_name=None):
+    import time
+    import numpy # 読み込みにかかる時間を集計の時間に含めないよう先に読み込む
+    import poker
+    start = time.perf_counter()
+    columns = history.load(last, ("held", "rank", "variant", "bet", "payout"))
+    if variant_name:
+        code = [v.name for v in poker.Variant].index(variant_name)
+        keep = columns["variant"] == code
+        columns = {column: values[keep] for column, values in columns.items()}
+    counts, bets, payouts = rtp_by_rank(columns)
+    patterns = held_patterns(columns)
+    elapsed = (time.perf_counter() - start) * 1000
+    hands, total_bet = len(columns["rank"]), bets.sum()
+    print(f"{hands} hands, RTP {payouts.sum() / max(total_bet, 1) * 100:.2f}% (queried in {elapsed:.1f}ms)")
+    for rank in poker.HandRank:
+        if counts[rank.value]:
+            print(f"  {rank.name:<16} {counts[rank.value]:9d} hands  {counts[rank.value] / hands * 100:6.3f}%  "
+                  f"returns {payouts[rank.value] / max(bets[rank.value], 1) * 100:7.1f}% of its bets, "
+                  f"{payouts[rank.value] / max(total_bet, 1) * 100:6.2f}% of all bets")
+    print("held patterns:")
+    for held in sorted(range(len(patterns)), key=lambda h: -patterns[h])[:10]:
+        if patterns[held]:
+            print(f"  {pattern_name(held)} {patterns[held]:9d}  {patterns[held] / hands * 100:5.1f}%")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Poker hand history")
+    parser.add_argument("command", choices=["simulate", "report"])
+    parser.add_argument("--hands", type=int, default=100000, help="hands for simulate")
+    parser.add_argument("--last", type=int, default=None, help="only the most recent hands for report")
+    parser.add_argument("--variant", default=None, choices=["STANDARD", "JOKER_POKER", "DEUCES_WILD"],
+                        help="game to simulate (default STANDARD), or only this game's hands for report")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dir", default=HISTORY_DIR)
+    args = parser.parse_args()
+    history = HandHistory(args.dir)
+    if args.command == "simulate":
+        simulate(history, args.hands, args.seed, args.variant or "STANDARD")
+    else:
+        report(history, args.last, args.variant)
@@ -0,0 +1,30 @@
+import perf
+
+# ターン制のゲーム (リバーシ・ポーカー・15パズル) の描き直しの省略
+# pyxel は画面を自動では消さないので、draw で何も描かなければ前のフレームの絵がそのまま表示される
+# 各ゲームは draw の見た目を決める値 (盤面・状態・選択・アニメーションの段階など) を view key にまとめ、
+# 前回描いたときと同じなら draw を丸ごと省く。入力待ちの間は描画にかかる CPU 時間がほぼ 0 になる
+# view key には draw が読む値を全て入れること (入れ忘れると画面が古いまま残る)
+# マウスを重ねると見た目が変わる部品を足したときは、その部品に重なっているかどうかも入れる
+
+class RedrawGate:
+    """view key が変わったときだけ描き直させる"""
+    __slots__ = ('key', 'drawn', 'skipped')
+
+    def __init__(self):
+        self.key = None
+        self.drawn = 0   # 描き直したフレーム数
+        self.skipped = 0 # 描き直しを省いたフレーム数
+
+    def needs_redraw(self, key):
+        key = (key, perf.profiler.show_overlay) # 計測のオーバーレイを消したら下のゲーム画面を描き直す
+        if key == self.key:
+            self.skipped += 1
+            return False
+        self.key = key
+        self.drawn += 1
+        return True
+
+    def invalidate(self):
+        """次の draw で必ず描き直させる (ランチャーで画面を他のゲームが使った後など)"""
+        self.key = None
@@ -1,37 +1,122 @@
 import pyxel
+import random
 from enum import Enum
 
+import input_log
+import perf
+import redraw
+import reversi_analysis
+import reversi_bitboard
+import reversi_engine
+import reversi_mcts
+import reversi_records
+
+# 盤面のサイズ (8x8) とセルのサイズ
+BOARD_SIZE = 8
+CELL_SIZE = 22
+SCREEN_WIDTH = BOARD_SIZE * CELL_SIZE + 40
+SCREEN_HEIGHT = SCREEN_WIDTH + 20
+# タイトル画面で選べる盤の大きさ。大きな盤はセルを小さくして同じ画面に収める
+BOARD_SIZES = (8, 10, 12)
+BOARD_PIXELS = BOARD_SIZE * CELL_SIZE
+COMPUTER_NODES = 1000 # 8x8 以外の盤でコンピュータが1手に読む局面数の上限
+PONDER_NODES = 200    # 人の手番の間、1フレームに先読みする局面数 (12x12 で数ミリ秒)
+MCTS_FRAME_PLAYOUTS = 6 # MCTS のコンピュータが1フレームに行うプレイアウト数 (8x8 で 5ms ほど)
+MCTS_MIN_PLAYOUTS = 100 # MCTS のコンピュータが手を打つときに最低限行っておくプレイアウト数
+
+def draw_board(board, offset, cell_size, winner=0):
+    """盤の線と石を (offset, offset) から描く。winner を渡すと勝った側の石を笑顔、負けた側を驚いた顔にする
+    (ゲームの画面と thumbnails.py のサムネイルで使う)"""
+    size = len(board)
+    board_pixels = size * cell_size
+    for i in range(size + 1):
+        pyxel.line(offset + i * cell_size, offset, offset + i * cell_size, offset + board_pixels, 7)
+        pyxel.line(offset, offset + i * cell_size, offset + board_pixels, offset + i * cell_size, 7)
+    half = cell_size // 2
+    for r in range(size):
+        for c in range(size):
+            stone = board[r][c]
+            if stone == 0: continue
+            x, y, radius = offset + c * cell_size + half, offset + r * cell_size + half, half - 3
+            win, lose = winner == stone, winner == -stone
+            if stone == 1: draw_black_cat(x, y, radius, win, lose)
+            else: draw_white_dog(x, y, radius, win, lose)
+
+def draw_black_cat(x, y, radius, winning_face=False, losing_face=False):
+    # 顔と耳
+    pyxel.circ(x, y, radius, 0)
+    pyxel.tri(x - radius*0.7, y - radius*0.7, x - radius*0.2, y - radius*0.7, x - radius*0.45, y - radius*1.2, 0)
+    pyxel.tri(x + radius*0.2, y - radius*0.7, x + radius*0.7, y - radius*0.7, x + radius*0.45, y - radius*1.2, 0)
+
+    # 目
+    eye_r, eye_ox, eye_oy = radius * 0.15, radius * 0.3, radius * 0.2
+    pyxel.circ(x - eye_ox, y - eye_oy, eye_r, 14)
+    pyxel.circ(x + eye_ox, y - eye_oy, eye_r, 14)
+
+    # 表情
+    if winning_face:
+        # にっこりした口
+        mouth_y = y + radius * 0.4
+        pyxel.line(x - 4, mouth_y, x - 2, mouth_y + 2, 8); pyxel.line(x - 2, mouth_y + 2, x + 2, mouth_y + 2, 8); pyxel.line(x + 2, mouth_y + 2, x + 4, mouth_y, 8)
+    elif losing_face:
+        # 口を丸く開ける
+        pyxel.circ(x, y + radius * 0.5, radius * 0.3, 8)
+
+def draw_white_dog(x, y, radius, winning_face=False, losing_face=False):
+    # 顔と耳
+    pyxel.circ(x, y, radius, 7)
+    pyxel.tri(x - radius*0.7, y - radius*0.7, x - radius*0.2, y - radius*0.7, x - radius*0.45, y - radius*1.2, 7)
+    pyxel.tri(x + radius*0.2, y - radius*0.7, x + radius*0.7, y - radius*0.7, x + radius*0.45, y - radius*1.2, 7)
+
+    # 目と鼻
+    eye_r, eye_ox, eye_oy = radius * 0.15, radius * 0.3, radius * 0.2
+    pyxel.circ(x - eye_ox, y - eye_oy, eye_r, 0)
+    pyxel.circ(x + eye_ox, y - eye_oy, eye_r, 0)
+    pyxel.circ(x, y + radius * 0.3, radius * 0.2, 0) # 鼻は常に表示
+
+    # 表情
+    if winning_face:
+        # にっこりした口
+        mouth_y = y + radius * 0.4
+        pyxel.line(x - 4, mouth_y, x - 2, mouth_y + 2, 8); pyxel.line(x - 2, mouth_y + 2, x + 2, mouth_y + 2, 8); pyxel.line(x + 2, mouth_y + 2, x + 4, mouth_y, 8)
+    elif losing_face:
+        # 舌を出す
+        pyxel.rect(x - radius*0.2, y + radius*0.6, radius*0.4, radius*0.6, 8)
+
 class GameState(Enum):
     TITLE = 0
     PLAYING = 1
     GAME_OVER = 2
 
 class Reversi:
-    _board_weights = [
-        [100, -20, 10, 5, 5, 10, -20, 100],
-        [-20, -50, -2, -2, -2, -2, -50, -20],
-        [10, -2, 1, 1, 1, 1, -2, 10],
-        [5, -2, 1, 1, 1, 1, -2, 5],
-        [5, -2, 1, 1, 1, 1, -2, 5],
-        [10, -2, 1, 1, 1, 1, -2, 10],
-        [-20, -50, -2, -2, -2, -2, -50, -20],
-        [100, -20, 10, 5, 5, 10, -20, 100]
-    ]
-
-    def __init__(self):
-        # 盤面のサイズ (8x8) とセルのサイズ
-        self.board_size = 8
-        self.cell_size = 22
-        self.screen_size = self.board_size * self.cell_size + 40
-        pyxel.init(self.screen_size, self.screen_size + 20, title="Reversi", fps=30)
+    def __init__(self, standalone=True, seed=None, replay=None):
+        """standalone=False の場合は pyxel の初期化と実行をランチャーに任せる
+        replay に input_log.InputLog を渡すと、その記録の乱数の種と成績から始める"""
+        self.set_board_size(BOARD_SIZE)
+        self.screen_size = SCREEN_WIDTH
+        if standalone:
+            pyxel.init(SCREEN_WIDTH, SCREEN_HEIGHT, title="Reversi", fps=30)
         pyxel.mouse(False) # マウスカーソルを非表示
 
         self.game_state = GameState.TITLE
         self.player_color = 0 # 1: 黒, -1: 白 (プレイヤーが選択)
         self.is_demo_mode = False # Trueの場合、コンピュータ同士の対戦
-
-        self.cat_wins = 0 # 黒猫の勝数
-        self.dog_wins = 0 # 白犬の勝数
+        # 学習済みのパターン評価 (reversi_weights.bin が無ければ従来の重み表で打つ)
+        self.evaluator = reversi_engine.load_pattern_evaluator()
+        self.show_heatmap = False # H: 手の評価と確定石を盤上に重ねて表示
+        self.heatmap_key = None   # 解析結果を計算した局面 (同じ局面の間は使い回す)
+        self.heatmap = None
+        self.ponderer = None # 大きな盤のコンピュータの先読み (ゲームの開始時に作る)
+        self.use_mcts = False # タイトル画面の CPU ボタン: コンピュータを MCTS にする
+        self.mcts = None      # MCTS の探索木 (ゲームの開始時に作る)
+
+        # 勝数は前回の続きから数える。コンピュータの手の同点はゲームごとの乱数で選ぶ (記録した入力で再生できるように)
+        seed, self.stats, self.input_log = input_log.session("reversi", seed, replay)
+        self.rng = random.Random(seed)
+        self.ticks = 0 # step を呼んだ回数
+        self.cat_wins = self.stats.get("cat_wins", 0) # 黒猫の勝数
+        self.dog_wins = self.stats.get("dog_wins", 0) # 白犬の勝数
+        self.records = None # 棋譜の記録先 (最初の終局時に開く)
 
         # アニメーション関連
         self.flipping_stones = [] # ひっくり返す石のリスト
@@ -43,66 +128,135 @@ class Reversi:
         self.game_over_animation_count = 0
         self.show_special_face = False # 特殊な表情を表示するか
 
-        # サウンドの定義
+        self.redraw = redraw.RedrawGate()
+        self.resume()
+
+        if standalone:
+            pyxel.run(*perf.instrument("reversi", self.update, self.draw))
+
+    def resume(self):
+        """サウンドを定義する (ランチャーで他のゲームから戻ってきたときにも呼ばれる)"""
+        self.redraw.invalidate()
         pyxel.sounds[0].set('g4c4b3a3g4c4b3a3g4f4e4d4c4', 't', '4', 'n', 10) # 犬が勝った時 (白)
         pyxel.sounds[1].set('c4g4c4g4c4g4c4g4', 's', '3', 'n', 15) # 猫が勝った時 (黒)
         pyxel.sounds[2].set('c4', 't', '3', 'n', 10) # 石がひっくり返る音 (猫: 黒)
         pyxel.sounds[3].set('g4', 't', '3', 'n', 10) # 石がひっくり返る音 (犬: 白)
         pyxel.sounds[4].set('c3', 'p', '4', 'n', 10) # 無効な手のエラー音
 
-        pyxel.run(self.update, self.draw)
+    def set_board_size(self, size):
+        """盤の大きさを変え、セルの大きさとマスの重みを合わせる"""
+        self.board_size = size
+        self.cell_size = BOARD_PIXELS // size
+        self._board_weights = reversi_bitboard.weight_table(size)
 
     def reset(self):
         """ゲームの状態を初期化する"""
-        self.board = [[0] * self.board_size for _ in range(self.board_size)]
-        self.setup_board()
+        self.board = reversi_engine.new_board(self.board_size)
         self.current_player = 1  # 1: 黒, -1: 白
         self.game_over = False
         self.winner = 0 # 0: 引き分け, 1: 黒の勝ち, -1: 白の勝ち
         self.game_state = GameState.PLAYING
+        self.moves = bytearray() # 棋譜 (1手1バイト、パスは reversi_records.PASS)
         pyxel.stop() # サウンドを停止
         self.flipping_stones = []
         self.flip_index = 0
-
-    def setup_board(self):
-        """中央に4つの石を初期配置する"""
-        center = self.board_size // 2
-        self.board[center - 1][center - 1] = -1  # 白
-        self.board[center - 1][center] = 1      # 黒
-        self.board[center][center - 1] = 1      # 黒
-        self.board[center][center] = -1      # 白
+        # 大きな盤では人の手番の間にコンピュータが先読みする (8x8 のコンピュータは1手読みの評価なので読むものが無い)
+        self.ponderer = None
+        self.mcts = None
+        if self.use_mcts:
+            # MCTS は空いているフレームでいつも木を育てる (人の手番の間は人が打った後の局面も読むことになる)
+            self.mcts = reversi_mcts.MCTS(self.board_size, random.Random(self.rng.randrange(1 << 32)))
+            self.mcts.focus(self.board, self.current_player)
+        elif self.board_size != 8:
+            self.ponderer = reversi_bitboard.Ponderer(self.board_size)
+            if not self.is_demo_mode and self.player_color == self.current_player:
+                self.ponderer.expect(self.board, self.player_color)
 
     def update(self):
         """ゲームのロジックを更新する"""
+        events = self.read_input()
+        self.input_log.capture(self.ticks, events, self.replay_state)
+        if events or not self.is_idle(): # 入力待ちで進めるものが無いフレームは step を省く (ティックも進めない)
+            self.step(events)
+
+    def is_idle(self):
+        """イベントが無ければ step が何もしない (タイトル画面、アニメーションの終わったゲームオーバー、
+        先読みの無い人の手番)"""
+        if self.game_state == GameState.TITLE:
+            return True
+        if self.game_state == GameState.GAME_OVER:
+            return self.winner == 0 or self.game_over_animation_count >= 4
+        if self.flipping_stones or self.is_demo_mode or self.current_player != self.player_color or self.mcts:
+            return False
+        return self.ponderer is None or self.ponderer.finished
+
+    def read_input(self):
+        """マウスとキーの入力をイベントにする (ゲームの状態は変えない)"""
+        events = []
+        clicked = pyxel.btnp(pyxel.MOUSE_BUTTON_LEFT)
+        mx, my = pyxel.mouse_x, pyxel.mouse_y
         if self.game_state == GameState.TITLE:
             button_w, button_h = 60, 30
             button_x = self.screen_size // 2 - 30
             black_button_y = 100
             white_button_y = black_button_y + button_h + 20
             demo_button_x, demo_button_y, demo_button_w, demo_button_h = self.screen_size // 2 - 30, self.screen_size + 5, 60, 15
+            size_button_y = white_button_y + button_h + 12
+            ai_button_x = self.screen_size - 65
 
-            if pyxel.btnp(pyxel.MOUSE_BUTTON_LEFT):
+            if clicked:
                 # 黒選択ボタンのクリック検出
-                if button_x <= pyxel.mouse_x <= button_x + button_w and black_button_y <= pyxel.mouse_y <= black_button_y + button_h:
-                    self.player_color, self.is_demo_mode = 1, False
-                    self.reset()
+                if button_x <= mx <= button_x + button_w and black_button_y <= my <= black_button_y + button_h:
+                    events.append(("start", 1))
                 # 白選択ボタンのクリック検出
-                elif button_x <= pyxel.mouse_x <= button_x + button_w and white_button_y <= pyxel.mouse_y <= white_button_y + button_h:
-                    self.player_color, self.is_demo_mode = -1, False
-                    self.reset()
+                elif button_x <= mx <= button_x + button_w and white_button_y <= my <= white_button_y + button_h:
+                    events.append(("start", -1))
                 # DEMOボタンのクリック検出
-                elif demo_button_x <= pyxel.mouse_x <= demo_button_x + demo_button_w and demo_button_y <= pyxel.mouse_y <= demo_button_y + demo_button_h:
-                    self.is_demo_mode, self.player_color = True, 0
+                elif demo_button_x <= mx <= demo_button_x + demo_button_w and demo_button_y <= my <= demo_button_y + demo_button_h:
+                    events.append(("start", 0))
+                # 盤の大きさの切り替えボタン
+                elif button_x <= mx <= button_x + button_w and size_button_y <= my <= size_button_y + 15:
+                    events.append(("size",))
+                # コンピュータの思考の切り替えボタン
+                elif ai_button_x <= mx <= ai_button_x + 60 and demo_button_y <= my <= demo_button_y + demo_button_h:
+                    events.append(("ai",))
+            return events
+
+        # RESTARTボタン
+        button_x, button_y, button_w, button_h = self.screen_size // 2 - 30, self.screen_size + 5, 60, 15
+        if pyxel.btnp(pyxel.KEY_R) or (clicked and button_x <= mx <= button_x + button_w and button_y <= my <= button_y + button_h):
+            events.append(("title",))
+        if pyxel.btnp(pyxel.KEY_H):
+            events.append(("heatmap",))
+        offset, board_size = 20, self.board_size * self.cell_size
+        if clicked and offset <= mx < offset + board_size and offset <= my < offset + board_size:
+            events.append(("place", (my - offset) // self.cell_size, (mx - offset) // self.cell_size))
+        return events
+
+    def step(self, events):
+        """イベントを適用して1フレーム進める"""
+        tick = self.ticks
+        self.ticks += 1
+        if self.game_state == GameState.TITLE:
+            for name, *args in events:
+                if name == "size":
+                    self.set_board_size(BOARD_SIZES[(BOARD_SIZES.index(self.board_size) + 1) % len(BOARD_SIZES)])
+                elif name == "ai":
+                    self.use_mcts = not self.use_mcts
+                elif name == "start":
+                    # 1: 黒, -1: 白, 0: コンピュータ同士のデモ
+                    self.player_color, self.is_demo_mode = args[0], args[0] == 0
                     self.reset()
+                    break
             return
 
         # ゲーム中またはゲームオーバー時のRESTARTボタン処理
         if self.game_state in [GameState.PLAYING, GameState.GAME_OVER]:
-            button_x, button_y, button_w, button_h = self.screen_size // 2 - 30, self.screen_size + 5, 60, 15
-            if pyxel.btnp(pyxel.KEY_R) or (pyxel.btnp(pyxel.MOUSE_BUTTON_LEFT) and \
-               button_x <= pyxel.mouse_x <= button_x + button_w and \
-               button_y <= pyxel.mouse_y <= button_y + button_h):
+            if ("title",) in events:
                 self.game_state, self.is_demo_mode = GameState.TITLE, False # タイトルに戻りデモモード解除
+                if self.ponderer:
+                    self.ponderer.cancel()
+                self.mcts = None
             
             # ゲームオーバー時のアニメーション更新
             if self.game_state == GameState.GAME_OVER:
@@ -115,9 +269,12 @@ class Reversi:
                 return
 
         if self.game_state == GameState.PLAYING:
+            if ("heatmap",) in events:
+                self.show_heatmap = not self.show_heatmap
+
             # 石をひっくり返すアニメーション中
             if self.flipping_stones:
-                if pyxel.frame_count % self.flip_delay == 0:
+                if tick % self.flip_delay == 0:
                     if self.flip_index < len(self.flipping_stones):
                         r, c = self.flipping_stones[self.flip_index]
                         self.board[r][c] = self.current_player
@@ -128,43 +285,58 @@ class Reversi:
                         self.flipping_stones, self.flip_index = [], 0
                         self.current_player *= -1 # プレイヤー交代
                         self.check_game_over()
+                self._ponder()
                 return # アニメーション中は他の入力を受け付けない
 
             # コンピュータのターンか判定
             is_computer_turn = self.is_demo_mode or self.current_player != self.player_color
             if is_computer_turn:
-                if pyxel.frame_count % 15 == 0: # 少し待ってから手を打つ
+                if tick % 15 == 0: # 少し待ってから手を打つ
                     self._computer_move()
+                else:
+                    self._ponder()
+                return
             # プレイヤーのターン
-            elif pyxel.btnp(pyxel.MOUSE_BUTTON_LEFT):
-                offset, board_size = 20, self.board_size * self.cell_size
-                if offset <= pyxel.mouse_x < offset + board_size and offset <= pyxel.mouse_y < offset + board_size:
-                    c, r = (pyxel.mouse_x - offset) // self.cell_size, (pyxel.mouse_y - offset) // self.cell_size
+            for name, *args in events:
+                if name == "place":
+                    r, c = args
                     stones_to_flip = self.is_valid_move(r, c)
                     if stones_to_flip:
-                        self.board[r][c] = self.current_player # 石を置く
-                        self.flip_stones(stones_to_flip) # 裏返す石をセット
+                        self.place_stone(r, c, stones_to_flip)
                     else:
                         pyxel.play(2, 4) # 無効な手のエラー音
+                    break
+            self._ponder()
+
+    def replay_state(self):
+        """入力の再生で照合する状態"""
+        return (self.game_state.value, getattr(self, "board", None), bytes(getattr(self, "moves", b"")),
+                self.cat_wins, self.dog_wins)
 
     def is_valid_move(self, r, c):
         """指定されたマスに石を置けるか、裏返せる石のリストを返す"""
-        if self.board[r][c] != 0: return []
-        stones_to_flip = []
-        for dr in [-1, 0, 1]:
-            for dc in [-1, 0, 1]:
-                if dr == 0 and dc == 0: continue
-                temp_flip, nr, nc = [], r + dr, c + dc
-                while 0 <= nr < self.board_size and 0 <= nc < self.board_size:
-                    if self.board[nr][nc] == -self.current_player:
-                        temp_flip.append((nr, nc))
-                    elif self.board[nr][nc] == self.current_player:
-                        temp_flip.sort(key=lambda p: abs(p[0] - r) + abs(p[1] - c))
-                        stones_to_flip.extend(temp_flip)
-                        break
-                    else: break # 空白マス
-                    nr, nc = nr + dr, nc + dc
-        return stones_to_flip
+        return reversi_engine.find_flips(self.board, self.current_player, r, c)
+
+    def place_stone(self, r, c, stones_to_flip):
+        """石を置いて棋譜に記録し、裏返すアニメーションを始める"""
+        self.board[r][c] = self.current_player
+        self.moves.append(reversi_records.encode_move(r, c))
+        self.flip_stones(stones_to_flip)
+        if self.mcts:
+            # 裏返し終わった後の局面に根を移す (読んでいた部分木はそのまま使う)
+            board = [row[:] for row in self.board]
+            for fr, fc in stones_to_flip:
+                board[fr][fc] = self.current_player
+            self.mcts.focus(board, -self.current_player)
+        elif self.ponderer and not self.is_demo_mode:
+            # 裏返し終わった後の局面で、次に打つ側に合わせて先読みの対象を変える
+            board = [row[:] for row in self.board]
+            for fr, fc in stones_to_flip:
+                board[fr][fc] = self.current_player
+            if self.current_player == self.player_color:
+                self.ponderer.focus(board, -self.current_player) # 人が打った: その局面だけを読む
+            else:
+                self.ponderer.expect(board, -self.current_player) # コンピュータが打った: 人の返し手を予想して読む
 
     def flip_stones(self, stones_to_flip):
         """指定された石を裏返すアニメーションの準備"""
@@ -173,6 +345,7 @@ class Reversi:
     def check_game_over(self):
         """ゲームの終了をチェックする"""
         if not self.has_valid_moves(self.current_player):
+            self.moves.append(reversi_records.PASS)
             self.current_player *= -1 # パス
             if not self.has_valid_moves(self.current_player):
                 self.game_over, self.game_state = True, GameState.GAME_OVER
@@ -180,28 +353,35 @@ class Reversi:
 
     def has_valid_moves(self, player):
         """指定されたプレイヤーが石を置ける場所があるか"""
-        return any(self.is_valid_move(r, c) for r in range(self.board_size) for c in range(self.board_size))
+        return reversi_engine.has_valid_moves(self.board, player)
+
+    @perf.timed("ponder")
+    def _ponder(self):
+        """空いているフレームでコンピュータの次の手を先読みする (局面数で区切るので、再生しても同じだけ読む)"""
+        if self.mcts:
+            self.mcts.think(MCTS_FRAME_PLAYOUTS)
+        elif self.ponderer and not self.is_demo_mode:
+            self.ponderer.think(PONDER_NODES)
 
+    @perf.timed("computer_move")
     def _computer_move(self):
         """コンピューターの思考ロジック"""
-        best_moves, max_score = [], -float('inf')
-        for r in range(self.board_size):
-            for c in range(self.board_size):
-                stones = self.is_valid_move(r, c)
-                if stones:
-                    # スコア計算: ひっくり返せる石の数 + マスの重み
-                    score = len(stones) + self._board_weights[r][c]
-                    if score > max_score:
-                        max_score, best_moves = score, [(r, c, stones)]
-                    elif score == max_score:
-                        best_moves.append((r, c, stones))
-        if best_moves:
-            import random
-            r, c, stones = random.choice(best_moves)
-            self.board[r][c] = self.current_player
-            self.flip_stones(stones)
+        if self.mcts:
+            # モンテカルロ木探索 (空いているフレームで育てた木のプレイアウト回数が一番多い手)
+            move = self.mcts.choose_move(self.board, self.current_player, MCTS_MIN_PLAYOUTS)
+        elif self.board_size == 8:
+            # 重みファイルがあればパターン評価の上位の手だけに確定石・着手可能数などの解析結果を足して選ぶ
+            # (無ければ全部の手を解析結果で選ぶ)
+            move = reversi_analysis.choose_move(self.board, self.current_player, self.evaluator, self.rng)
+        else:
+            # 大きな盤ではビットボードの αβ 探索 (読む局面数に上限があるので1手の時間はほぼ一定)
+            # 先読みした置換表を使うので、読んでいた局面なら同じ局面数でより深く読める
+            move = self.ponderer.choose_move(self.board, self.current_player, self.rng, COMPUTER_NODES)
+        if move:
+            self.place_stone(*move)
         else:
             # 有効な手がない場合はパス
+            self.moves.append(reversi_records.PASS)
             self.current_player *= -1
             self.check_game_over()
 
@@ -211,8 +391,7 @@ class Reversi:
 
     def calculate_winner(self):
         """勝者を計算する"""
-        black = sum(row.count(1) for row in self.board)
-        white = sum(row.count(-1) for row in self.board)
+        black, white = reversi_engine.count_stones(self.board)
         if black > white:
             self.winner, self.cat_wins = 1, self.cat_wins + 1
             pyxel.play(0, 1) # 猫の勝利音
@@ -220,10 +399,35 @@ class Reversi:
             self.winner, self.dog_wins = -1, self.dog_wins + 1
             pyxel.play(0, 0) # 犬の勝利音
         else: self.winner = 0
-        if self.winner != 0: self.start_game_over_animation()
+        if self.winner != 0:
+            self.start_game_over_animation()
+            self.stats.record(cat_wins=self.cat_wins, dog_wins=self.dog_wins)
+        self.save_record(black, white)
+
+    @perf.timed("save_record")
+    def save_record(self, black, white):
+        """終局した対局 (デモモードも含む) の棋譜を記録する。書き込めない環境と入力の再生中は記録しない"""
+        if self.input_log.replaying or self.board_size != 8: # 棋譜の形式は 8x8 の盤のみ
+            return
+        try:
+            if self.records is None:
+                self.records = reversi_records.GameRecords()
+            self.records.add(self.moves, black, white)
+        except reversi_records.RECORD_ERRORS:
+            pass
+
+    def view_key(self):
+        """draw の見た目を決める値"""
+        if self.game_state == GameState.TITLE:
+            return (self.game_state, self.board_size, self.use_mcts, self.cat_wins, self.dog_wins)
+        return (self.game_state, tuple(map(tuple, self.board)), self.current_player, self.is_demo_mode, self.winner,
+                self.show_special_face, self.show_heatmap, bool(self.flipping_stones),
+                self.ponderer and self.ponderer.last_depth, self.mcts and self.mcts.last_playouts)
 
     def draw(self):
-        """画面を描画する"""
+        """画面を描画する (前回描いたときから見た目が変わっていなければ何もしない)"""
+        if not self.redraw.needs_redraw(self.view_key()):
+            return
         pyxel.cls(3) # 背景色
         if self.game_state == GameState.TITLE:
             self._draw_title_text()
@@ -239,29 +443,29 @@ class Reversi:
             pyxel.rect(button_x, white_button_y, button_w, button_h, 7)
             pyxel.text(button_x + 18, white_button_y + 12, "WHITE", 0)
 
+            # 盤の大きさの切り替えボタン
+            size_y = white_button_y + button_h + 12
+            pyxel.rectb(button_x, size_y, button_w, 15, 7)
+            pyxel.text(button_x + 10, size_y + 5, f"BOARD {self.board_size}x{self.board_size}", 7)
+
+            # コンピュータの思考の切り替えボタン
+            ai_x = self.screen_size - 65
+            pyxel.rectb(ai_x, self.screen_size + 5, 60, 15, 7)
+            pyxel.text(ai_x + 8, self.screen_size + 10, "CPU MCTS" if self.use_mcts else "CPU SEARCH", 7)
+
             # DEMOボタン
             demo_x, demo_y, demo_w, demo_h = self.screen_size // 2 - 30, self.screen_size + 5, 60, 15
             pyxel.rect(demo_x, demo_y, demo_w, demo_h, 1)
             pyxel.text(demo_x + 18, demo_y + 4, "DEMO", 7)
             return
 
-        # 盤面の描画
-        offset, board_size = 20, self.board_size * self.cell_size
-        for i in range(self.board_size + 1):
-            pyxel.line(offset + i * self.cell_size, offset, offset + i * self.cell_size, offset + board_size, 7)
-            pyxel.line(offset, offset + i * self.cell_size, offset + board_size, offset + i * self.cell_size, 7)
-
-        # 石の描画
-        for r in range(self.board_size):
-            for c in range(self.board_size):
-                stone = self.board[r][c]
-                if stone == 0: continue
-                x, y, radius = offset + c * self.cell_size + 11, offset + r * self.cell_size + 11, self.cell_size // 2 - 3
-                win, lose = False, False
-                if self.game_state == GameState.GAME_OVER and self.winner != 0 and self.show_special_face:
-                    win, lose = (self.winner == stone), (self.winner == -stone)
-                if stone == 1: self._draw_black_cat(x, y, radius, win, lose)
-                else: self._draw_white_dog(x, y, radius, win, lose)
+        # 盤面と石の描画
+        offset = 20
+        show_faces = self.game_state == GameState.GAME_OVER and self.show_special_face
+        draw_board(self.board, offset, self.cell_size, self.winner if show_faces else 0)
+
+        if self.show_heatmap and self.game_state == GameState.PLAYING and not self.flipping_stones:
+            self._draw_heatmap(offset)
 
         # メッセージの表示
         if self.game_state == GameState.GAME_OVER:
@@ -271,61 +475,50 @@ class Reversi:
             player = "BLACK CAT" if self.current_player == 1 else "WHITE DOG"
             player_text = f"{player}'s Turn" if not self.is_demo_mode else "DEMO MODE"
             pyxel.text(25, self.screen_size - 15, player_text, 7)
+            pyxel.text(self.screen_size - 60, self.screen_size - 15, "H: HEATMAP", 13 if not self.show_heatmap else 10)
+            if self.show_heatmap and self.ponderer and self.ponderer.last_depth:
+                pyxel.text(25, 7, f"CPU DEPTH {self.ponderer.last_depth}", 10) # 直前のコンピュータの手で読み切った深さ
+            if self.show_heatmap and self.mcts and self.mcts.last_playouts:
+                pyxel.text(25, 7, f"CPU {self.mcts.last_playouts} PLAYOUTS", 10) # 直前のコンピュータの手の根のプレイアウト数
 
         # RESTARTボタンの描画
         if self.game_state in [GameState.PLAYING, GameState.GAME_OVER]:
             x, y, w, h = self.screen_size // 2 - 30, self.screen_size + 5, 60, 15
             pyxel.rect(x, y, w, h, 1); pyxel.text(x + 8, y + 4, "RESTART", 7)
 
-    def _draw_black_cat(self, x, y, radius, winning_face=False, losing_face=False):
-        # 顔と耳
-        pyxel.circ(x, y, radius, 0)
-        pyxel.tri(x - radius*0.7, y - radius*0.7, x - radius*0.2, y - radius*0.7, x - radius*0.45, y - radius*1.2, 0)
-        pyxel.tri(x + radius*0.2, y - radius*0.7, x + radius*0.7, y - radius*0.7, x + radius*0.45, y - radius*1.2, 0)
-        
-        # 目
-        eye_r, eye_ox, eye_oy = radius * 0.15, radius * 0.3, radius * 0.2
-        pyxel.circ(x - eye_ox, y - eye_oy, eye_r, 14)
-        pyxel.circ(x + eye_ox, y - eye_oy, eye_r, 14)
-
-        # 表情
-        if winning_face:
-            # にっこりした口
-            mouth_y = y + radius * 0.4
-            pyxel.line(x - 4, mouth_y, x - 2, mouth_y + 2, 8); pyxel.line(x - 2, mouth_y + 2, x + 2, mouth_y + 2, 8); pyxel.line(x + 2, mouth_y + 2, x + 4, mouth_y, 8)
-        elif losing_face:
-            # 口を丸く開ける
-            pyxel.circ(x, y + radius * 0.5, radius * 0.3, 8)
-
-    def _draw_white_dog(self, x, y, radius, winning_face=False, losing_face=False):
-        # 顔と耳
-        pyxel.circ(x, y, radius, 7)
-        pyxel.tri(x - radius*0.7, y - radius*0.7, x - radius*0.2, y - radius*0.7, x - radius*0.45, y - radius*1.2, 7)
-        pyxel.tri(x + radius*0.2, y - radius*0.7, x + radius*0.7, y - radius*0.7, x + radius*0.45, y - radius*1.2, 7)
-
-        # 目と鼻
-        eye_r, eye_ox, eye_oy = radius * 0.15, radius * 0.3, radius * 0.2
-        pyxel.circ(x - eye_ox, y - eye_oy, eye_r, 0)
-        pyxel.circ(x + eye_ox, y - eye_oy, eye_r, 0)
-        pyxel.circ(x, y + radius * 0.3, radius * 0.2, 0) # 鼻は常に表示
-
-        # 表情
-        if winning_face:
-            # にっこりした口
-            mouth_y = y + radius * 0.4
-            pyxel.line(x - 4, mouth_y, x - 2, mouth_y + 2, 8); pyxel.line(x - 2, mouth_y + 2, x + 2, mouth_y + 2, 8); pyxel.line(x + 2, mouth_y + 2, x + 4, mouth_y, 8)
-        elif losing_face:
-            # 舌を出す
-            pyxel.rect(x - radius*0.2, y + radius*0.6, radius*0.4, radius*0.6, 8)
+    def _draw_heatmap(self, offset):
+        """手番側の打てる手を評価の低い順に青→赤で塗り、両者の確定石を黄色の枠で囲む"""
+        key = (tuple(map(tuple, self.board)), self.current_player)
+        if key != self.heatmap_key:
+            if self.board_size == 8:
+                scores = reversi_analysis.move_scores(self.board, self.current_player, self.evaluator)
+                black, white = reversi_analysis.to_bitboards(self.board, 1)
+                stable = list(reversi_analysis.cells(reversi_analysis.stable_discs(black, white) | reversi_analysis.stable_discs(white, black)))
+            else: # 大きな盤では1手読みの評価だけを表示する (確定石の解析は 8x8 専用)
+                scores, stable = reversi_bitboard.move_scores(self.board, self.current_player), []
+            self.heatmap_key, self.heatmap = key, (scores, stable)
+        scores, stable = self.heatmap
+        colors = (5, 12, 11, 10, 9, 8)
+        if scores:
+            low = min(score for score, _ in scores.values())
+            high = max(score for score, _ in scores.values())
+            for (r, c), (score, _) in scores.items():
+                level = int((score - low) / (high - low) * (len(colors) - 1)) if high > low else len(colors) - 1
+                inset = self.cell_size // 3
+                x, y = offset + c * self.cell_size + inset, offset + r * self.cell_size + inset
+                pyxel.rect(x, y, self.cell_size - 2 * inset + 1, self.cell_size - 2 * inset + 1, colors[level])
+        for r, c in stable:
+            pyxel.rectb(offset + c * self.cell_size + 1, offset + r * self.cell_size + 1, self.cell_size - 1, self.cell_size - 1, 10)
 
     def _draw_title_text(self):
         """タイトル画面のキャラクターと勝数を描画"""
         y, r = 30, 20
         cat_x, dog_x = self.screen_size // 2 - 60, self.screen_size // 2 + 60
-        self._draw_black_cat(cat_x, y, r)
+        draw_black_cat(cat_x, y, r)
         pyxel.text(cat_x + r + 5, y, str(self.cat_wins), 7)
         pyxel.line(self.screen_size//2 - 15, y, self.screen_size//2 + 15, y, 7)
-        self._draw_white_dog(dog_x, y, r)
+        draw_white_dog(dog_x, y, r)
         pyxel.text(dog_x + r + 5, y, str(self.dog_wins), 7)
 
-Reversi()
+if __name__ == "__main__":
+    Reversi()
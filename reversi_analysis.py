@@ -0,0 +1,206 @@
+import random
+
+from reversi_engine import DIRECTIONS, WEIGHT_SCALE, find_flips
+
+# リバーシの局面解析 (確定石・辺縁の石・潜在的な着手可能数・偶数理論の空きマスの領域)
+# 盤面を 64 ビットの整数 (ビット r * 8 + c) 2つで表し、シフトとマスクによる塗りつぶしで計算するので、
+# 探索の各ノードで呼んでも重くならない
+
+FULL = (1 << 64) - 1
+NOT_A_FILE = sum(1 << (r * 8 + c) for r in range(8) for c in range(8) if c != 0) # 左端の列以外
+NOT_H_FILE = sum(1 << (r * 8 + c) for r in range(8) for c in range(8) if c != 7) # 右端の列以外
+INNER = NOT_A_FILE & NOT_H_FILE
+# 方向ごとのシフト量と、その方向に連なれる相手の石のマスク (横に動く方向は両端の列で折り返さないよう除く)
+SHIFTS = [(dr * 8 + dc, INNER if dc else FULL) for dr, dc in DIRECTIONS]
+
+def neighbours(bits):
+    """bits の周囲8マス (bits 自身を含む)"""
+    row = bits | ((bits & NOT_H_FILE) << 1) | ((bits & NOT_A_FILE) >> 1)
+    return (row | (row << 8) | (row >> 8)) & FULL
+
+def to_bitboards(board, player):
+    """リストの盤面から (手番側の石, 相手の石) のビットボードを作る"""
+    own = opp = 0
+    for r, row in enumerate(board):
+        for c, v in enumerate(row):
+            if v == player:
+                own |= 1 << (r * 8 + c)
+            elif v:
+                opp |= 1 << (r * 8 + c)
+    return own, opp
+
+def cells(bits):
+    """ビットボードの石の (r, c) を順に返す"""
+    while bits:
+        low = bits & -bits
+        yield divmod(low.bit_length() - 1, 8)
+        bits ^= low
+
+def legal_moves(own, opp):
+    """own 側が打てるマス。各方向に相手の石の連なりを伸ばし、その先の空きマスを集める"""
+    empty = ~(own | opp) & FULL
+    moves = 0
+    for amount, inner in SHIFTS:
+        mask = opp & inner
+        if amount > 0:
+            run = mask & (own << amount)
+            run |= mask & (run << amount)
+            run |= mask & (run << amount)
+            run |= mask & (run << amount)
+            run |= mask & (run << amount)
+            run |= mask & (run << amount)
+            moves |= empty & (run << amount)
+        else:
+            amount = -amount
+            run = mask & (own >> amount)
+            run |= mask & (run >> amount)
+            run |= mask & (run >> amount)
+            run |= mask & (run >> amount)
+            run |= mask & (run >> amount)
+            run |= mask & (run >> amount)
+            moves |= empty & (run >> amount)
+    return moves
+
+def frontier(own, opp):
+    """空きマスに接している own 側の石 (多いほど相手に打つ場所を与える)"""
+    return own & neighbours(~(own | opp) & FULL)
+
+def potential_mobility(own, opp):
+    """相手の石に接している空きマス (own 側が将来打てるかもしれない場所)"""
+    return ~(own | opp) & neighbours(opp)
+
+# 軸 (横・縦・斜め2方向) ごとの1列分のマスク
+def _line_masks(dr, dc):
+    masks = []
+    for r in range(8):
+        for c in range(8):
+            if 0 <= r - dr < 8 and 0 <= c - dc < 8:
+                continue # 列の先頭のマスからだけ数える
+            mask, nr, nc = 0, r, c
+            while 0 <= nr < 8 and 0 <= nc < 8:
+                mask |= 1 << (nr * 8 + nc)
+                nr, nc = nr + dr, nc + dc
+            masks.append(mask)
+    return masks
+
+AXES = [(0, 1), (1, 0), (1, 1), (1, -1)]
+AXIS_LINES = [_line_masks(dr, dc) for dr, dc in AXES]
+# 軸の方向に盤外と接しているマス (その軸ではひっくり返されない)
+EDGE_H, EDGE_V, EDGE_D, EDGE_A = [
+    sum(1 << (r * 8 + c) for r in range(8) for c in range(8)
+        if not (0 <= r + dr < 8 and 0 <= c + dc < 8) or not (0 <= r - dr < 8 and 0 <= c - dc < 8))
+    for dr, dc in AXES]
+
+def full_lines(occupied):
+    """軸ごとに、列が全て埋まっているマス (その軸ではもう裏返らない)"""
+    full = []
+    for lines in AXIS_LINES:
+        filled = 0
+        for mask in lines:
+            if occupied & mask == mask:
+                filled |= mask
+        full.append(filled)
+    return full
+
+def stable_discs(own, opp, full=None):
+    """own 側の確定石
+    4つの軸それぞれで「列が埋まっている」「盤外と接している」「隣が own 側の確定石」のどれかを満たす石を、
+    変化がなくなるまで広げていく (隅から辺・内側へ塗りつぶす)。full は full_lines の結果を使い回すとき用"""
+    full_h, full_v, full_d, full_a = full or full_lines(own | opp)
+    horizontal, vertical = own & (full_h | EDGE_H), own & (full_v | EDGE_V)
+    diagonal, anti = own & (full_d | EDGE_D), own & (full_a | EDGE_A)
+    stable = 0
+    while True:
+        east, west = stable & NOT_H_FILE, stable & NOT_A_FILE
+        grown = ((horizontal | (east << 1) | (west >> 1))
+                 & (vertical | (stable << 8) | (stable >> 8))
+                 & (diagonal | (east << 9) | (west >> 9))
+                 & (anti | (west << 7) | (east >> 7))
+                 & own)
+        if grown == stable:
+            return stable
+        stable = grown
+
+def parity_regions(own, opp):
+    """空きマスを8近傍でつながった領域に分ける (終盤の偶数理論用)"""
+    empty = ~(own | opp) & FULL
+    regions = []
+    while empty:
+        region = empty & -empty
+        while True:
+            grown = (region | neighbours(region)) & empty
+            if grown == region:
+                break
+            region = grown
+        regions.append(region)
+        empty &= ~region
+    return regions
+
+def analyze(board, player):
+    """解析結果をまとめて返す (ヒントの表示やデバッグ用)。ビットボードは手番側と相手側の組"""
+    own, opp = to_bitboards(board, player)
+    return {
+        "moves": (legal_moves(own, opp), legal_moves(opp, own)),
+        "stable": (stable_discs(own, opp), stable_discs(opp, own)),
+        "frontier": (frontier(own, opp), frontier(opp, own)),
+        "potential_mobility": (potential_mobility(own, opp), potential_mobility(opp, own)),
+        "regions": parity_regions(own, opp),
+    }
+
+# 評価の重み (石差の単位)
+MOBILITY_WEIGHT = 1.0
+POTENTIAL_WEIGHT = 0.25
+STABLE_WEIGHT = 1.5
+FRONTIER_WEIGHT = 0.25
+PARITY_WEIGHT = 1.0
+# パターン評価があるとき、解析の評価値を足すのはパターン評価の上位この数の手だけ
+# (解析は1手 20us ほどかかる。全部の手を解析しても強さはほとんど変わらない)
+ANALYSIS_MOVES = 3
+
+def evaluate(own, opp):
+    """相手の手番の局面を own 側から見た評価値"""
+    mobility = legal_moves(own, opp).bit_count() - legal_moves(opp, own).bit_count()
+    potential = potential_mobility(own, opp).bit_count() - potential_mobility(opp, own).bit_count()
+    full = full_lines(own | opp)
+    stable = stable_discs(own, opp, full).bit_count() - stable_discs(opp, own, full).bit_count()
+    front = frontier(own, opp).bit_count() - frontier(opp, own).bit_count()
+    score = (MOBILITY_WEIGHT * mobility + POTENTIAL_WEIGHT * potential
+             + STABLE_WEIGHT * stable - FRONTIER_WEIGHT * front)
+    if (~(own | opp) & FULL).bit_count() <= 16:
+        # 終盤は空きマスが奇数個の領域ほど、先に打つ側 (ここでは相手) が最後の1マスを取りやすい
+        odd = sum(region.bit_count() & 1 for region in parity_regions(own, opp))
+        score -= PARITY_WEIGHT * odd
+    return score
+
+def move_scores(board, player, evaluator=None, limit=None):
+    """打てる手ごとの {(r, c): (評価値, 裏返る石)}。evaluator があればパターン評価も足す
+    evaluator と limit を渡すと、パターン評価の上位 limit 手だけを解析して返す"""
+    own, opp = to_bitboards(board, player)
+    # 打てるマスはビットボードで求め、裏返る石はそのマスだけ調べる (valid_moves と同じ順)
+    moves = [(r, c, find_flips(board, player, r, c)) for r, c in cells(legal_moves(own, opp))]
+    if evaluator:
+        gains = evaluator.move_gains(evaluator.indices(board), player, moves, (own | opp).bit_count() + 1)
+        ranked = list(zip(moves, gains))
+        if limit is not None and len(ranked) > limit:
+            ranked.sort(key=lambda item: -player * item[1]) # 同点は盤の順のまま
+            del ranked[limit:]
+    else:
+        ranked = [(move, 0) for move in moves]
+    scores = {}
+    for (r, c, stones), gain in ranked:
+        flips = sum(1 << (fr * 8 + fc) for fr, fc in stones)
+        score = evaluate(own | flips | (1 << (r * 8 + c)), opp & ~flips)
+        if evaluator:
+            score += player * gain / WEIGHT_SCALE
+        scores[(r, c)] = (score, stones)
+    return scores
+
+def choose_move(board, player, evaluator=None, rng=random):
+    """評価値が最大の手 (同点はランダム) を (r, c, 裏返る石) で返す。打てなければ None"""
+    best_moves, max_score = [], -float('inf')
+    for (r, c), (score, stones) in move_scores(board, player, evaluator, ANALYSIS_MOVES).items():
+        if score > max_score:
+            max_score, best_moves = score, [(r, c, stones)]
+        elif score == max_score:
+            best_moves.append((r, c, stones))
+    return rng.choice(best_moves) if best_moves else None
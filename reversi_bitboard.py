@@ -0,0 +1,322 @@
+import functools
+import random
+
+from reversi_engine import DIRECTIONS, find_flips
+
+# 任意の大きさ (8x8, 10x10, 12x12 ...) の盤で使うビットボードのリバーシエンジン
+# 盤面を Python の整数 (ビット r * size + c) 2つで表す。盤の大きさごとに端の列のマスクとシフト量、
+# マスの重み表を一度だけ作って Geometry にまとめる
+# 8x8 専用の解析 (確定石など) は reversi_analysis、こちらは大きな盤の着手生成と探索用
+
+def weight_table(size):
+    """8x8 の BOARD_WEIGHTS と同じ考え方のマスの重みを size x size に広げて作る
+    隅 100、隅の隣 (C) -20、隅の斜め隣 (X) -50、辺は隅から2つ目が 10 でそれ以外 5、
+    外から2周目 -2、内側 1"""
+    last = size - 1
+    table = [[1] * size for _ in range(size)]
+    for r in range(size):
+        for c in range(size):
+            edge_r, edge_c = min(r, last - r), min(c, last - c) # 上下・左右の端からの距離
+            if edge_r == 0 and edge_c == 0:
+                weight = 100
+            elif edge_r <= 1 and edge_c <= 1:
+                weight = -50 if edge_r == edge_c == 1 else -20
+            elif edge_r == 0 or edge_c == 0:
+                weight = 10 if max(edge_r, edge_c) == 2 else 5
+            elif edge_r == 1 or edge_c == 1:
+                weight = -2
+            else:
+                weight = 1
+            table[r][c] = weight
+    return table
+
+class Geometry:
+    """size x size の盤のマスク・シフト量・重み"""
+    def __init__(self, size):
+        self.size = size
+        self.full = (1 << (size * size)) - 1
+        not_left = sum(1 << (r * size + c) for r in range(size) for c in range(1, size))
+        not_right = sum(1 << (r * size + c) for r in range(size) for c in range(size - 1))
+        inner = not_left & not_right
+        # 方向ごとのシフト量と、その方向に連なれる相手の石のマスク (横に動く方向は両端の列で折り返さないよう除く)
+        self.shifts = [(dr * size + dc, inner if dc else self.full) for dr, dc in DIRECTIONS]
+        self.weights = weight_table(size)
+        # 同じ重みのマスをまとめたマスク (重みの大きい順。評価と手の並べ替えに使う)
+        masks = {}
+        for r, row in enumerate(self.weights):
+            for c, weight in enumerate(row):
+                masks[weight] = masks.get(weight, 0) | (1 << (r * size + c))
+        self.weight_masks = sorted(masks.items(), reverse=True)
+
+@functools.lru_cache(maxsize=None)
+def geometry(size):
+    return Geometry(size)
+
+def to_bitboards(board, player):
+    """リストの盤面から (手番側の石, 相手の石) のビットボードを作る"""
+    own = opp = 0
+    bit = 1
+    for row in board:
+        for v in row:
+            if v == player:
+                own |= bit
+            elif v:
+                opp |= bit
+            bit <<= 1
+    return own, opp
+
+def cells(geo, bits):
+    """ビットボードの石の (r, c) を順に返す"""
+    while bits:
+        low = bits & -bits
+        yield divmod(low.bit_length() - 1, geo.size)
+        bits ^= low
+
+def legal_moves(geo, own, opp):
+    """own 側が打てるマス。各方向に相手の石の連なりを伸ばし、その先の空きマスを集める"""
+    empty = ~(own | opp) & geo.full
+    moves = 0
+    extend = range(geo.size - 3) # 相手の石の連なりは最大 size - 2 個
+    for amount, inner in geo.shifts:
+        mask = opp & inner
+        if amount > 0:
+            run = mask & (own << amount)
+            for _ in extend:
+                run |= mask & (run << amount)
+            moves |= empty & (run << amount)
+        else:
+            amount = -amount
+            run = mask & (own >> amount)
+            for _ in extend:
+                run |= mask & (run >> amount)
+            moves |= empty & (run >> amount)
+    return moves
+
+def flips(geo, own, opp, move):
+    """move (1ビット) に own 側が打ったときに裏返る石"""
+    flipped = 0
+    for amount, inner in geo.shifts:
+        mask = opp & inner
+        run, x = 0, move
+        while True:
+            x = x << amount if amount > 0 else x >> -amount
+            if x & mask:
+                run |= x
+            else:
+                if x & own:
+                    flipped |= run
+                break
+    return flipped
+
+def evaluate(geo, own, opp):
+    """手番側から見た評価値 (マスの重みの差 + 着手可能数の差)"""
+    score = 0
+    for weight, mask in geo.weight_masks:
+        score += weight * ((own & mask).bit_count() - (opp & mask).bit_count())
+    return score + 4 * (legal_moves(geo, own, opp).bit_count() - legal_moves(geo, opp, own).bit_count())
+
+class SearchBudget(Exception):
+    pass
+
+# 置換表のエントリの種類: 評価値が正確な値か、下限 (β カットした) か、上限 (どの手も α を超えなかった) か
+EXACT, LOWER, UPPER = 0, 1, 2
+TABLE_LIMIT = 200000 # 置換表のエントリ数がこれを超えたら空にする
+
+class Search:
+    """αβ探索 (ネガマックス) を深さ1から深くしていき、node 数の上限に達したら1つ前の深さの結果を使う
+    上限を時間ではなく局面数にしているので、同じ局面では必ず同じ手を返す (入力の再生で同じ対局になる)
+    table (置換表) を渡すと、読み終えた局面の結果を {(own, opp): (深さ, 種類, 評価値, 最善手)} に残して使い回す
+    置換表の中身も同じ手順で作られるので、同じ入力なら結果は変わらない"""
+    def __init__(self, geo, max_nodes, table=None):
+        self.geo = geo
+        self.max_nodes = max_nodes
+        self.nodes = 0
+        self.table = table
+
+    def ordered(self, moves, first=0):
+        """first (前に読んだときの最善手) を先に、残りは重みの大きいマスから順に1ビットずつ返す (αβ の枝刈りが効きやすい)"""
+        if moves & first:
+            yield first
+            moves ^= first
+        for _, mask in self.geo.weight_masks:
+            bits = moves & mask
+            while bits:
+                low = bits & -bits
+                yield low
+                bits ^= low
+
+    def negamax(self, own, opp, depth, alpha, beta):
+        self.nodes += 1
+        if self.nodes > self.max_nodes:
+            raise SearchBudget
+        geo = self.geo
+        if depth == 0:
+            return evaluate(geo, own, opp)
+        table, first = self.table, 0
+        if table is not None:
+            entry = table.get((own, opp))
+            if entry:
+                entry_depth, kind, score, first = entry
+                if entry_depth >= depth and (kind == EXACT or (kind == LOWER and score >= beta) or (kind == UPPER and score <= alpha)):
+                    return score
+        moves = legal_moves(geo, own, opp)
+        if not moves:
+            if not legal_moves(geo, opp, own): # 終局: 石数の差を大きな値にする
+                return 10000 * ((own.bit_count() > opp.bit_count()) - (own.bit_count() < opp.bit_count()))
+            return -self.negamax(opp, own, depth - 1, -beta, -alpha) # パス
+        best_move = 0
+        for move in self.ordered(moves, first):
+            flipped = flips(geo, own, opp, move)
+            score = -self.negamax(opp & ~flipped, own | flipped | move, depth - 1, -beta, -alpha)
+            if score > alpha:
+                alpha, best_move = score, move
+                if alpha >= beta:
+                    break
+        if table is not None:
+            kind = LOWER if alpha >= beta else EXACT if best_move else UPPER
+            table[(own, opp)] = (depth, kind, alpha, best_move or first)
+        return alpha
+
+    def root_scores(self, own, opp, depth, exact=False):
+        """打てる手ごとの評価値 {ビット: 値}
+        exact でなければ、それまでの最善より悪い手は枝刈りして「最善 - 1 以下」という上限だけを返す
+        (評価値は整数なので、最善と同点の手は正確な値になる)"""
+        scores = {}
+        best, best_move = -float('inf'), 0
+        entry = self.table.get((own, opp)) if self.table is not None else None
+        for move in self.ordered(legal_moves(self.geo, own, opp), entry[3] if entry else 0):
+            flipped = flips(self.geo, own, opp, move)
+            alpha = -float('inf') if exact else best - 1
+            score = -self.negamax(opp & ~flipped, own | flipped | move, depth - 1, -float('inf'), -alpha)
+            scores[move] = score
+            if score > best:
+                best, best_move = score, move
+        if self.table is not None and best_move:
+            self.table[(own, opp)] = (depth, EXACT, best, best_move)
+        return scores
+
+def move_scores(board, player, depth=1):
+    """打てる手ごとの {(r, c): (評価値, 裏返る石)} (ヒートマップ用)"""
+    geo = geometry(len(board))
+    own, opp = to_bitboards(board, player)
+    scores = Search(geo, float('inf')).root_scores(own, opp, depth, exact=True)
+    return {divmod(move.bit_length() - 1, geo.size): (score, None) for move, score in scores.items()}
+
+def iterative_deepening(geo, own, opp, max_nodes, max_depth, table=None):
+    """局面数の上限 (または max_depth) まで深さ1から読み、(最後に読み切った深さの {手: 評価値}, その深さ) を返す"""
+    search = Search(geo, max_nodes, table)
+    scores, reached = None, 0
+    for depth in range(1, max_depth + 1):
+        try:
+            scores, reached = search.root_scores(own, opp, depth), depth
+        except SearchBudget:
+            break
+    if scores is None: # 深さ1も読み切れなかった (局面数の上限がとても小さい)
+        scores, reached = Search(geo, float('inf')).root_scores(own, opp, 1), 1
+    return scores, reached
+
+def choose_move(board, player, rng=random, max_nodes=1000, max_depth=8, table=None):
+    """反復深化の αβ 探索で選んだ手 (同点はランダム) を (r, c, 裏返る石) で返す。打てなければ None"""
+    geo = geometry(len(board))
+    own, opp = to_bitboards(board, player)
+    if not legal_moves(geo, own, opp):
+        return None
+    scores, _ = iterative_deepening(geo, own, opp, max_nodes, max_depth, table)
+    return _pick(board, player, geo, scores, rng)
+
+def _pick(board, player, geo, scores, rng):
+    best = max(scores.values())
+    move = rng.choice([m for m, score in scores.items() if score == best])
+    r, c = divmod(move.bit_length() - 1, geo.size)
+    return r, c, find_flips(board, player, r, c)
+
+class Ponderer:
+    """人の手番の間 (コンピュータの手番を待つ間も) に、コンピュータが次に打つ局面を少しずつ読んでおく
+    人の手番では人の有力な手 replies 個それぞれを打った後の局面を、浅い順 (同じ深さなら有力な順) に1段ずつ深く読む
+    結果は置換表に残るので、実際に打たれた手が読んでいた手なら、コンピュータの探索は同じ局面数で深くまで届く
+    think は局面数で区切るので、入力の再生でも同じフレームで同じだけ読み、同じ手を選ぶ"""
+    def __init__(self, size, replies=3, max_depth=8):
+        self.geo = geometry(size)
+        self.replies = replies
+        self.max_depth = max_depth
+        self.table = {}
+        self.targets = [] # [コンピュータの石, 人の石, 読み終えた深さ, 深さごとにかかった局面数]
+        self.last_depth = 0 # 直前のコンピュータの手で読み切った深さ
+
+    def expect(self, board, player):
+        """player (人) の手番になったときに呼ぶ。人の有力な手を打った後の局面を読む対象にする"""
+        self._trim()
+        own, opp = to_bitboards(board, player)
+        if not legal_moves(self.geo, own, opp): # 人はパス: コンピュータが続けて打つ
+            self.targets = [[opp, own, 0, []]]
+            return
+        scores = Search(self.geo, float('inf'), self.table).root_scores(own, opp, 1, exact=True)
+        likely = sorted(scores, key=scores.get, reverse=True)[:self.replies]
+        self.targets = []
+        for move in likely:
+            flipped = flips(self.geo, own, opp, move)
+            self.targets.append([opp & ~flipped, own | flipped | move, 0, []])
+
+    def focus(self, board, player):
+        """player (コンピュータ) が次に打つ局面が決まったら、その局面だけを読む"""
+        self._trim()
+        own, opp = to_bitboards(board, player)
+        for target in self.targets:
+            if target[:2] == [own, opp]: # 読んでいた手だった: それまでの読みを続ける
+                self.targets = [target]
+                return
+        self.targets = [[own, opp, 0, []]]
+
+    def cancel(self):
+        """読みをやめて置換表を捨てる (やり直しやタイトルに戻ったとき)"""
+        self.targets = []
+        self.table.clear()
+
+    @property
+    def finished(self):
+        """読む対象を全て max_depth まで読み終えた (think を呼んでも何もしない)"""
+        return all(target[2] >= self.max_depth for target in self.targets)
+
+    def _trim(self):
+        if len(self.table) > TABLE_LIMIT:
+            self.table.clear()
+
+    def think(self, nodes):
+        """局面 nodes 個分だけ読み進める"""
+        search = Search(self.geo, nodes, self.table)
+        while True:
+            pending = [target for target in self.targets if target[2] < self.max_depth]
+            if not pending:
+                return
+            target = min(pending, key=lambda target: target[2])
+            if len(target[3]) == target[2]:
+                target[3].append(0)
+            start = search.nodes
+            try:
+                search.root_scores(target[0], target[1], target[2] + 1)
+            except SearchBudget:
+                target[3][-1] += search.nodes - start - 1 # 上限を超えた1局面は読んでいない
+                return
+            target[3][-1] += search.nodes - start
+            target[2] += 1
+
+    def choose_move(self, board, player, rng=random, max_nodes=1000):
+        """置換表を使って choose_move と同じように手を選ぶ
+        読んでいた局面で、次の深さが局面数の上限内に読み切れそうにないときは、読み終えた深さまでですぐに返す
+        (次の深さにかかる局面数は、先読みで深さごとにかかった局面数の増え方から見積もる)"""
+        own, opp = to_bitboards(board, player)
+        if not legal_moves(self.geo, own, opp):
+            return None
+        max_depth = self.max_depth
+        for _, _, depth, costs in (t for t in self.targets if t[:2] == [own, opp]):
+            if depth >= 2:
+                growth = max(2, costs[depth - 1] / max(costs[depth - 2], 1))
+                if costs[depth - 1] * growth > max_nodes:
+                    max_depth = depth
+        scores, self.last_depth = iterative_deepening(self.geo, own, opp, max_nodes, max_depth, self.table)
+        return _pick(board, player, self.geo, scores, rng)
+
+def has_legal_moves(board, player):
+    geo = geometry(len(board))
+    own, opp = to_bitboards(board, player)
+    return legal_moves(geo, own, opp) != 0
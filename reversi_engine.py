@@ -0,0 +1,317 @@
+import functools
+import os
+import random
+
+# リバーシのルールエンジン (pyxel に依存しないので、サーバーやベンチマークからも使える)
+# 盤面は board[r][c] のリストで、0: 空き, 1: 黒 (猫), -1: 白 (犬)
+
+EMPTY, BLACK, WHITE = 0, 1, -1
+DIRECTIONS = [(dr, dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if dr or dc]
+
+BOARD_WEIGHTS = [
+    [100, -20, 10, 5, 5, 10, -20, 100],
+    [-20, -50, -2, -2, -2, -2, -50, -20],
+    [10, -2, 1, 1, 1, 1, -2, 10],
+    [5, -2, 1, 1, 1, 1, -2, 5],
+    [5, -2, 1, 1, 1, 1, -2, 5],
+    [10, -2, 1, 1, 1, 1, -2, 10],
+    [-20, -50, -2, -2, -2, -2, -50, -20],
+    [100, -20, 10, 5, 5, 10, -20, 100]
+]
+
+class IllegalMove(ValueError):
+    pass
+
+def new_board(size=8):
+    """中央に4つの石を置いた初期盤面を作る"""
+    board = [[EMPTY] * size for _ in range(size)]
+    center = size // 2
+    board[center - 1][center - 1] = WHITE
+    board[center - 1][center] = BLACK
+    board[center][center - 1] = BLACK
+    board[center][center] = WHITE
+    return board
+
+@functools.lru_cache(maxsize=None)
+def rays(size):
+    """rays(size)[r][c]: (r, c) から各方向 (DIRECTIONS の順) に盤の端まで並べたマスのリスト
+    石を挟むには2マス以上必要なので、それより短い方向は含めない"""
+    table = []
+    for r in range(size):
+        row = []
+        for c in range(size):
+            cell_rays = []
+            for dr, dc in DIRECTIONS:
+                ray, nr, nc = [], r + dr, c + dc
+                while 0 <= nr < size and 0 <= nc < size:
+                    ray.append((nr, nc))
+                    nr, nc = nr + dr, nc + dc
+                if len(ray) >= 2:
+                    cell_rays.append(ray)
+            row.append(cell_rays)
+        table.append(row)
+    return table
+
+def find_flips(board, player, r, c):
+    """(r, c) に player が石を置いたときに裏返る石のリストを返す (置けなければ空)"""
+    if board[r][c] != EMPTY: return []
+    opponent = -player
+    stones_to_flip = []
+    for ray in rays(len(board))[r][c]:
+        nr, nc = ray[0]
+        if board[nr][nc] != opponent:
+            continue
+        for i in range(1, len(ray)):
+            nr, nc = ray[i]
+            v = board[nr][nc]
+            if v == player:
+                stones_to_flip.extend(ray[:i]) # 置いた石に近い順
+                break
+            if v != opponent: break # 空白マス
+    return stones_to_flip
+
+def valid_moves(board, player):
+    """打てる手の (r, c, 裏返る石) のリスト"""
+    size = len(board)
+    moves = []
+    for r in range(size):
+        for c in range(size):
+            stones = find_flips(board, player, r, c)
+            if stones:
+                moves.append((r, c, stones))
+    return moves
+
+def has_valid_moves(board, player):
+    size = len(board)
+    return any(find_flips(board, player, r, c) for r in range(size) for c in range(size))
+
+def apply_move(board, player, r, c):
+    """石を置いて裏返し、裏返した石のリストを返す"""
+    stones = find_flips(board, player, r, c)
+    if not stones:
+        raise IllegalMove(f"({r}, {c}) is not a valid move")
+    board[r][c] = player
+    for fr, fc in stones:
+        board[fr][fc] = player
+    return stones
+
+def choose_move(board, player, rng=random):
+    """ひっくり返せる石の数 + マスの重み が最大の手 (同点はランダム) を返す。打てなければ None"""
+    best_moves, max_score = [], -float('inf')
+    for r, c, stones in valid_moves(board, player):
+        score = len(stones) + BOARD_WEIGHTS[r][c]
+        if score > max_score:
+            max_score, best_moves = score, [(r, c, stones)]
+        elif score == max_score:
+            best_moves.append((r, c, stones))
+    return rng.choice(best_moves) if best_moves else None
+
+def count_stones(board):
+    black = sum(row.count(BLACK) for row in board)
+    white = sum(row.count(WHITE) for row in board)
+    return black, white
+
+class Game:
+    """1局分の状態。手番の交代とパス、終局判定まで面倒を見る"""
+    def __init__(self, size=8):
+        self.board = new_board(size)
+        self.current_player = BLACK
+        self.moves = [] # (player, r, c)。パスは (player, None, None)
+        self.over = False
+        self.winner = 0 # 0: 引き分け, 1: 黒の勝ち, -1: 白の勝ち
+
+    def play(self, r, c):
+        """現在の手番の石を置く。裏返した石のリストを返す"""
+        if self.over:
+            raise IllegalMove("game is over")
+        stones = apply_move(self.board, self.current_player, r, c)
+        self.moves.append((self.current_player, r, c))
+        self.current_player = -self.current_player
+        self._resolve_passes()
+        return stones
+
+    def _resolve_passes(self):
+        if has_valid_moves(self.board, self.current_player):
+            return
+        self.moves.append((self.current_player, None, None))
+        self.current_player = -self.current_player # パス
+        if not has_valid_moves(self.board, self.current_player):
+            self.over = True
+            black, white = count_stones(self.board)
+            self.winner = (black > white) - (white > black)
+
+# --- パターン評価 ---
+# 辺・各行と列・隅の3x3・斜めの列のマス目の並びを3進数のインデックスにして、学習済みの重み表を引くだけで評価する
+# 重みは reversi_train.py で自己対戦の局面から最小二乗法で求め、reversi_weights.bin に書き出す
+WEIGHTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reversi_weights.bin")
+WEIGHTS_MAGIC = b"RVW1"
+WEIGHT_SCALE = 64 # 重みは石差 x 64 の int16 を zlib で圧縮して保存する
+CELL_CODES = (0, 1, 2) # 空き: 0, 黒: 1, 白: 2 (board の値 -1 はインデックス -1 で 2 になる)
+
+def _corner(rows, cols):
+    return [(r, c) for r in rows for c in cols]
+
+def _lines(row):
+    """row 行目・7 - row 行目と、同じ位置の縦の列"""
+    return [[(row, c) for c in range(8)], [(7 - row, c) for c in range(8)],
+            [(r, row) for r in range(8)], [(r, 7 - row) for r in range(8)]]
+
+def _diagonals(d):
+    """主対角線から d ずれた長さ 8 - d の斜めの列"""
+    n = 8 - d
+    return [[(i, i + d) for i in range(n)], [(i + d, i) for i in range(n)],
+            [(i, 7 - d - i) for i in range(n)], [(i + d, 7 - i) for i in range(n)]]
+
+# (パターン名, 同じ重み表を共有するインスタンスのマスの並び)
+# 盤の対称形どうしで重み表を共有するので、表は盤の向きによらない
+PATTERNS = [
+    ("edge", _lines(0)),
+    ("line2", _lines(1)),
+    ("line3", _lines(2)),
+    ("line4", _lines(3)),
+    ("corner", [_corner((0, 1, 2), (0, 1, 2)), _corner((0, 1, 2), (7, 6, 5)),
+                _corner((7, 6, 5), (0, 1, 2)), _corner((7, 6, 5), (7, 6, 5))]),
+    ("diagonal", [[(i, i) for i in range(8)], [(i, 7 - i) for i in range(8)]]),
+    ("diagonal7", _diagonals(1)),
+    ("diagonal6", _diagonals(2)),
+    ("diagonal5", _diagonals(3)),
+    ("diagonal4", _diagonals(4)),
+]
+PHASE_BOUNDS = (20, 44) # 盤上の石の数で序盤・中盤・終盤に分ける
+
+def game_phase(discs):
+    return sum(discs >= bound for bound in PHASE_BOUNDS)
+
+# マスごとに、そのマスを含むインスタンス (PATTERNS 全体での通し番号) と3進数の桁の重み
+INSTANCE_KINDS = [k for k, (_, instances) in enumerate(PATTERNS) for _ in instances]
+CELL_TERMS = [[[] for _ in range(8)] for _ in range(8)]
+for _g, _cells in enumerate(cells for _, instances in PATTERNS for cells in instances):
+    for _i, (_r, _c) in enumerate(_cells):
+        CELL_TERMS[_r][_c].append((_g, 3 ** (len(_cells) - 1 - _i)))
+
+MAX_INCREMENTAL_CHANGES = 24 # 前回の盤面からこれより多くのマスが変わっていたら全部数え直す
+
+# 手番ごと・マスごとに、石を置いたとき / 裏返したときの (インスタンス, インデックスの増分)
+PLACE_TERMS = {player: [[[(g, CELL_CODES[player] * power) for g, power in terms] for terms in row] for row in CELL_TERMS]
+               for player in (BLACK, WHITE)}
+FLIP_TERMS = {player: [[[(g, (CELL_CODES[player] - CELL_CODES[-player]) * power) for g, power in terms]
+                        for terms in row] for row in CELL_TERMS]
+              for player in (BLACK, WHITE)}
+
+class PatternEvaluator:
+    """学習済みのパターン重み表による評価関数 (黒から見た予想石差を返す)"""
+    def __init__(self, tables):
+        self.tables = tables # tables[phase][pattern] -> 3**len(cells) 個の重み
+        # 盤上の石の数 -> インスタンスごとの重み表 (手ごとに game_phase を計算しない)
+        instance_tables = [[phase_tables[kind] for kind in INSTANCE_KINDS] for phase_tables in tables]
+        self.instance_tables = [instance_tables[min(game_phase(discs), len(tables) - 1)] for discs in range(66)]
+        self.rows = None     # 前回 indices を求めた盤面の写しと、そのインデックス
+        self.last_indices = None
+        self.scratch = [0] * len(INSTANCE_KINDS) # move_gains の作業用 (いつも全部 0 に戻す)
+
+    def indices(self, board):
+        """各インスタンスの3進数のインデックス (返したリストは次の呼び出しで書き換わるので変更しないこと)
+        前回の盤面から変わったマス (1手ごとなら置いた石と裏返った石だけ) を含むインスタンスだけを直す"""
+        rows, indices = self.rows, self.last_indices
+        if rows is None:
+            return self.full_indices(board)
+        codes = CELL_CODES
+        changes = 0
+        for r in range(8):
+            row, old = board[r], rows[r]
+            if row == old:
+                continue
+            for c in range(8):
+                if row[c] != old[c]:
+                    changes += 1
+                    if changes > MAX_INCREMENTAL_CHANGES: # 別の対局の盤面など
+                        return self.full_indices(board)
+                    delta = codes[row[c]] - codes[old[c]]
+                    for g, power in CELL_TERMS[r][c]:
+                        indices[g] += delta * power
+            rows[r] = row[:]
+        return indices
+
+    def full_indices(self, board):
+        codes = CELL_CODES
+        result = []
+        for _, instances in PATTERNS:
+            for cells in instances:
+                index = 0
+                for r, c in cells:
+                    index = index * 3 + codes[board[r][c]]
+                result.append(index)
+        self.rows, self.last_indices = [row[:] for row in board], result
+        return result
+
+    def evaluate(self, board, discs):
+        tables = self.tables[game_phase(discs)]
+        return sum(tables[kind][index] for kind, index in zip(INSTANCE_KINDS, self.indices(board))) / WEIGHT_SCALE
+
+    def move_gain(self, indices, player, r, c, stones, discs):
+        """(r, c) に打って stones を裏返したときの評価値の増分 (黒から見た値 x WEIGHT_SCALE)
+        変化するマスを含むインスタンスだけを引き直すので、盤面全体を評価し直すより安い"""
+        return self.move_gains(indices, player, [(r, c, stones)], discs)[0]
+
+    def move_gains(self, indices, player, moves, discs):
+        """moves の (r, c, stones) それぞれの move_gain のリスト (表の選択などを手ごとに繰り返さない)"""
+        tables = self.instance_tables[discs]
+        place_terms, flip_terms = PLACE_TERMS[player], FLIP_TERMS[player]
+        deltas = self.scratch # インスタンスごとのインデックスの変化 (手ごとに dict を作らない)
+        gains = []
+        for r, c, stones in moves:
+            touched = []
+            for g, delta in place_terms[r][c]:
+                if not deltas[g]: touched.append(g)
+                deltas[g] += delta
+            for fr, fc in stones:
+                for g, delta in flip_terms[fr][fc]:
+                    if not deltas[g]: touched.append(g) # 途中で 0 に戻ると2回入るが、2回目は差が 0 なので足しても変わらない
+                    deltas[g] += delta
+            gain = 0
+            for g in touched:
+                table, index = tables[g], indices[g]
+                gain += table[index + deltas[g]] - table[index]
+                deltas[g] = 0
+            gains.append(gain)
+        return gains
+
+def load_pattern_evaluator(path=WEIGHTS_FILE):
+    """重みファイルを読み込む。無い場合は None (従来の重み付き貪欲法を使う)"""
+    import array
+    import sys
+    import zlib
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if data[:4] != WEIGHTS_MAGIC:
+        raise ValueError(f"{path} is not a Reversi weight file")
+    weights = array.array('h')
+    weights.frombytes(zlib.decompress(data[5:]))
+    if sys.byteorder == "big":
+        weights.byteswap()
+    tables, offset = [], 0
+    for _ in range(data[4]):
+        phase_tables = []
+        for _, instances in PATTERNS:
+            size = 3 ** len(instances[0])
+            phase_tables.append(weights[offset:offset + size])
+            offset += size
+        tables.append(phase_tables)
+    return PatternEvaluator(tables)
+
+def choose_move_by_patterns(board, player, evaluator, rng=random):
+    """パターン評価が最大になる手 (同点はランダム) を返す。打てなければ None
+    打つ前の盤面の評価値はどの手でも共通なので、手ごとの増分だけを比べる"""
+    best_moves, max_score = [], -float('inf')
+    discs = len(board) ** 2 - sum(row.count(EMPTY) for row in board) + 1
+    moves = valid_moves(board, player)
+    for move, gain in zip(moves, evaluator.move_gains(evaluator.indices(board), player, moves, discs)):
+        score = player * gain
+        if score > max_score:
+            max_score, best_moves = score, [move]
+        elif score == max_score:
+            best_moves.append(move)
+    return rng.choice(best_moves) if best_moves else None
@@ -0,0 +1,120 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import reversi_engine
+
+# reversi_server.py の負荷試験クライアント
+# 多数の対局をコンピューター相手に並行して打ち、1秒あたりの手数と応答レイテンシの分位点を表示する
+# 手はサーバーから届いた差分だけで組み立てた手元の盤面から選ぶので、差分が壊れていれば不正手エラーとして現れる
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else 0.0
+
+class LoadClient:
+    def __init__(self, games, rng):
+        self.games = games
+        self.rng = rng
+        self.boards = {}  # game id -> (board, my color)
+        self.sent_at = {} # game id -> 自分の手を送った時刻
+        self.latencies = []
+        self.moves = 0
+        self.errors = 0
+        self.finished = 0
+
+    async def run(self, host, port):
+        reader, writer = await asyncio.open_connection(host, port)
+        self.writer = writer
+        for _ in range(self.games):
+            self.send({"op": "new", "mode": "ai", "color": self.rng.choice([reversi_engine.BLACK, reversi_engine.WHITE])})
+        await writer.drain()
+        while self.finished < self.games:
+            line = await reader.readline()
+            if not line:
+                break
+            self.on_message(json.loads(line))
+            await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+
+    def send(self, message):
+        self.writer.write(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+
+    def on_message(self, message):
+        op, game_id = message["op"], message.get("game")
+        if op == "joined":
+            self.boards[game_id] = (reversi_engine.new_board(), message["color"])
+            self.maybe_move(game_id, message["next"])
+        elif op == "diff":
+            board, color = self.boards[game_id]
+            r, c = message["move"]
+            board[r][c] = message["player"]
+            for fr, fc in message["flips"]:
+                board[fr][fc] = message["player"]
+            self.moves += 1
+            if message["player"] == color and game_id in self.sent_at:
+                self.latencies.append((time.perf_counter() - self.sent_at.pop(game_id)) * 1000)
+            self.maybe_move(game_id, message["next"])
+        elif op == "over":
+            self.boards.pop(game_id, None)
+            self.finished += 1
+        elif op == "error":
+            self.errors += 1
+            if game_id in self.boards: # 打ち直せないので対局を諦める
+                self.boards.pop(game_id)
+                self.finished += 1
+
+    def maybe_move(self, game_id, next_player):
+        board, color = self.boards[game_id]
+        if next_player != color:
+            return
+        moves = reversi_engine.valid_moves(board, color)
+        if not moves:
+            return
+        r, c, _ = self.rng.choice(moves)
+        self.sent_at[game_id] = time.perf_counter()
+        self.send({"op": "move", "game": game_id, "r": r, "c": c})
+
+async def run_load(host, port, games, connections, seed):
+    rng = random.Random(seed)
+    per_connection = [games // connections + (1 if i < games % connections else 0) for i in range(connections)]
+    clients = [LoadClient(n, random.Random(rng.getrandbits(32))) for n in per_connection if n]
+    start = time.perf_counter()
+    await asyncio.gather(*(client.run(host, port) for client in clients))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(l for client in clients for l in client.latencies)
+    moves = sum(client.moves for client in clients)
+    print(f"games={sum(c.finished for c in clients)}/{games} connections={len(clients)} moves={moves} "
+          f"errors={sum(c.errors for c in clients)} elapsed={elapsed:.2f}s moves/sec={moves / elapsed:.0f}")
+    print(f"move latency ms: p50={percentile(latencies, 0.50):.2f} p95={percentile(latencies, 0.95):.2f} "
+          f"p99={percentile(latencies, 0.99):.2f} max={latencies[-1] if latencies else 0.0:.2f}")
+
+async def main(args):
+    server = None
+    if args.local:
+        # 同じプロセス内でサーバーを立てて試す
+        import reversi_server
+        server = reversi_server.ReversiServer(args.ai_workers)
+        listener = await server.start(args.host, args.port)
+    try:
+        await run_load(args.host, args.port, args.games, args.connections, args.seed)
+    finally:
+        if server:
+            await asyncio.sleep(0.1) # サーバー側の接続が閉じ終わるのを待つ
+            listener.close()
+            await listener.wait_closed()
+            server.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load generator for reversi_server.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--connections", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--local", action="store_true", help="start a server in this process")
+    parser.add_argument("--ai-workers", type=int, default=2, help="AI workers for --local")
+    asyncio.run(main(parser.parse_args()))
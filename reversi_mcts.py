@@ -0,0 +1,270 @@
+import argparse
+import functools
+import math
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import reversi_bitboard
+import reversi_engine
+from reversi_bitboard import flips, geometry, legal_moves, to_bitboards
+
+# モンテカルロ木探索 (UCT) のリバーシのコンピュータ。着手生成は reversi_bitboard を使うので盤の大きさは問わない
+# プレイアウトは軽い方策: 隅に打てれば隅に、それ以外はランダムに打って終局させる
+# 予算はプレイアウトの回数か秒数。ゲームの中では回数で区切るので、入力を再生しても同じ手を選ぶ
+# 並列化はルート並列: ワーカーごとに別の乱数の種で独立に木を作り、ルートの手ごとの訪問回数を足して一番多い手を選ぶ
+#   python reversi_mcts.py --match 20 --playouts 4000 --workers 4   # αβ 探索 (reversi_bitboard) と対戦させる
+#   python reversi_mcts.py --match 20 --seconds 0.5 --nodes 4000     # 1手の時間で区切る
+
+UCT_C = 1.0              # UCT の探索項の係数 (勝率は 0..1)
+MAX_TREE_NODES = 200000  # 木の節点数がこれを超えたら展開せずにプレイアウトだけする
+
+@functools.lru_cache(maxsize=None)
+def corner_mask(size):
+    last = size - 1
+    return sum(1 << (r * size + c) for r in (0, last) for c in (0, last))
+
+def nth_bit(bits, n):
+    """bits の下から n 番目 (0 始まり) に立っているビット"""
+    for _ in range(n):
+        bits &= bits - 1
+    return bits & -bits
+
+def playout(geo, own, opp, rng):
+    """own の手番から終局まで打ち、own 側から見た石差を返す"""
+    corners = corner_mask(geo.size)
+    full = geo.full
+    sign, passed = 1, False
+    while (own | opp) != full:
+        moves = legal_moves(geo, own, opp)
+        if moves:
+            passed = False
+            if moves & corners:
+                moves &= corners
+            move = nth_bit(moves, rng.randrange(moves.bit_count()))
+            flipped = flips(geo, own, opp, move)
+            own, opp = opp ^ flipped, own | move | flipped
+        elif passed:
+            break
+        else:
+            passed = True
+            own, opp = opp, own
+        sign = -sign
+    return sign * (own.bit_count() - opp.bit_count())
+
+class Node:
+    """探索木の節点。own が手番側の石、wins はこの節点に打った側 (own の相手) の勝ち数 (引き分けは 0.5)
+    size はこの節点を根とする部分木の節点数"""
+    __slots__ = ('parent', 'move', 'own', 'opp', 'untried', 'children', 'visits', 'wins', 'size')
+
+    def __init__(self, geo, parent, move, own, opp):
+        self.parent, self.move = parent, move
+        self.own, self.opp = own, opp
+        self.untried = legal_moves(geo, own, opp) # まだ子を作っていない手
+        self.children = []
+        self.visits, self.wins = 0, 0.0
+        self.size = 1
+        if not self.untried and legal_moves(geo, opp, own):
+            self.children.append(Node(geo, self, 0, opp, own)) # パスしかできない (move 0 はパス)
+            self.size = 2
+
+class MCTS:
+    """1つの探索木。think で少しずつ育て、focus で実際に進んだ局面の部分木に根を移して使い回す"""
+    def __init__(self, size, rng, c=UCT_C, max_nodes=MAX_TREE_NODES):
+        self.geo = geometry(size)
+        self.rng = rng
+        self.c = c
+        self.max_nodes = max_nodes
+        self.nodes = 0 # 今の根の部分木の節点数 (根を移したときに捨てた節点は数えない)
+        self.root = None
+        self.last_playouts = 0 # 直前に選んだ手の根のプレイアウト回数
+
+    def focus(self, board, player):
+        """board で player が打つ局面を根にする。今の木の3手先までにあればその部分木を残す"""
+        self.set_root(*to_bitboards(board, player))
+
+    def set_root(self, own, opp):
+        if self.root is not None:
+            level = [self.root]
+            for _ in range(4): # 根 + 3手 (パスを挟んでも2手先まで届く)
+                for node in level:
+                    if node.own == own and node.opp == opp:
+                        node.parent = None
+                        self.root = node
+                        self.nodes = node.size
+                        return
+                level = [child for node in level for child in node.children]
+        self.root = Node(self.geo, None, 0, own, opp)
+        self.nodes = self.root.size
+
+    def think(self, playouts=None, deadline=None):
+        """根からプレイアウトを playouts 回 (または perf_counter が deadline を過ぎるまで) 行い、行った回数を返す"""
+        geo, rng, c, log, sqrt = self.geo, self.rng, self.c, math.log, math.sqrt
+        done = 0
+        while playouts is None or done < playouts:
+            if deadline is not None and done & 15 == 0 and time.perf_counter() > deadline:
+                break
+            node = self.root
+            # 選択: 子を作り終えた節点では UCT の値が最大の子へ進む
+            while not node.untried and node.children:
+                children = node.children
+                if len(children) == 1:
+                    node = children[0]
+                    continue
+                scale = c * sqrt(log(node.visits))
+                best, best_value = None, -1.0
+                for child in children:
+                    value = child.wins / child.visits + scale / sqrt(child.visits)
+                    if value > best_value:
+                        best, best_value = child, value
+                node = best
+            # 展開: まだ試していない手を1つ選んで子を作る
+            if node.untried and self.nodes < self.max_nodes:
+                move = nth_bit(node.untried, rng.randrange(node.untried.bit_count()))
+                node.untried ^= move
+                flipped = flips(geo, node.own, node.opp, move)
+                child = Node(geo, node, move, node.opp ^ flipped, node.own | move | flipped)
+                node.children.append(child)
+                self.nodes += child.size
+                ancestor = node
+                while ancestor is not None:
+                    ancestor.size += child.size
+                    ancestor = ancestor.parent
+                node = child
+            # プレイアウトの結果 (node の手番側の勝ち: 1, 引き分け: 0.5) を根まで伝える
+            diff = playout(geo, node.own, node.opp, rng)
+            result = 1.0 if diff > 0 else 0.5 if diff == 0 else 0.0
+            while node is not None:
+                node.visits += 1
+                node.wins += 1.0 - result
+                result = 1.0 - result
+                node = node.parent
+            done += 1
+        return done
+
+    def root_visits(self):
+        """根で打てる手ごとの {手: [訪問回数, 勝ち数]} (まだ子を作っていない手は 0 回)"""
+        stats = {child.move: [child.visits, child.wins] for child in self.root.children if child.move}
+        untried = self.root.untried
+        while untried:
+            move = untried & -untried
+            stats[move] = [0, 0.0]
+            untried ^= move
+        return stats
+
+    def choose_move(self, board, player, min_playouts=1):
+        """board で player が打つ手を、根の訪問回数が最も多い子で選んで (r, c, 裏返る石) で返す。打てなければ None
+        根のプレイアウトが min_playouts 回に満たなければ足りない分をここで行う"""
+        self.focus(board, player)
+        if not self.root.untried and not any(child.move for child in self.root.children):
+            return None
+        if self.root.visits < min_playouts:
+            self.think(min_playouts - self.root.visits)
+        self.last_playouts = self.root.visits
+        return _pick(board, player, self.geo, self.root_visits())
+
+def _pick(board, player, geo, stats):
+    move = max(stats, key=lambda m: stats[m]) # 訪問回数、同じなら勝ち数の多い手
+    r, c = divmod(move.bit_length() - 1, geo.size)
+    return r, c, reversi_engine.find_flips(board, player, r, c)
+
+def _search_worker(size, own, opp, playouts, seconds, seed):
+    """プロセスプール上で1本の木を作り、(根の {手: [訪問回数, 勝ち数]}, プレイアウト回数, CPU 秒) を返す"""
+    start = time.process_time()
+    tree = MCTS(size, random.Random(seed))
+    tree.set_root(own, opp)
+    deadline = time.perf_counter() + seconds if seconds else None
+    done = tree.think(None if seconds else playouts, deadline)
+    return tree.root_visits(), done, time.process_time() - start
+
+class SearchStats:
+    """1手の探索にかかったプレイアウト回数・経過時間・全プロセスの CPU 時間"""
+    __slots__ = ('playouts', 'seconds', 'cpu_seconds')
+
+    def __init__(self, playouts, seconds, cpu_seconds):
+        self.playouts, self.seconds, self.cpu_seconds = playouts, seconds, cpu_seconds
+
+    @property
+    def rate(self):
+        """プレイアウト/秒 (経過時間あたり)"""
+        return self.playouts / max(self.seconds, 1e-9)
+
+def new_pool(workers):
+    """ルート並列用のプロセスプール (reversi_server と同じく spawn で作る)"""
+    return ProcessPoolExecutor(workers, multiprocessing.get_context("spawn"))
+
+def parallel_search(board, player, rng, playouts=2000, seconds=None, pool=None, workers=1):
+    """ルート並列の MCTS で選んだ手と SearchStats を返す (打てなければ手は None)
+    workers 本の木に playouts を等分する (seconds を渡すと回数ではなく時間で区切る)。pool が無ければこのプロセスで順に作る"""
+    geo = geometry(len(board))
+    own, opp = to_bitboards(board, player)
+    start = time.perf_counter()
+    if not legal_moves(geo, own, opp):
+        return None, SearchStats(0, 0.0, 0.0)
+    workers = max(1, workers)
+    jobs = [(geo.size, own, opp, playouts // workers + (i < playouts % workers), seconds, rng.randrange(1 << 32))
+            for i in range(workers)]
+    results = list(pool.map(_search_worker, *zip(*jobs))) if pool else [_search_worker(*job) for job in jobs]
+    merged = {}
+    for stats, _, _ in results:
+        for move, (visits, wins) in stats.items():
+            total = merged.setdefault(move, [0, 0.0])
+            total[0] += visits
+            total[1] += wins
+    stats = SearchStats(sum(done for _, done, _ in results), time.perf_counter() - start,
+                        sum(cpu for _, _, cpu in results))
+    return _pick(board, player, geo, merged), stats
+
+def match(args):
+    """MCTS と αβ 探索を黒白交互に持たせて対戦させ、勝敗と1手あたりの CPU 時間を表示する"""
+    rng = random.Random(args.seed)
+    pool = new_pool(args.workers) if args.workers > 1 else None
+    wins = losses = draws = 0
+    cpu, moves, playouts, wall = [0.0, 0.0], [0, 0], 0, 0.0
+    try:
+        for i in range(args.match):
+            mcts_color = reversi_engine.BLACK if i % 2 == 0 else reversi_engine.WHITE
+            game = reversi_engine.Game(args.size)
+            for _ in range(4): # 序盤をランダムにして同じ棋譜の繰り返しを避ける
+                if game.over: break
+                r, c, _ = rng.choice(reversi_engine.valid_moves(game.board, game.current_player))
+                game.play(r, c)
+            while not game.over:
+                if game.current_player == mcts_color:
+                    move, stats = parallel_search(game.board, game.current_player, rng, args.playouts, args.seconds,
+                                                  pool, args.workers)
+                    cpu[0] += stats.cpu_seconds
+                    playouts += stats.playouts
+                    wall += stats.seconds
+                    side = 0
+                else:
+                    start = time.process_time()
+                    move = reversi_bitboard.choose_move(game.board, game.current_player, rng, args.nodes)
+                    cpu[1] += time.process_time() - start
+                    side = 1
+                moves[side] += 1
+                game.play(move[0], move[1])
+            wins += game.winner == mcts_color
+            losses += game.winner == -mcts_color
+            draws += game.winner == 0
+            print(f"game {i + 1}: mcts {'wins' if game.winner == mcts_color else 'draw' if game.winner == 0 else 'loses'}")
+    finally:
+        if pool:
+            pool.shutdown()
+    games = max(args.match, 1)
+    print(f"mcts vs alpha-beta ({args.size}x{args.size}): {wins}W {losses}L {draws}D "
+          f"({(wins + draws / 2) / games * 100:.0f}% score)")
+    print(f"cpu seconds per move: mcts={cpu[0] / max(moves[0], 1):.3f} alpha-beta={cpu[1] / max(moves[1], 1):.3f}")
+    print(f"mcts playouts/sec: {playouts / max(wall, 1e-9):.0f} with {args.workers} worker(s)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte Carlo tree search player for Reversi")
+    parser.add_argument("--match", type=int, default=10, help="games against the alpha-beta search")
+    parser.add_argument("--size", type=int, default=8, choices=(8, 10, 12))
+    parser.add_argument("--playouts", type=int, default=2000, help="playouts per move (split across workers)")
+    parser.add_argument("--seconds", type=float, default=None, help="think for this long per move instead")
+    parser.add_argument("--workers", type=int, default=1, help="root-parallel trees, one process each")
+    parser.add_argument("--nodes", type=int, default=1000, help="alpha-beta positions per move")
+    parser.add_argument("--seed", type=int, default=1)
+    match(parser.parse_args())
@@ -0,0 +1,218 @@
+import argparse
+import os
+import random
+import struct
+
+import reversi_engine
+from reversi_engine import BLACK
+
+try:
+    import sqlite3
+except ImportError: # ブラウザ版などで sqlite3 が無い場合は棋譜の保存だけ行う
+    sqlite3 = None
+
+# リバーシの棋譜と局面データベース
+# 棋譜は1手1バイト (r * 8 + c、パスは PASS) で、records/games-NNNNN.log に追記していく
+#   1局分のレコード: 手数 (uint16) + 終局時の黒石数 (uint8) + 白石数 (uint8) + 手のバイト列
+# ログが SEGMENT_SIZE を超えたら次のセグメントに切り替える (書き込み済みのセグメントは変更しない)
+# 局面データベース (records/positions.sqlite) は各局面のハッシュから対局と次の手を引けるようにした索引で、
+# ログから何度でも作り直せる。「この局面になった対局」「この局面でどの手を打つと勝率がいくつか」をログを読まずに答える
+RECORDS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "records")
+SEGMENT_SIZE = 1 << 20
+PASS = 64
+HEADER = struct.Struct("<HBB")
+
+# 記録に失敗したときに出る例外 (ゲーム側はこれを捕まえて記録を諦める)
+RECORD_ERRORS = (OSError, sqlite3.Error) if sqlite3 else (OSError,)
+
+def encode_move(r, c):
+    return PASS if r is None else r * 8 + c
+
+def decode_move(byte):
+    return (None, None) if byte == PASS else divmod(byte, 8)
+
+def encode_game(moves):
+    """reversi_engine.Game.moves の (player, r, c) のリストを棋譜のバイト列にする"""
+    return bytes(encode_move(r, c) for _, r, c in moves)
+
+# 局面のハッシュ (Zobrist)。sqlite の INTEGER に収まるよう 63 ビットにする
+_zobrist_rng = random.Random(20240501)
+ZOBRIST = [[_zobrist_rng.getrandbits(63) for _ in range(64)] for _ in range(2)] # [黒, 白][マス]
+ZOBRIST_WHITE_TO_MOVE = _zobrist_rng.getrandbits(63)
+
+def position_hash(board, player):
+    h = 0 if player == BLACK else ZOBRIST_WHITE_TO_MOVE
+    for r, row in enumerate(board):
+        for c, v in enumerate(row):
+            if v:
+                h ^= ZOBRIST[v != BLACK][r * 8 + c]
+    return h
+
+def replay(moves):
+    """棋譜をたどり、各手の直前の (局面のハッシュ, 手番, 手のバイト) と最終局面を返す"""
+    board, player = reversi_engine.new_board(), BLACK
+    steps = []
+    for byte in moves:
+        steps.append((position_hash(board, player), player, byte))
+        if byte != PASS:
+            reversi_engine.apply_move(board, player, *decode_move(byte))
+        player = -player
+    return steps, board, player
+
+class RecordLog:
+    """セグメントに分けた追記専用の棋譜ログ"""
+    def __init__(self, directory=RECORDS_DIR, segment_size=SEGMENT_SIZE):
+        self.directory = directory
+        self.segment_size = segment_size
+        os.makedirs(directory, exist_ok=True)
+
+    def segments(self):
+        return sorted(int(name[6:11]) for name in os.listdir(self.directory)
+                      if name.startswith("games-") and name.endswith(".log"))
+
+    def path(self, segment):
+        return os.path.join(self.directory, f"games-{segment:05d}.log")
+
+    def append(self, moves, black, white):
+        """1局分を追記して (セグメント番号, オフセット) を返す"""
+        segments = self.segments()
+        segment = segments[-1] if segments else 1
+        if segments and os.path.getsize(self.path(segment)) >= self.segment_size:
+            segment += 1
+        with open(self.path(segment), "ab") as f:
+            offset = f.tell()
+            f.write(HEADER.pack(len(moves), black, white) + bytes(moves))
+        return segment, offset
+
+    def read(self, segment, offset):
+        with open(self.path(segment), "rb") as f:
+            f.seek(offset)
+            count, black, white = HEADER.unpack(f.read(HEADER.size))
+            return f.read(count), black, white
+
+    def scan(self):
+        """全レコードを (セグメント番号, オフセット, 棋譜, 黒石数, 白石数) で順に返す"""
+        for segment in self.segments():
+            with open(self.path(segment), "rb") as f:
+                data = f.read()
+            offset = 0
+            while offset + HEADER.size <= len(data):
+                count, black, white = HEADER.unpack_from(data, offset)
+                end = offset + HEADER.size + count
+                if end > len(data):
+                    break # 書き込み途中で終わったレコード
+                yield segment, offset, data[offset + HEADER.size:end], black, white
+                offset = end
+
+class PositionDatabase:
+    """局面のハッシュ -> (対局, 手数, 次の手) の索引と対局の結果"""
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS games (
+            id INTEGER PRIMARY KEY, segment INTEGER, offset INTEGER,
+            black INTEGER, white INTEGER, winner INTEGER, UNIQUE (segment, offset));
+        CREATE TABLE IF NOT EXISTS positions (
+            hash INTEGER, game INTEGER, ply INTEGER, player INTEGER, move INTEGER);
+        CREATE INDEX IF NOT EXISTS positions_hash ON positions (hash);
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.executescript(self.SCHEMA)
+
+    def add_game(self, segment, offset, moves, black, white):
+        steps, _, _ = replay(moves)
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT OR IGNORE INTO games (segment, offset, black, white, winner) VALUES (?, ?, ?, ?, ?)",
+                (segment, offset, black, white, (black > white) - (white > black)))
+            if not cursor.rowcount:
+                return None # 索引済み
+            game_id = cursor.lastrowid
+            self.db.executemany("INSERT INTO positions VALUES (?, ?, ?, ?, ?)",
+                                [(h, game_id, ply, player, byte) for ply, (h, player, byte) in enumerate(steps)])
+        return game_id
+
+    def games_reaching(self, board, player):
+        """この局面 (手番を含む) になった対局の id のリスト"""
+        rows = self.db.execute("SELECT DISTINCT game FROM positions WHERE hash = ?", (position_hash(board, player),))
+        return [game for game, in rows]
+
+    def move_stats(self, board, player):
+        """この局面で打たれた手ごとの {(r, c): (対局数, 手番側の勝ち数, 引き分け数)}。パスのキーは (None, None)"""
+        rows = self.db.execute("""
+            SELECT p.move, COUNT(*), SUM(g.winner = p.player), SUM(g.winner = 0)
+            FROM positions p JOIN games g ON g.id = p.game
+            WHERE p.hash = ? GROUP BY p.move""", (position_hash(board, player),))
+        return {decode_move(move): (games, wins, draws) for move, games, wins, draws in rows}
+
+    def locate(self, game_id):
+        return self.db.execute("SELECT segment, offset FROM games WHERE id = ?", (game_id,)).fetchone()
+
+    def close(self):
+        self.db.close()
+
+class GameRecords:
+    """棋譜ログと局面データベースをまとめて扱う"""
+    def __init__(self, directory=RECORDS_DIR):
+        self.log = RecordLog(directory)
+        self.positions = PositionDatabase(os.path.join(directory, "positions.sqlite")) if sqlite3 else None
+
+    def add(self, moves, black, white):
+        segment, offset = self.log.append(moves, black, white)
+        if self.positions:
+            self.positions.add_game(segment, offset, moves, black, white)
+        return segment, offset
+
+    def read_game(self, game_id):
+        return self.log.read(*self.positions.locate(game_id))
+
+    def reindex(self):
+        """ログから局面データベースを作り直す (追加済みの対局は飛ばす)"""
+        added = 0
+        for segment, offset, moves, black, white in self.log.scan():
+            added += self.positions.add_game(segment, offset, moves, black, white) is not None
+        return added
+
+def self_play(records, games, seed):
+    """コンピューター同士の対局をまとめて記録する"""
+    rng = random.Random(seed)
+    evaluator = reversi_engine.load_pattern_evaluator()
+    for _ in range(games):
+        game = reversi_engine.Game()
+        while not game.over:
+            if evaluator and rng.random() > 0.1:
+                r, c, _ = reversi_engine.choose_move_by_patterns(game.board, game.current_player, evaluator, rng)
+            else:
+                r, c, _ = rng.choice(reversi_engine.valid_moves(game.board, game.current_player))
+            game.play(r, c)
+        records.add(encode_game(game.moves), *reversi_engine.count_stones(game.board))
+
+def print_book(records, opening):
+    """初期局面から opening の手順をたどった局面での手ごとの成績を表示する"""
+    board, player = reversi_engine.new_board(), BLACK
+    for byte in opening:
+        reversi_engine.apply_move(board, player, *decode_move(byte))
+        player = -player
+    print(f"{len(records.positions.games_reaching(board, player))} games reached this position")
+    stats = records.positions.move_stats(board, player)
+    for (r, c), (games, wins, draws) in sorted(stats.items(), key=lambda item: -item[1][0]):
+        move = "pass" if r is None else f"{'abcdefgh'[c]}{r + 1}"
+        print(f"  {move:>4}: {games:6d} games, win rate {wins / games * 100:5.1f}% ({draws} draws)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reversi game records and position database")
+    parser.add_argument("command", choices=["selfplay", "reindex", "book"])
+    parser.add_argument("--games", type=int, default=1000, help="games for selfplay")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--opening", default="", help="moves for book, e.g. f5d6")
+    parser.add_argument("--dir", default=RECORDS_DIR)
+    args = parser.parse_args()
+    records = GameRecords(args.dir)
+    if args.command == "selfplay":
+        self_play(records, args.games, args.seed)
+    elif args.command == "reindex":
+        print(f"indexed {records.reindex()} games")
+    else:
+        opening = [(int(args.opening[i + 1]) - 1) * 8 + "abcdefgh".index(args.opening[i])
+                   for i in range(0, len(args.opening), 2)]
+        print_book(records, opening)
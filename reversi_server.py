@@ -0,0 +1,198 @@
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import reversi_engine
+from reversi_engine import BLACK, WHITE
+
+# 1プロセスで多数のリバーシ対局を同時にホストする asyncio サーバー
+# プロトコルは改行区切りの JSON。盤面全体ではなく差分 (置いた石と裏返った石) だけを送る
+#   -> {"op": "new", "mode": "ai" | "pvp", "color": 1 | -1}
+#   <- {"op": "joined", "game": id, "color": c, "next": p}
+#   -> {"op": "move", "game": id, "r": r, "c": c}
+#   <- {"op": "diff", "game": id, "seq": n, "player": p, "move": [r, c], "flips": [[r, c], ...], "next": p, "passed": bool}
+#   <- {"op": "over", "game": id, "winner": w, "black": b, "white": w}
+#   <- {"op": "error", "game": id, "reason": "..."}
+# コンピューター側の手はプロセスプールで計算するので、重い思考が他の対局のイベントループを止めない
+
+_evaluator = False # ワーカーごとに最初の思考で読み込む
+
+def ai_move(board, player, seed):
+    """プロセスプール上で実行されるコンピューターの思考"""
+    global _evaluator
+    if _evaluator is False:
+        _evaluator = reversi_engine.load_pattern_evaluator()
+    if _evaluator:
+        move = reversi_engine.choose_move_by_patterns(board, player, _evaluator, random.Random(seed))
+    else:
+        move = reversi_engine.choose_move(board, player, random.Random(seed))
+    return None if move is None else (move[0], move[1])
+
+def is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+class Connection:
+    def __init__(self, writer):
+        self.writer = writer
+
+    def send(self, message):
+        if not self.writer.is_closing():
+            self.writer.write(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+
+class Table:
+    """1局分の対局。seats[color] は Connection か None (コンピューター)"""
+    def __init__(self, table_id, seats):
+        self.id = table_id
+        self.game = reversi_engine.Game()
+        self.seats = seats
+        self.seq = 0
+
+    def broadcast(self, message):
+        for conn in {conn for conn in self.seats.values() if conn}:
+            conn.send(message)
+
+class ReversiServer:
+    def __init__(self, ai_workers=2, seed=None):
+        self.tables = {}
+        self.ids = itertools.count(1)
+        self.waiting = None # pvp の相手待ち (conn, color)
+        # fork だと受け付け済みのソケットがワーカーに引き継がれて閉じなくなるので spawn を使う
+        self.pool = ProcessPoolExecutor(ai_workers, multiprocessing.get_context("spawn")) if ai_workers else None
+        self.rng = random.Random(seed)
+        self.moves_played = 0
+        self.games_finished = 0
+
+    async def start(self, host="127.0.0.1", port=8765):
+        return await asyncio.start_server(self.handle, host, port)
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown(cancel_futures=True)
+
+    async def handle(self, reader, writer):
+        conn = Connection(writer)
+        try:
+            while line := await reader.readline():
+                try:
+                    message = json.loads(line)
+                    op = message["op"]
+                except (ValueError, KeyError, TypeError):
+                    conn.send({"op": "error", "reason": "malformed message"})
+                    continue
+                if op == "new":
+                    self.new_game(conn, message.get("mode", "ai"), message.get("color", BLACK))
+                elif op == "move":
+                    self.human_move(conn, message)
+                else:
+                    conn.send({"op": "error", "reason": f"unknown op {op!r}"})
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.drop_connection(conn)
+            writer.close()
+
+    def drop_connection(self, conn):
+        if self.waiting and self.waiting[0] is conn:
+            self.waiting = None
+        for table_id in [t.id for t in self.tables.values() if conn in t.seats.values()]:
+            del self.tables[table_id]
+
+    def new_game(self, conn, mode, color):
+        color = BLACK if color != WHITE else WHITE
+        if mode == "pvp":
+            if self.waiting is None or self.waiting[0] is conn:
+                self.waiting = (conn, color)
+                return
+            other, other_color = self.waiting
+            self.waiting = None
+            color = -other_color
+            table = self.open_table({other_color: other, color: conn})
+        else:
+            table = self.open_table({color: conn, -color: None})
+        for seat_color, seat in table.seats.items():
+            if seat:
+                seat.send({"op": "joined", "game": table.id, "color": seat_color, "next": table.game.current_player})
+        self.schedule_ai(table)
+
+    def open_table(self, seats):
+        table = Table(next(self.ids), seats)
+        self.tables[table.id] = table
+        return table
+
+    def human_move(self, conn, message):
+        game_id, r, c = message.get("game"), message.get("r"), message.get("c")
+        if not all(is_int(value) for value in (game_id, r, c)):
+            # null やリスト・オブジェクトをそのまま辞書のキーや int() に渡すと TypeError で接続ごと落ちる
+            conn.send({"op": "error", "game": game_id if is_int(game_id) else None,
+                       "reason": "game, r and c must be integers"})
+            return
+        table = self.tables.get(game_id)
+        if table is None:
+            conn.send({"op": "error", "game": game_id, "reason": "no such game"})
+            return
+        if table.seats.get(table.game.current_player) is not conn:
+            conn.send({"op": "error", "game": table.id, "reason": "not your turn"})
+            return
+        try:
+            if not (0 <= r < 8 and 0 <= c < 8):
+                raise reversi_engine.IllegalMove("off the board")
+            self.play(table, r, c)
+        except (KeyError, ValueError, TypeError) as e:
+            conn.send({"op": "error", "game": table.id, "reason": str(e)})
+
+    def play(self, table, r, c):
+        game = table.game
+        player = game.current_player
+        flips = game.play(r, c)
+        self.moves_played += 1
+        table.seq += 1
+        table.broadcast({"op": "diff", "game": table.id, "seq": table.seq, "player": player, "move": [r, c],
+                         "flips": flips, "next": game.current_player, "passed": game.current_player == player})
+        if game.over:
+            black, white = reversi_engine.count_stones(game.board)
+            table.broadcast({"op": "over", "game": table.id, "winner": game.winner, "black": black, "white": white})
+            del self.tables[table.id]
+            self.games_finished += 1
+        else:
+            self.schedule_ai(table)
+
+    def schedule_ai(self, table):
+        if table.seats[table.game.current_player] is None:
+            asyncio.get_running_loop().create_task(self.ai_turn(table))
+
+    async def ai_turn(self, table):
+        game = table.game
+        board = [row[:] for row in game.board]
+        seed = self.rng.getrandbits(32)
+        if self.pool:
+            move = await asyncio.get_running_loop().run_in_executor(self.pool, ai_move, board, game.current_player, seed)
+        else:
+            move = ai_move(board, game.current_player, seed)
+        if self.tables.get(table.id) is table and move:
+            self.play(table, *move)
+
+async def serve(host, port, ai_workers):
+    server = ReversiServer(ai_workers)
+    listener = await server.start(host, port)
+    print(f"reversi server listening on {host}:{port} (ai workers: {ai_workers})", flush=True)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multiplayer Reversi server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ai-workers", type=int, default=2, help="0 runs the AI inline on the event loop")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.ai_workers))
+    except KeyboardInterrupt:
+        pass
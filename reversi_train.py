@@ -0,0 +1,198 @@
+import argparse
+import random
+import time
+import zlib
+
+import numpy as np
+
+import reversi_engine
+from reversi_engine import BLACK, PATTERNS, PHASE_BOUNDS, WEIGHT_SCALE, WEIGHTS_MAGIC
+
+# リバーシのパターン評価関数の学習 (開発用。ゲーム本体は numpy が無くても動く)
+# 1. 自己対戦で局面を集め、終局時の石差 (黒 - 白) をラベルにする (2巡目からは学習した評価関数で打つ)
+# 2. 各パターンの出現を特徴量とした疎な線形回帰をリッジ付きの最小二乗法 (共役勾配法) で解く
+#    終局の石差は序盤の局面にとってはノイズが大きいので、終盤から順に学習し、
+#    前の段階の局面には同じ対局で次の段階に入った局面の予測値をラベルとして使う
+# 3. int16 の重み表を reversi_weights.bin に書き出す
+#   python reversi_train.py --games 40000 --out reversi_weights.bin
+#   python reversi_train.py --match 200   # 学習済みの評価と従来の重み表を対戦させる
+
+N_PHASES = len(PHASE_BOUNDS) + 1
+
+def self_play(rng, opening, epsilon, evaluator):
+    """1局打って盤面のリストと終局時の石差 (黒 - 白) を返す
+    最初の数手はランダムに打って局面をばらけさせ、その後は evaluator (無ければ従来の重み表) で打つ"""
+    game = reversi_engine.Game()
+    random_plies = rng.randint(0, opening)
+    positions = []
+    while not game.over:
+        board, player = game.board, game.current_player
+        if len(game.moves) < random_plies or rng.random() < epsilon:
+            r, c, _ = rng.choice(reversi_engine.valid_moves(board, player))
+        elif evaluator:
+            r, c, _ = reversi_engine.choose_move_by_patterns(board, player, evaluator, rng)
+        else:
+            r, c, _ = reversi_engine.choose_move(board, player, rng)
+        game.play(r, c)
+        positions.append([v for row in game.board for v in row])
+    black, white = reversi_engine.count_stones(game.board)
+    return positions, black - white
+
+def generate(games, rng, opening, epsilon, evaluator):
+    """自己対戦の局面 (int8 の 64 マス)・終局時の石差・対局番号を返す"""
+    boards, labels, game_ids = [], [], []
+    start = time.perf_counter()
+    for i in range(games):
+        positions, result = self_play(rng, opening, epsilon, evaluator)
+        boards.extend(positions)
+        labels.extend([result] * len(positions))
+        game_ids.extend([i] * len(positions))
+        if (i + 1) % 5000 == 0:
+            print(f"  {i + 1}/{games} games ({time.perf_counter() - start:.0f}s)", flush=True)
+    return np.array(boards, dtype=np.int8), np.array(labels, dtype=np.float64), np.array(game_ids)
+
+def feature_layout():
+    """パターンごとの (マス番号の配列, 3進数の桁の重み, 重み表の大きさ)"""
+    layout = []
+    for _, instances in PATTERNS:
+        cells = np.array([[r * 8 + c for r, c in instance] for instance in instances])
+        powers = 3 ** np.arange(cells.shape[1] - 1, -1, -1)
+        layout.append((cells, powers, 3 ** cells.shape[1]))
+    return layout
+
+def features(boards):
+    """各局面で1になる特徴量の列番号 (局面数 x パターンのインスタンス数)・局面の段階・1段階分の重みの数"""
+    codes = np.where(boards < 0, 2, boards).astype(np.int64)
+    discs = np.count_nonzero(boards, axis=1)
+    phase = np.searchsorted(np.array(PHASE_BOUNDS), discs, side="right")
+    layout = feature_layout()
+    phase_size = sum(size for _, _, size in layout)
+    columns, offset = [], 0
+    for cells, powers, size in layout:
+        # (局面数, インスタンス数, マス数) -> 3進数のインデックス
+        index = codes[:, cells] @ powers
+        columns.append(index + offset + (phase * phase_size)[:, None])
+        offset += size
+    return np.concatenate(columns, axis=1).astype(np.int32), phase, phase_size
+
+def fit(columns, labels, n_weights, ridge, iterations):
+    """(AᵀA + λI) w = Aᵀy を共役勾配法で解く。A は各行に数個だけ1が立つ疎行列"""
+    k = columns.shape[1]
+    flat = columns.ravel()
+    def a_dot(w):
+        return w[columns].sum(axis=1)
+    def at_dot(r):
+        return np.bincount(flat, weights=np.repeat(r, k), minlength=n_weights)
+    def normal(w):
+        return at_dot(a_dot(w)) + ridge * w
+
+    w = np.zeros(n_weights)
+    residual = at_dot(labels)
+    direction = residual.copy()
+    rs = residual @ residual
+    for i in range(iterations):
+        ad = normal(direction)
+        alpha = rs / (direction @ ad)
+        w += alpha * direction
+        residual -= alpha * ad
+        rs_new = residual @ residual
+        if rs_new < 1e-10:
+            break
+        direction = residual + (rs_new / rs) * direction
+        rs = rs_new
+    return w, i + 1
+
+def fit_phases(columns, phase, phase_size, labels, game_ids, ridge, iterations):
+    """終盤から序盤へ段階ごとに学習する"""
+    weights = np.zeros(phase_size * N_PHASES)
+    targets = labels.copy()
+    for p in reversed(range(N_PHASES)):
+        in_phase = phase == p
+        fitted, used = fit(columns[in_phase], targets[in_phase], len(weights), ridge, iterations)
+        weights[p * phase_size:(p + 1) * phase_size] = fitted[p * phase_size:(p + 1) * phase_size]
+        predicted = weights[columns[in_phase]].sum(axis=1)
+        rmse = np.sqrt(np.mean((predicted - targets[in_phase]) ** 2))
+        print(f"  phase {p}: {np.count_nonzero(in_phase)} positions, {used} iterations, rmse={rmse:.2f} discs")
+        if p == 0:
+            break
+        # 各対局でこの段階に入った最初の局面の予測値を、1つ前の段階の局面のラベルにする
+        ids = game_ids[in_phase]
+        first = np.full(game_ids.max() + 1, -1)
+        first[ids[::-1]] = np.arange(len(ids))[::-1]
+        previous = np.nonzero(phase == p - 1)[0]
+        entry = first[game_ids[previous]]
+        reached = entry >= 0
+        targets[previous[reached]] = predicted[entry[reached]]
+    return weights
+
+def export(weights, path):
+    quantized = np.clip(np.round(weights * WEIGHT_SCALE), -32768, 32767).astype("<i2")
+    data = zlib.compress(quantized.tobytes(), 9)
+    with open(path, "wb") as f:
+        f.write(WEIGHTS_MAGIC + bytes([N_PHASES]))
+        f.write(data)
+    return len(data)
+
+def train(args):
+    # 2巡目以降は直前に学習した評価関数どうしで自己対戦し、より強い打ち手の結果で学習し直す
+    rng = random.Random(args.seed)
+    evaluator = None
+    for round_no in range(1, args.rounds + 1):
+        print(f"round {round_no}: {args.games} self-play games with {'patterns' if evaluator else 'weight table'}")
+        boards, labels, game_ids = generate(args.games, rng, args.opening, args.epsilon, evaluator)
+        columns, phase, phase_size = features(boards)
+        start = time.perf_counter()
+        weights = fit_phases(columns, phase, phase_size, labels, game_ids, args.ridge, args.iterations)
+        print(f"  fit: {len(labels)} positions, {len(weights)} weights ({time.perf_counter() - start:.1f}s)")
+        size = export(weights, args.out)
+        print(f"  wrote {args.out} ({size // 1024} KiB)")
+        evaluator = reversi_engine.load_pattern_evaluator(args.out)
+
+def match(games, seed, path):
+    """パターン評価 (黒白を交互に持つ) と従来の重み表の対戦成績を表示する"""
+    evaluator = reversi_engine.load_pattern_evaluator(path)
+    if evaluator is None:
+        raise SystemExit(f"{path} not found; train first")
+    rng = random.Random(seed)
+    wins = losses = draws = 0
+    elapsed, calls = [0.0, 0.0], [0, 0]
+    for i in range(games):
+        learned = BLACK if i % 2 == 0 else -BLACK
+        game = reversi_engine.Game()
+        for _ in range(4): # 序盤をランダムにして同じ棋譜の繰り返しを避ける
+            if game.over: break
+            r, c, _ = rng.choice(reversi_engine.valid_moves(game.board, game.current_player))
+            game.play(r, c)
+        while not game.over:
+            start = time.perf_counter()
+            if game.current_player == learned:
+                r, c, _ = reversi_engine.choose_move_by_patterns(game.board, game.current_player, evaluator, rng)
+                side = 0
+            else:
+                r, c, _ = reversi_engine.choose_move(game.board, game.current_player, rng)
+                side = 1
+            elapsed[side] += time.perf_counter() - start
+            calls[side] += 1
+            game.play(r, c)
+        wins += game.winner == learned
+        losses += game.winner == -learned
+        draws += game.winner == 0
+    print(f"learned vs weights: {wins}W {losses}L {draws}D ({wins / games * 100:.0f}% wins)")
+    print(f"ms per move: learned={elapsed[0] / calls[0] * 1000:.3f} weights={elapsed[1] / calls[1] * 1000:.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the Reversi pattern evaluation")
+    parser.add_argument("--games", type=int, default=40000, help="self-play games per round")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--rounds", type=int, default=1)
+    parser.add_argument("--opening", type=int, default=12, help="up to this many random moves at the start of a game")
+    parser.add_argument("--epsilon", type=float, default=0.02, help="probability of a random move after the opening")
+    parser.add_argument("--ridge", type=float, default=10.0)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--out", default=reversi_engine.WEIGHTS_FILE)
+    parser.add_argument("--match", type=int, default=0, help="play N games against the weight table instead of training")
+    args = parser.parse_args()
+    if args.match:
+        match(args.match, args.seed, args.out)
+    else:
+        train(args)
@@ -0,0 +1,211 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import zlib
+
+# ゲームごとの成績 (勝数・チップなど) をクラッシュやブラウザのリロードをまたいで残す保存先
+# 変更はイベントとして追記専用のログに1行ずつ書く: "<crc32 の16進8桁> <JSON>\n"
+# 読み込み時は CRC が合わない行 (書き込み途中で落ちた行) から先を捨て、ログをその手前まで修復する
+# イベントが COMPACT_EVENTS 件たまったら、全体の値をスナップショットに書き出してログを空にする
+# 書き込みはフレームの処理の中では行わず、デスクトップでは書き込み用のスレッド、
+# ブラウザ (WASM) 版ではフレームの後の setTimeout でまとめて localStorage に書く
+SAVES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "saves")
+COMPACT_EVENTS = 200
+FLUSH_INTERVAL = 1.0 # 秒。この間に記録されたイベントを1回の書き込みにまとめる
+
+def encode_line(payload):
+    data = json.dumps(payload, separators=(",", ":"), sort_keys=True)
+    return f"{zlib.crc32(data.encode()):08x} {data}\n"
+
+def decode_lines(text):
+    """正しく書けている行の内容と、その範囲の文字数を返す"""
+    payloads, valid = [], 0
+    for line in text.splitlines(keepends=True):
+        if not line.endswith("\n") or len(line) < 10 or line[8] != " ":
+            break
+        data = line[9:-1]
+        try:
+            if int(line[:8], 16) != zlib.crc32(data.encode()):
+                break
+            payloads.append(json.loads(data))
+        except ValueError:
+            break
+        valid += len(line)
+    return payloads, valid
+
+class FileBackend:
+    """saves/ 以下のファイルに保存する"""
+    def __init__(self, directory=SAVES_DIR):
+        self.directory = directory
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def read(self, key):
+        try:
+            with open(self.path(key), encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return ""
+
+    def append(self, key, text):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path(key), "a", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def replace(self, key, text):
+        """一時ファイルに書いてから置き換える (途中で落ちても古い内容か新しい内容のどちらかが残る)"""
+        os.makedirs(self.directory, exist_ok=True)
+        temp = self.path(key) + ".tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self.path(key))
+
+class LocalStorageBackend:
+    """ブラウザ版 (Pyodide) の localStorage に保存する。setItem は1回ごとに丸ごと置き換わる"""
+    def __init__(self, prefix="cats-dogs-games/"):
+        import js
+        self.storage = js.localStorage
+        self.prefix = prefix
+
+    def read(self, key):
+        return self.storage.getItem(self.prefix + key) or ""
+
+    def append(self, key, text):
+        self.storage.setItem(self.prefix + key, self.read(key) + text)
+
+    def replace(self, key, text):
+        self.storage.setItem(self.prefix + key, text)
+
+class MemoryBackend:
+    """プロセスの中だけに保存する (入力の再生やベンチマークで本物の保存先を書き換えないため)"""
+    def __init__(self):
+        self.data = {}
+
+    def read(self, key):
+        return self.data.get(key, "")
+
+    def append(self, key, text):
+        self.data[key] = self.read(key) + text
+
+    def replace(self, key, text):
+        self.data[key] = text
+
+def default_backend():
+    return LocalStorageBackend() if sys.platform == "emscripten" else FileBackend()
+
+class StatsStore:
+    """1つのゲームの成績。record(name=value) で値を更新し、get で読む"""
+    def __init__(self, name, backend=None, compact_every=COMPACT_EVENTS, flush_interval=FLUSH_INTERVAL):
+        self.backend = backend or default_backend()
+        self.log_key, self.snapshot_key = f"{name}.log", f"{name}.snapshot"
+        self.compact_every = compact_every
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.pending = []     # まだ書いていないイベントの (行, 値)
+        self.log_events = 0   # スナップショット以降にログに書いたイベント数
+        self.values = self._load()
+        self.flushed = dict(self.values) # ログまで書けたイベントだけを反映した値 (スナップショットにはこちらを書く)
+        self.wake = threading.Event()
+        self.stop = threading.Event()
+        self.closed = False
+        self.flush_scheduled = False
+        self.thread = None
+        if sys.platform != "emscripten":
+            self.thread = threading.Thread(target=self._writer, name=f"stats-{name}", daemon=True)
+            self.thread.start()
+        atexit.register(self.close)
+
+    def _load(self):
+        values = {}
+        snapshots, _ = decode_lines(self.backend.read(self.snapshot_key))
+        if snapshots:
+            values.update(snapshots[-1])
+        text = self.backend.read(self.log_key)
+        events, valid = decode_lines(text)
+        if valid < len(text):
+            self.backend.replace(self.log_key, text[:valid]) # 壊れた末尾を切り捨てる
+        for event in events:
+            values.update(event)
+        self.log_events = len(events)
+        return values
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def record(self, **values):
+        """値を更新する。書き込みは後でまとめて行うので、フレームの処理の中で呼んでも重くない"""
+        self.values.update(values)
+        with self.lock:
+            self.pending.append((encode_line(values), values))
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self.thread:
+            self.wake.set()
+        elif not self.flush_scheduled:
+            self.flush_scheduled = True
+            try:
+                import js
+                from pyodide.ffi import create_once_callable
+                js.setTimeout(create_once_callable(self.flush), int(self.flush_interval * 1000))
+            except ImportError:
+                self.flush()
+
+    def _writer(self):
+        while not self.closed:
+            self.wake.wait()
+            self.wake.clear()
+            self.stop.wait(self.flush_interval) # 続けて来るイベントを1回の書き込みにまとめる
+            self.flush()
+
+    def flush(self):
+        """たまっているイベントをログに追記し、必要ならスナップショットにまとめる"""
+        with self.lock:
+            events, self.pending = self.pending, []
+            self.flush_scheduled = False
+            if not events:
+                return
+            try:
+                self.backend.append(self.log_key, "".join(line for line, _ in events))
+            except OSError:
+                self.pending = events + self.pending # 書けなかった分は次の機会に再挑戦する
+                return
+            self.log_events += len(events)
+            for _, values in events:
+                self.flushed.update(values)
+            if self.log_events >= self.compact_every:
+                try:
+                    self.compact()
+                except OSError:
+                    pass # ログには書けているので、次の flush でまとめ直す
+
+    def compact(self):
+        """ログまで書けた値をスナップショットに書き、ログを空にする
+        record 済みでまだ書いていないイベントは含めないので、スナップショットはログの全イベントを反映した値と等しい
+        スナップショットを書いた直後に落ちてもログのイベントは同じ値を上書きするだけなので、値は変わらない"""
+        self.backend.replace(self.snapshot_key, encode_line(dict(self.flushed)))
+        self.backend.replace(self.log_key, "")
+        self.log_events = 0
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.stop.set()
+        self.wake.set()
+        if self.thread:
+            self.thread.join(timeout=self.flush_interval + 1)
+        self.flush()
+
+def in_memory(name, values):
+    """values から始まり、メモリ上にだけ保存する StatsStore"""
+    backend = MemoryBackend()
+    backend.replace(f"{name}.snapshot", encode_line(values))
+    return StatsStore(name, backend)
@@ -0,0 +1,160 @@
+import argparse
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# 盤面のサムネイル (PNG) をまとめて描く (ギャラリーや見た目の回帰テスト用)
+# リバーシはゲームと同じ猫と犬の石 (reversi.draw_board)、15パズルはゲームと同じタイルの画像バンク
+# (fifteen_puzzle.draw_tiles) で描く。ウィンドウは開かず、ワーカープロセスごとに SDL の offscreen ドライバで
+# pyxel を初期化して画面に描き、そのまま PNG に書き出す
+#   python thumbnails.py reversi --every 10                  # records/ の棋譜の10手ごとと終局の局面
+#   python thumbnails.py reversi --moves f5d6c3 f5f6e6f4     # 手順どおりに打った後の局面
+#   python thumbnails.py fifteen --file boards.txt --bank 1  # 1行に1盤面 (16個の数字、0 は空きマス)
+#   python thumbnails.py fifteen --random 1000 --workers 4
+THUMBNAILS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thumbnails")
+PADDING = 2 # 盤の周りの余白 (ピクセル)
+CHUNK_SIZE = 32 # ワーカーに1回で渡す局面数
+
+# 種類 -> 背景色 (ゲームの画面と同じ)。盤の大きさが違ってもリバーシのサムネイルは同じ大きさにする
+BACKGROUNDS = {"reversi": 3, "fifteen": 1}
+
+def screen_size(kind):
+    if kind == "reversi":
+        import reversi
+        return reversi.BOARD_PIXELS + 1 + PADDING * 2
+    import fifteen_puzzle
+    return fifteen_puzzle.BOARD_SIZE * fifteen_puzzle.TILE_SIZE + PADDING * 2
+
+def _init_worker(kind):
+    """ワーカープロセスで1回だけ呼ぶ。画面を持たない pyxel を初期化し、15パズルなら画像バンクを読み込む"""
+    os.environ.setdefault("SDL_VIDEODRIVER", "offscreen")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    import pyxel
+    size = screen_size(kind)
+    pyxel.init(size, size, title="thumbnails")
+    if kind == "fifteen":
+        pyxel.load(os.path.join(os.path.dirname(os.path.abspath(__file__)), "fifteen_puzzle.pyxres"))
+
+def _render(kind, path, position, scale):
+    """1局面を画面に描いて path (.png は pyxel が付ける) に書き出す"""
+    import pyxel
+    pyxel.cls(BACKGROUNDS[kind])
+    if kind == "reversi":
+        import reversi
+        reversi.draw_board(position, PADDING, reversi.BOARD_PIXELS // len(position))
+    else:
+        import fifteen_puzzle
+        tiles, bank = position
+        size = fifteen_puzzle.BOARD_SIZE
+        fifteen_puzzle.draw_tiles([tiles[i:i + size] for i in range(0, size * size, size)], bank, PADDING, PADDING)
+    pyxel.screen.save(path, scale)
+
+def _render_chunk(kind, jobs, scale):
+    for path, position in jobs:
+        _render(kind, path, position, scale)
+    return len(jobs)
+
+def render(kind, jobs, out_dir=THUMBNAILS_DIR, scale=1, workers=None):
+    """jobs の (名前, 局面) をそれぞれ out_dir/<名前>.png に描き、書いた枚数を返す
+    局面はリバーシなら盤 (行のリスト、1: 黒, -1: 白)、15パズルなら (16マスのタプル, 画像バンク)
+    workers が 1 ならこのプロセスで描く (その場合このプロセスの pyxel を初期化する)"""
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = [(os.path.join(out_dir, name), position) for name, position in jobs]
+    chunks = [jobs[i:i + CHUNK_SIZE] for i in range(0, len(jobs), CHUNK_SIZE)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        _init_worker(kind)
+        return sum(_render_chunk(kind, chunk, scale) for chunk in chunks)
+    # reversi_server と同じく spawn で作る (pyxel の状態をフォークで引き継がない)
+    with ProcessPoolExecutor(workers, multiprocessing.get_context("spawn"), initializer=_init_worker,
+                             initargs=(kind,)) as pool:
+        return sum(pool.map(_render_chunk, [kind] * len(chunks), chunks, [scale] * len(chunks)))
+
+def parse_moves(text):
+    """"f5d6" のような手順を棋譜のバイト列にする (reversi_records.py の --opening と同じ書き方、pass も書ける)"""
+    import reversi_records
+    moves, i = bytearray(), 0
+    while i < len(text):
+        if text.startswith("pass", i):
+            moves.append(reversi_records.PASS)
+            i += 4
+        else:
+            moves.append(reversi_records.encode_move(int(text[i + 1]) - 1, "abcdefgh".index(text[i])))
+            i += 2
+    return bytes(moves)
+
+def game_positions(moves, every=0):
+    """棋譜をたどり、every 手ごと (0 なら最後だけ) の (手数, 盤) を返す。最後の局面は必ず含める"""
+    import reversi_engine
+    import reversi_records
+    board, player = reversi_engine.new_board(), reversi_engine.BLACK
+    positions = []
+    for ply, byte in enumerate(moves, 1):
+        if byte != reversi_records.PASS:
+            reversi_engine.apply_move(board, player, *reversi_records.decode_move(byte))
+        player = -player
+        if every and ply % every == 0 and ply < len(moves):
+            positions.append((ply, [row[:] for row in board]))
+    positions.append((len(moves), board))
+    return positions
+
+def reversi_jobs(args):
+    """--moves の手順、無ければ棋譜ログの対局から (名前, 盤) を作る"""
+    if args.moves:
+        games = [(f"moves{i:03d}", parse_moves(text)) for i, text in enumerate(args.moves)]
+    else:
+        import reversi_records
+        log = reversi_records.RecordLog(args.records)
+        games = [(f"game{i:05d}", moves) for i, (_, _, moves, _, _) in enumerate(log.scan())]
+    if args.limit:
+        games = games[:args.limit]
+    return [(f"{name}-ply{ply:03d}", board) for name, moves in games for ply, board in game_positions(moves, args.every)]
+
+def fifteen_jobs(args):
+    """--file の盤面 (1行に16個の数字、# 以降は無視)、無ければ --random 個の解ける盤面から (名前, (盤, 画像バンク)) を作る"""
+    import fifteen_solver
+    boards = []
+    if args.file:
+        with open(args.file) as f:
+            for line in f:
+                numbers = line.split("#")[0].replace(",", " ").split()
+                if numbers:
+                    board = tuple(int(n) for n in numbers)
+                    if sorted(board) != list(range(16)):
+                        raise SystemExit(f"{args.file}: not a 15-puzzle board: {line.strip()}")
+                    boards.append(board)
+    else:
+        rng = random.Random(args.seed)
+        boards = [fifteen_solver.random_board(rng) for _ in range(args.random)]
+    if args.limit:
+        boards = boards[:args.limit]
+    return [(f"board{i:05d}", (board, args.bank)) for i, board in enumerate(boards)]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render board thumbnails headlessly")
+    parser.add_argument("kind", choices=["reversi", "fifteen"])
+    parser.add_argument("--out", default=None, help="output directory (default thumbnails/<kind>)")
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: one per CPU)")
+    parser.add_argument("--limit", type=int, default=0, help="only the first games or boards")
+    parser.add_argument("--records", default=None, help="reversi: records directory (default records/)")
+    parser.add_argument("--every", type=int, default=0, help="reversi: also every N plies, not just the end")
+    parser.add_argument("--moves", nargs="*", default=None, help="reversi: move sequences such as f5d6c3")
+    parser.add_argument("--file", default=None, help="fifteen: boards, one per line")
+    parser.add_argument("--random", type=int, default=100, help="fifteen: random solvable boards without --file")
+    parser.add_argument("--bank", type=int, default=0, choices=(0, 1, 2), help="fifteen: tile image bank")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.kind == "reversi":
+        if args.records is None:
+            import reversi_records
+            args.records = reversi_records.RECORDS_DIR
+        jobs = reversi_jobs(args)
+    else:
+        jobs = fifteen_jobs(args)
+    start = time.perf_counter()
+    count = render(args.kind, jobs, args.out or os.path.join(THUMBNAILS_DIR, args.kind), args.scale, args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"{count} thumbnails in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f}/s)")